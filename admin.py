@@ -1,10 +1,12 @@
 from django.contrib import admin
+from django.db.models import Count, Avg, Q
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.contrib import messages
 
 from .models import Prompt, PromptVersion, Action, ContentGenerator
 from .forms import PromptVersionForm, ContentGeneratorForm
+from .routing import get_action_ab_statistics, VARIANT_STABLE, VARIANT_CANDIDATE
 
 
 # ========== ПОДСИСТЕМА PROMPTS ==========
@@ -32,16 +34,25 @@ class PromptAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        """
+        Добавляет количество версий аннотацией, чтобы не делать запрос на каждую строку.
+        """
+        return super().get_queryset(request).annotate(versions_count=Count('versions'))
+
     def get_versions_count(self, obj):
         """
         Отображает количество версий промпта.
         """
-        count = obj.get_versions_count()
+        count = getattr(obj, 'versions_count', None)
+        if count is None:
+            count = obj.get_versions_count()
         return format_html(
             '<strong>{}</strong>',
             count
         )
     get_versions_count.short_description = 'Версий'
+    get_versions_count.admin_order_field = 'versions_count'
 
 
 @admin.register(PromptVersion)
@@ -91,6 +102,20 @@ class PromptVersionAdmin(admin.ModelAdmin):
     class Media:
         js = ('content_generator/js/prompt_version_form.js',)
 
+    def get_queryset(self, request):
+        """
+        Добавляет статистику использования аннотациями: список строится одним запросом
+        вместо четырех запросов статистики на каждую строку.
+        """
+        return super().get_queryset(request).select_related('prompt').annotate(
+            generated_count=Count('generated_content'),
+            reviewed_count=Count(
+                'generated_content',
+                filter=Q(generated_content__reviewed_at__isnull=False)
+            ),
+            average_rating=Avg('generated_content__rating'),
+        )
+
     def get_form(self, request, obj=None, **kwargs):
         """
         Передает текущего пользователя в форму для автоматического заполнения engineer_name.
@@ -123,11 +148,9 @@ class PromptVersionAdmin(admin.ModelAdmin):
           * Если изменилась только description → обновляется текущая версия
         """
         if not change:
-            # Создание новой версии
-            if not obj.version_number:
-                obj.version_number = PromptVersion.get_next_version_number_for_prompt(obj.prompt)
+            # Создание новой версии с атомарно выделенным номером
             obj.engineer_name = form.cleaned_data.get('engineer_name', '')
-            super().save_model(request, obj, form, change)
+            obj.save_as_next_version()
             prompt_name = obj.prompt.name if obj.prompt else 'Unknown'
             messages.success(
                 request,
@@ -135,22 +158,32 @@ class PromptVersionAdmin(admin.ModelAdmin):
             )
         else:
             # Редактирование существующей версии
-            original_obj = PromptVersion.objects.get(pk=obj.pk)
-            original_prompt_content = original_obj.prompt_content
+            original_obj = PromptVersion.objects.defer('prompt_content').get(pk=obj.pk)
             new_prompt_content = form.cleaned_data.get('prompt_content', '')
             
-            # Проверяем, изменилось ли содержимое промпта
-            if original_prompt_content != new_prompt_content:
+            # Проверяем, изменилось ли содержимое промпта (по хэшу содержимого)
+            content_changed = not original_obj.has_same_content(new_prompt_content)
+            # Если последняя версия промпта уже содержит такой текст, новая не создается
+            latest_version = None
+            if content_changed:
+                latest_version = PromptVersion.get_latest_if_identical(obj.prompt, new_prompt_content)
+
+            if latest_version:
+                messages.info(
+                    request,
+                    f'Последняя версия промпта #{latest_version.version_number} уже содержит такой текст. '
+                    f'Новая версия не создана.'
+                )
+                request.session['_new_prompt_version_id'] = latest_version.pk
+            elif content_changed:
                 # Создаем новую версию
-                new_version_number = PromptVersion.get_next_version_number_for_prompt(obj.prompt)
-                new_version = PromptVersion(
+                new_version = PromptVersion.create_next_version(
                     prompt=obj.prompt,
-                    version_number=new_version_number,
                     description=form.cleaned_data.get('description', ''),
                     prompt_content=new_prompt_content,
                     engineer_name=form.cleaned_data.get('engineer_name', ''),
                 )
-                new_version.save()
+                new_version_number = new_version.version_number
                 # Не сохраняем оригинальный объект - он остается без изменений
                 from django.urls import reverse
                 new_version_url = reverse('admin:content_generator_promptversion_change', args=[new_version.pk])
@@ -194,10 +227,17 @@ class PromptVersionAdmin(admin.ModelAdmin):
         """
         Отображает статистику использования промпта в списке.
         """
-        generated_count = obj.get_generated_content_count()
-        reviewed_count = obj.get_reviewed_content_count()
-        review_percentage = obj.get_review_percentage()
-        avg_rating = obj.get_average_rating()
+        if hasattr(obj, 'generated_count'):
+            # Статистика из аннотаций get_queryset
+            generated_count = obj.generated_count
+            reviewed_count = obj.reviewed_count
+            review_percentage = round((reviewed_count / generated_count) * 100, 2) if generated_count else 0.0
+            avg_rating = obj.average_rating
+        else:
+            generated_count = obj.get_generated_content_count()
+            reviewed_count = obj.get_reviewed_content_count()
+            review_percentage = obj.get_review_percentage()
+            avg_rating = obj.get_average_rating()
 
         stats_parts = [
             f'Сгенерировано: {generated_count}',
@@ -212,6 +252,7 @@ class PromptVersionAdmin(admin.ModelAdmin):
             ' | '.join(stats_parts)
         )
     get_statistics_display.short_description = 'Статистика'
+    get_statistics_display.admin_order_field = 'generated_count'
 
 
 # ========== ПОДСИСТЕМА GENERATION ==========
@@ -229,6 +270,7 @@ class ActionAdmin(admin.ModelAdmin):
         'label',
         'icon',
         'get_prompts_display',
+        'get_ab_display',
     )
     list_filter = (
         'name',
@@ -239,6 +281,11 @@ class ActionAdmin(admin.ModelAdmin):
     )
     readonly_fields = (
         'name',
+        'get_ab_statistics_display',
+    )
+    raw_id_fields = (
+        'stable_version',
+        'candidate_version',
     )
     ordering = ('name',)
 
@@ -250,8 +297,58 @@ class ActionAdmin(admin.ModelAdmin):
             'fields': ('system_prompt', 'prompt'),
             'description': 'Настройте промпты для данного действия'
         }),
+        ('A/B-сравнение версий', {
+            'fields': ('stable_version', 'candidate_version', 'candidate_traffic_percent', 'get_ab_statistics_display'),
+            'description': 'Часть генераций направляется на версию-кандидат, остальные - на стабильную версию'
+        }),
     )
 
+    def get_queryset(self, request):
+        """
+        Загружает промпты действий вместе с действиями.
+        """
+        return super().get_queryset(request).select_related(
+            'system_prompt',
+            'prompt',
+            'stable_version',
+            'candidate_version',
+        )
+
+    def get_ab_display(self, obj):
+        """
+        Отображает настройку A/B-сравнения в списке объектов.
+        """
+        if obj.candidate_version and obj.candidate_traffic_percent:
+            return format_html(
+                '<div style="font-size: 11px; color: #666;">v{} → {}%</div>',
+                obj.candidate_version.version_number,
+                obj.candidate_traffic_percent
+            )
+        return '-'
+    get_ab_display.short_description = 'A/B'
+
+    def get_ab_statistics_display(self, obj):
+        """
+        Отображает статистику стабильной версии и версии-кандидата.
+        """
+        if not obj or not obj.pk:
+            return '-'
+        statistics = get_action_ab_statistics(obj)
+        rows = []
+        for variant, label in ((VARIANT_STABLE, 'Стабильная'), (VARIANT_CANDIDATE, 'Кандидат')):
+            stats = statistics[variant]
+            if stats is None:
+                continue
+            rows.append(format_html(
+                '<div>{}: сгенерировано {}, проверено {}%, средний рейтинг {}</div>',
+                label,
+                stats['generated_count'],
+                stats['review_percentage'],
+                stats['average_rating'] if stats['average_rating'] is not None else '-'
+            ))
+        return mark_safe(''.join(rows)) if rows else '-'
+    get_ab_statistics_display.short_description = 'Статистика версий'
+
     def get_prompts_display(self, obj):
         """
         Отображает информацию о промптах в списке объектов.
@@ -320,12 +417,26 @@ class ContentGeneratorAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        """
+        Загружает действия и их промпты через prefetch_related: список строится
+        за несколько запросов независимо от количества строк.
+        """
+        return super().get_queryset(request).select_related(
+            'content_type',
+            'agent',
+        ).prefetch_related(
+            'actions__prompt',
+            'actions__system_prompt',
+        )
+
     def get_actions_display(self, obj):
         """
         Отображает список действий в списке объектов.
         """
-        if obj.actions.exists():
-            actions_list = [f"{action.icon} {action.label}" for action in obj.actions.all()]
+        actions = obj.actions.all()
+        if actions:
+            actions_list = [f"{action.icon} {action.label}" for action in actions]
             return format_html(
                 '<div style="font-size: 11px;">{}</div>',
                 ' | '.join(actions_list)
@@ -5,13 +5,213 @@
 и обработки результатов генерации.
 """
 
-from typing import Optional, Dict, Any
+import json
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Dict, Any, Iterable, Iterator, List, Tuple
+
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from django.contrib.sites.models import Site
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
 from django.contrib.contenttypes.models import ContentType
 
 from ai_interface.models import AITask, AIAgent
-from content_generator.models import PromptVersion, GeneratedContent
+from content_generator.models import ContentGenerator, PromptVersion, GeneratedContent
+
+
+# Максимальное количество одновременных вызовов агентов при генерации нескольких действий
+MULTI_ACTION_MAX_WORKERS = getattr(settings, 'CONTENT_GENERATOR_MULTI_ACTION_MAX_WORKERS', 4)
+
+# Размер пачки при пакетном создании и отправке задач
+DEFAULT_TASK_BATCH_SIZE = getattr(settings, 'CONTENT_GENERATOR_TASK_BATCH_SIZE', 500)
+
+# Порядок данных в payload задачи:
+#   legacy - текст промпта и данные задачи без фиксированного порядка;
+#   prefix - системный промпт и текст версии промпта идут первыми как стабильный
+#            префикс, данные объекта добавляются в конце (для кэширования
+#            промптов у провайдера).
+PAYLOAD_LAYOUT_LEGACY = 'legacy'
+PAYLOAD_LAYOUT_PREFIX = 'prefix'
+PAYLOAD_LAYOUT = getattr(settings, 'CONTENT_GENERATOR_PAYLOAD_LAYOUT', PAYLOAD_LAYOUT_LEGACY)
+
+# Время, в течение которого считается, что агент хранит текст промпта по хэшу, секунды
+PROMPT_SHIPPED_CACHE_TTL = getattr(settings, 'CONTENT_GENERATOR_PROMPT_SHIPPED_CACHE_TTL', 24 * 60 * 60)
+
+# Действия с короткими результатами, для которых несколько объектов
+# передаются агенту одним запросом (пакетный режим)
+BATCH_ACTIONS = tuple(getattr(settings, 'CONTENT_GENERATOR_BATCH_ACTIONS', ('upgrade_name', 'set_seo_params')))
+
+# Количество объектов в одном пакетном запросе
+DEFAULT_OBJECTS_PER_BATCH = getattr(settings, 'CONTENT_GENERATOR_OBJECTS_PER_BATCH', 20)
+
+# Формат ответа агента в пакетном режиме
+BATCH_RESPONSE_FORMAT = {
+    'type': 'json',
+    'description': 'JSON-объект {"items": [...]}: для каждого элемента items запроса - '
+                   'объект с его id и полями результата действия',
+}
+
+# Время хранения группы задач в кэше, секунды
+TASK_GROUP_CACHE_TTL = getattr(settings, 'CONTENT_GENERATOR_TASK_GROUP_TTL', 24 * 60 * 60)
+
+# Итоговые статусы задач ai_interface
+TASK_FINAL_STATUSES = ('SUCCESS', 'FAILURE')
+
+def agent_supports_prompt_cache(agent: Optional[AIAgent]) -> bool:
+    """
+    Проверяет, хранит ли агент тексты промптов по хэшу (атрибут supports_prompt_cache).
+    
+    Такой агент получает полный текст промпта только для новых версий, а для
+    остальных - prompt_version_id и prompt_hash. Если текста с таким хэшем
+    у агента нет, он получает его через API версий промптов по prompt_version_id.
+    """
+    return agent is not None and bool(getattr(agent, 'supports_prompt_cache', False))
+
+
+def get_prompt_shipped_cache_key(agent: AIAgent, prompt_hash: str) -> str:
+    """Возвращает ключ кэша отметки об отправке текста промпта агенту."""
+    return f'content_generator_prompt_shipped_{agent.pk}_{prompt_hash}'
+
+
+def _should_ship_prompt(agent: Optional[AIAgent], prompt_hash: str) -> bool:
+    """
+    Определяет, нужно ли передавать агенту полный текст промпта.
+    Для агентов с кэшем промптов текст передается, если он не отправлялся
+    этому агенту в течение PROMPT_SHIPPED_CACHE_TTL.
+    """
+    if not agent_supports_prompt_cache(agent):
+        return True
+    # cache.add атомарен: текст передаст только первая задача с новым хэшем
+    return cache.add(get_prompt_shipped_cache_key(agent, prompt_hash), True, PROMPT_SHIPPED_CACHE_TTL)
+
+
+def build_prefix_payload(
+    prompt_version: PromptVersion,
+    prompt_hash: str,
+    action: str,
+    additional_prompt: Optional[str] = None,
+    agent: Optional[AIAgent] = None,
+    object_data: Optional[Dict[str, Any]] = None,
+    generator=None
+) -> Dict[str, Any]:
+    """
+    Формирует payload в режиме prefix.
+    
+    Порядок ключей: системный промпт действия (Action.system_prompt), текст
+    версии промпта, дополнительный промпт, данные объекта. Первые части
+    одинаковы для всех объектов действия и образуют стабильный префикс;
+    prefix_hash позволяет агенту использовать его как ключ кэша провайдера.
+    Данные объекта сериализуются с сортировкой ключей, чтобы одинаковые
+    данные давали одинаковый текст. Системный промпт берется из маршрута
+    действия генератора generator (ContentGenerator).
+    """
+    from content_generator.routing import get_action_route
+    
+    system_version = get_action_route(generator, action)['system_prompt']
+    system_hash = ''
+    if system_version is not None:
+        system_hash = system_version.content_hash or PromptVersion.compute_content_hash(system_version.prompt_content)
+    
+    payload = {
+        'layout': PAYLOAD_LAYOUT_PREFIX,
+        'prefix_hash': hashlib.sha256(f'{system_hash}:{prompt_hash}'.encode('utf-8')).hexdigest(),
+        'system_prompt_hash': system_hash,
+    }
+    if system_version is not None and _should_ship_prompt(agent, system_hash):
+        payload['system_prompt'] = system_version.prompt_content
+    
+    payload['prompt_version_id'] = prompt_version.id
+    payload['prompt_hash'] = prompt_hash
+    if _should_ship_prompt(agent, prompt_hash):
+        payload['prompt'] = prompt_version.prompt_content
+    
+    if additional_prompt:
+        payload['additional_prompt'] = additional_prompt
+    if object_data is not None:
+        payload['object_data'] = json.dumps(object_data, ensure_ascii=False, sort_keys=True, cls=DjangoJSONEncoder)
+    return payload
+
+
+def build_generation_task_data(
+    prompt_version: PromptVersion,
+    content_type: ContentType,
+    object_id: int,
+    action: str,
+    additional_data: Optional[Dict[str, Any]] = None,
+    agent: Optional[AIAgent] = None,
+    object_data: Optional[Dict[str, Any]] = None,
+    generator=None
+) -> Dict[str, Any]:
+    """
+    Формирует данные задачи генерации: эндпоинт, payload для AI-агента
+    и context_data для обработки результата.
+    
+    Текст промпта не дублируется в context_data: там хранятся только
+    prompt_version_id и хэш содержимого. В payload текст передается всегда,
+    кроме агентов с кэшем промптов, которым он уже отправлялся.
+    Порядок payload задается настройкой CONTENT_GENERATOR_PAYLOAD_LAYOUT.
+    
+    Args:
+        generator: ContentGenerator, действие которого выполняется (определяет
+            системный промпт в режиме prefix); остальные - как у create_generation_task
+    
+    Returns:
+        Словарь с ключами endpoint, payload и context_data
+    """
+    prompt_hash = prompt_version.content_hash or PromptVersion.compute_content_hash(prompt_version.prompt_content)
+    
+    # Формируем данные для задачи
+    # context_data - данные для обработки в процессорах
+    context_data = {
+        'prompt_version_id': prompt_version.id,
+        'class_name': content_type.model,
+        'model_id': object_id,
+        'action': action,
+        'prompt_content_hash': prompt_hash,
+    }
+    
+    # Добавляем дополнительные данные, если есть
+    if additional_data:
+        context_data.update(additional_data)
+    
+    # payload - данные для отправки AI-агенту
+    if PAYLOAD_LAYOUT == PAYLOAD_LAYOUT_PREFIX:
+        payload = build_prefix_payload(
+            prompt_version,
+            prompt_hash,
+            action,
+            additional_prompt=(additional_data or {}).get('additional_prompt'),
+            agent=agent,
+            object_data=object_data,
+            generator=generator,
+        )
+    else:
+        payload = {
+            'prompt_version_id': prompt_version.id,
+            'prompt_hash': prompt_hash,
+        }
+        if _should_ship_prompt(agent, prompt_hash):
+            payload['prompt'] = prompt_version.prompt_content
+        
+        # Если есть additional_prompt, добавляем его в payload
+        if additional_data and 'additional_prompt' in additional_data:
+            payload['additional_prompt'] = additional_data['additional_prompt']
+        
+        if object_data is not None:
+            payload['object_data'] = object_data
+    
+    # Определяем эндпоинт на основе действия
+    endpoint = f'content_generator_{action}'
+    
+    return {
+        'endpoint': endpoint,
+        'payload': payload,
+        'context_data': context_data,
+    }
 
 
 def create_generation_task(
@@ -21,7 +221,9 @@ def create_generation_task(
     action: str,
     additional_data: Optional[Dict[str, Any]] = None,
     agent: Optional[AIAgent] = None,
-    domain: Optional[str] = None
+    domain: Optional[str] = None,
+    object_data: Optional[Dict[str, Any]] = None,
+    generator=None
 ) -> AITask:
     """
     Создает задачу генерации контента через ai_interface с использованием PromptVersion.
@@ -33,7 +235,10 @@ def create_generation_task(
         action: Действие для выполнения (set_seo_params, set_description, etc.)
         additional_data: Дополнительные данные для генерации (например, additional_prompt)
         agent: AI-агент (обязателен)
-        domain: Домен для построения webhook URL (если None, берется из Site)
+        domain: Не используется: задачи ai_interface не передают webhook URL.
+            Оставлен для совместимости вызовов
+        object_data: Данные объекта для payload (см. utils.build_object_data)
+        generator: ContentGenerator, для которого выполняется действие
     
     Returns:
         AITask: Созданная задача
@@ -41,51 +246,587 @@ def create_generation_task(
     Raises:
         Exception: При ошибках создания задачи или вызова агента
     """
-    # Получаем домен, если не указан
-    if domain is None:
+    task_data = build_generation_task_data(
+        prompt_version, content_type, object_id, action, additional_data, agent, object_data, generator
+    )
+    
+    # Создаем и отправляем задачу
+    task = AITask.create_and_dispatch(agent=agent, **task_data)
+    
+    return task
+
+
+def create_generation_tasks_bulk(
+    generations: Iterable[Dict[str, Any]],
+    agent: Optional[AIAgent] = None,
+    batch_size: int = DEFAULT_TASK_BATCH_SIZE,
+    generator=None
+) -> List[AITask]:
+    """
+    Пакетно создает и отправляет задачи генерации.
+    
+    Данные всех задач формируются заранее, задачи сохраняются пачками через
+    bulk_create, затем отправляются агенту. На пачку приходится постоянное
+    число запросов к БД: вставка задач и одно обновление статусов задач,
+    отправка которых не удалась.
+    
+    Если ai_interface предоставляет AITask.dispatch_bulk(tasks), пачка
+    отправляется одним вызовом, иначе каждая задача - через task.dispatch().
+    
+    bulk_create не вызывает AITask.save() и не отправляет сигналы pre_save/post_save,
+    поэтому логика ai_interface, привязанная к ним, для этих задач не выполняется;
+    в таких случаях используйте create_generation_task.
+    
+    Args:
+        generations: Словари с аргументами create_generation_task: prompt_version,
+            content_type, object_id, action и, опционально, additional_data,
+            object_data, agent и generator
+        agent: AI-агент по умолчанию для задач без своего агента
+        batch_size: Размер пачки
+        generator: ContentGenerator по умолчанию для задач без своего генератора
+    
+    Returns:
+        Список созданных задач в порядке generations
+    
+    Raises:
+        NotImplementedError: если AITask не поддерживает ни dispatch_bulk, ни dispatch
+    """
+    batch_size = max(1, batch_size)
+    # Проверяем до сохранения, чтобы не оставить в БД задачи, которые нечем отправить
+    dispatch_batch = _get_task_batch_dispatcher()
+    tasks = []
+    for generation in generations:
+        task_agent = generation.get('agent', agent)
+        tasks.append(AITask(
+            agent=task_agent,
+            **build_generation_task_data(
+                generation['prompt_version'],
+                generation['content_type'],
+                generation['object_id'],
+                generation['action'],
+                generation.get('additional_data'),
+                task_agent,
+                generation.get('object_data'),
+                generation.get('generator', generator),
+            )
+        ))
+    
+    created = []
+    for start in range(0, len(tasks), batch_size):
+        batch = AITask.objects.bulk_create(tasks[start:start + batch_size])
+        dispatch_batch(batch)
+        created.extend(batch)
+    return created
+
+
+def get_batch_endpoint(action: str) -> str:
+    """Возвращает эндпоинт пакетного режима действия."""
+    return f'content_generator_{action}_batch'
+
+
+def create_batch_generation_task(
+    prompt_version: PromptVersion,
+    content_type: ContentType,
+    objects_data: Dict[int, Dict[str, Any]],
+    action: str,
+    additional_data: Optional[Dict[str, Any]] = None,
+    agent: Optional[AIAgent] = None,
+    generator=None
+) -> AITask:
+    """
+    Создает одну задачу генерации для нескольких объектов (пакетный режим).
+    
+    Объекты передаются агенту в payload['items'] как {'id', 'data'}; агент
+    возвращает JSON {"items": [{"id": ..., <поля результата>}]}, который
+    process_batch_generation_result разбивает на GeneratedContent по объектам.
+    
+    Args:
+        objects_data: Словарь {ID объекта: данные объекта для действия}
+        Остальные аргументы - как у create_generation_task
+    
+    Returns:
+        AITask: Созданная задача
+    """
+    task_data = build_generation_task_data(
+        prompt_version, content_type, None, action, additional_data, agent, generator=generator
+    )
+    task_data['endpoint'] = get_batch_endpoint(action)
+    
+    context_data = task_data['context_data']
+    context_data.pop('model_id')
+    context_data['batch'] = True
+    context_data['model_ids'] = list(objects_data)
+    if generator is not None:
+        # Нужен обычным задачам для объектов без результата (см. process_batch_generation_result)
+        context_data['generator_id'] = generator.pk
+    
+    payload = task_data['payload']
+    payload['items'] = [{'id': object_id, 'data': data} for object_id, data in objects_data.items()]
+    payload['response_format'] = BATCH_RESPONSE_FORMAT
+    
+    return AITask.create_and_dispatch(agent=agent, **task_data)
+
+
+def split_batch_result(result: Any, object_ids: List[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    """
+    Разбивает результат пакетной задачи по объектам.
+    
+    Принимает {"items": [...]}, список элементов или их JSON-строку. Элементы
+    без корректного id, с чужим id или без полей результата пропускаются.
+    
+    Returns:
+        Кортеж (словарь {ID объекта: данные результата}, список ID объектов без результата)
+    """
+    items = result.get('items') if isinstance(result, dict) else result
+    if isinstance(items, str):
         try:
-            site = Site.objects.get_current()
-            domain = site.domain
-        except Exception:
-            # Fallback на настройки, если Site не настроен
-            from django.conf import settings
-            domain = getattr(settings, 'SITE_DOMAIN', 'localhost')
+            items = json.loads(items)
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = []
     
-    # Формируем данные для задачи
-    # context_data - данные для обработки в процессорах
-    context_data = {
-        'prompt_version_id': prompt_version.id,
-        'class_name': content_type.model,
-        'model_id': object_id,
-        'action': action,
-        'prompt_content': prompt_version.prompt_content,
+    expected_ids = set(object_ids)
+    parsed = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            object_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        data = {key: value for key, value in item.items() if key != 'id'}
+        if object_id in expected_ids and object_id not in parsed and data:
+            parsed[object_id] = data
+    
+    failed = [object_id for object_id in object_ids if object_id not in parsed]
+    return parsed, failed
+
+
+def process_batch_generation_result(ai_task: AITask) -> Dict[str, List[int]]:
+    """
+    Обрабатывает результат пакетной задачи генерации.
+    
+    Успешно разобранные результаты сохраняются одним bulk_create - по записи
+    GeneratedContent на объект. Для объектов, результат которых не удалось
+    разобрать (или если задача завершилась с ошибкой), создаются обычные
+    задачи генерации по одному объекту. Повторная обработка той же задачи
+    не создает дубликатов записей и повторных задач.
+    
+    Returns:
+        Словарь: created - ID созданных GeneratedContent,
+        fallback - ID объектов, отправленных обычными задачами
+    """
+    outcome = {'created': [], 'fallback': []}
+    task_data = ai_task.context_data or {}
+    
+    if ai_task.status not in TASK_FINAL_STATUSES:
+        return outcome
+    
+    prompt_version = PromptVersion.objects.filter(id=task_data.get('prompt_version_id')).first()
+    if prompt_version is None:
+        print(f'Error: PromptVersion not found for batch AITask #{ai_task.id}')
+        return outcome
+    
+    try:
+        content_type = ContentType.objects.get(app_label='store', model=(task_data.get('class_name') or '').lower())
+    except ContentType.DoesNotExist:
+        print(f'Error: ContentType for {task_data.get("class_name")} not found')
+        return outcome
+    
+    action = task_data.get('action', '')
+    object_ids = [int(object_id) for object_id in task_data.get('model_ids', [])]
+    
+    if ai_task.status == 'SUCCESS':
+        parsed, failed = split_batch_result(ai_task.result, object_ids)
+    else:
+        parsed, failed = {}, object_ids
+    
+    existing_ids = set(
+        GeneratedContent.objects.filter(ai_task_id=ai_task.id).values_list('object_id', flat=True)
+    )
+    contents = GeneratedContent.objects.bulk_create([
+        GeneratedContent(
+            prompt_version=prompt_version,
+            ai_task_id=ai_task.id,
+            content_type=content_type,
+            object_id=object_id,
+            action=action,
+            generated_data=data,
+            status='SUCCESS',
+        )
+        for object_id, data in parsed.items()
+        if object_id not in existing_ids
+    ])
+    outcome['created'] = [content.id for content in contents]
+    
+    if contents:
+        from content_generator.utils import record_prompt_cache_usage
+        record_prompt_cache_usage(prompt_version.id, ai_task.result)
+    
+    # Объекты без результата отправляются обычными задачами (один раз на пакетную задачу)
+    if failed and cache.add(f'content_generator_batch_fallback_{ai_task.id}', True, TASK_GROUP_CACHE_TTL):
+        items_data = {
+            item.get('id'): item.get('data')
+            for item in (getattr(ai_task, 'payload', None) or {}).get('items', [])
+        }
+        additional_data = {
+            key: task_data[key] for key in ('ab_variant', 'additional_prompt') if key in task_data
+        }
+        # Генератор определяет системный промпт действия; для задач без generator_id
+        # берется генератор модели
+        generator_id = task_data.get('generator_id')
+        if generator_id is not None:
+            generator = ContentGenerator.objects.filter(pk=generator_id).first()
+        else:
+            generator = ContentGenerator.objects.filter(content_type=content_type).first()
+        create_generation_tasks_bulk(
+            [
+                {
+                    'prompt_version': prompt_version,
+                    'content_type': content_type,
+                    'object_id': object_id,
+                    'action': action,
+                    'additional_data': additional_data or None,
+                    'object_data': items_data.get(object_id),
+                }
+                for object_id in failed
+            ],
+            agent=getattr(ai_task, 'agent', None),
+            generator=generator,
+        )
+        outcome['fallback'] = failed
+    
+    return outcome
+
+
+def _get_task_batch_dispatcher() -> Callable[[List[AITask]], None]:
+    """
+    Возвращает функцию отправки пачки сохраненных задач агенту:
+    AITask.dispatch_bulk, если он есть, иначе поштучную отправку через task.dispatch().
+
+    Raises:
+        NotImplementedError: если AITask не поддерживает ни dispatch_bulk, ни dispatch
+    """
+    dispatch_bulk = getattr(AITask, 'dispatch_bulk', None)
+    if dispatch_bulk is not None:
+        return dispatch_bulk
+    if getattr(AITask, 'dispatch', None) is None:
+        raise NotImplementedError(
+            'Пакетное создание задач требует AITask.dispatch_bulk(tasks) или AITask.dispatch() '
+            'в ai_interface; используйте create_generation_task'
+        )
+    return _dispatch_tasks_one_by_one
+
+
+def _dispatch_tasks_one_by_one(tasks: List[AITask]) -> None:
+    """
+    Отправляет пачку сохраненных задач агенту по одной через task.dispatch().
+    Задачи, отправка которых не удалась, помечаются статусом FAILURE одним запросом.
+    """
+    failed = []
+    for task in tasks:
+        try:
+            task.dispatch()
+        except Exception as e:
+            task.status = 'FAILURE'
+            task.result = {'error': str(e)}
+            failed.append(task)
+    
+    if failed:
+        AITask.objects.bulk_update(failed, ['status', 'result'])
+
+
+async def acreate_generation_task(
+    prompt_version: PromptVersion,
+    content_type: ContentType,
+    object_id: int,
+    action: str,
+    additional_data: Optional[Dict[str, Any]] = None,
+    agent: Optional[AIAgent] = None,
+    object_data: Optional[Dict[str, Any]] = None,
+    generator=None
+) -> AITask:
+    """
+    Асинхронный вариант create_generation_task для ASGI-представлений.
+    
+    Если ai_interface предоставляет AITask.acreate_and_dispatch (отправка
+    через асинхронный HTTP-клиент), задача отправляется без блокировки потока.
+    Иначе create_generation_task выполняется в пуле потоков через sync_to_async.
+    """
+    acreate_and_dispatch = getattr(AITask, 'acreate_and_dispatch', None)
+    if acreate_and_dispatch is None:
+        return await sync_to_async(create_generation_task)(
+            prompt_version=prompt_version,
+            content_type=content_type,
+            object_id=object_id,
+            action=action,
+            additional_data=additional_data,
+            agent=agent,
+            object_data=object_data,
+            generator=generator,
+        )
+    
+    task_data = await sync_to_async(build_generation_task_data)(
+        prompt_version, content_type, object_id, action, additional_data, agent, object_data, generator
+    )
+    return await acreate_and_dispatch(agent=agent, **task_data)
+
+
+def _create_generation_task_in_thread(task_kwargs: Dict[str, Any]) -> AITask:
+    """
+    Создает задачу генерации в рабочем потоке и закрывает соединения
+    с БД, открытые этим потоком.
+    """
+    try:
+        return create_generation_task(**task_kwargs)
+    finally:
+        connections.close_all()
+
+
+def dispatch_generation_tasks(
+    tasks_kwargs: List[Dict[str, Any]],
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Создает и отправляет несколько задач генерации одновременно.
+    
+    Вызовы агентов выполняются в пуле потоков, поэтому общее время равно
+    времени самого медленного вызова, а не сумме всех вызовов. Ошибка одной
+    задачи не мешает отправке остальных.
+    
+    Args:
+        tasks_kwargs: Список аргументов для create_generation_task
+        max_workers: Количество потоков (по умолчанию MULTI_ACTION_MAX_WORKERS)
+    
+    Returns:
+        Список результатов в порядке tasks_kwargs: {'task': AITask или None, 'error': str или None}
+    """
+    if not tasks_kwargs:
+        return []
+    
+    # Одна задача отправляется в текущем потоке
+    if len(tasks_kwargs) == 1:
+        try:
+            return [{'task': create_generation_task(**tasks_kwargs[0]), 'error': None}]
+        except Exception as e:
+            return [{'task': None, 'error': str(e)}]
+    
+    max_workers = max(1, min(max_workers or MULTI_ACTION_MAX_WORKERS, len(tasks_kwargs)))
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_create_generation_task_in_thread, task_kwargs)
+            for task_kwargs in tasks_kwargs
+        ]
+        for future in futures:
+            try:
+                results.append({'task': future.result(), 'error': None})
+            except Exception as e:
+                results.append({'task': None, 'error': str(e)})
+    return results
+
+
+def get_task_group_cache_key(group_id: str) -> str:
+    """Возвращает ключ кэша группы задач генерации."""
+    return f'content_generator_task_group_{group_id}'
+
+
+def create_task_group(task_ids: Dict[str, int], errors: Optional[Dict[str, str]] = None) -> str:
+    """
+    Сохраняет группу задач генерации в кэше и возвращает ее идентификатор.
+    
+    Args:
+        task_ids: Словарь {действие: ID задачи AITask}
+        errors: Словарь {действие: текст ошибки} для неотправленных задач
+    
+    Returns:
+        Идентификатор группы
+    """
+    group_id = uuid.uuid4().hex
+    cache.set(
+        get_task_group_cache_key(group_id),
+        {'task_ids': task_ids, 'errors': errors or {}},
+        TASK_GROUP_CACHE_TTL
+    )
+    return group_id
+
+
+def get_task_group_status(group_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает сводный статус группы задач генерации.
+    
+    Итоговый статус группы:
+        - PENDING: хотя бы одна задача еще выполняется
+        - SUCCESS: все задачи выполнены успешно
+        - FAILURE: ни одна задача не выполнена успешно
+        - PARTIAL: часть задач выполнена успешно, часть - с ошибкой
+    
+    Returns:
+        Словарь со статусом группы и статусами задач по действиям или None,
+        если группа не найдена (или истек срок ее хранения)
+    """
+    group = cache.get(get_task_group_cache_key(group_id))
+    if group is None:
+        return None
+    
+    statuses = dict(
+        AITask.objects.filter(id__in=list(group['task_ids'].values())).values_list('id', 'status')
+    )
+    return _summarize_task_group(group_id, group, statuses)
+
+
+async def aget_task_group_status(group_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Асинхронный вариант get_task_group_status для ASGI-представлений.
+    """
+    group = await cache.aget(get_task_group_cache_key(group_id))
+    if group is None:
+        return None
+    
+    statuses = {
+        task_id: status
+        async for task_id, status in AITask.objects.filter(
+            id__in=list(group['task_ids'].values())
+        ).values_list('id', 'status')
     }
+    return _summarize_task_group(group_id, group, statuses)
+
+
+def _summarize_task_group(group_id: str, group: Dict[str, Any], statuses: Dict[int, str]) -> Dict[str, Any]:
+    """
+    Формирует сводный статус группы по статусам ее задач.
     
-    # Добавляем дополнительные данные, если есть
-    if additional_data:
-        context_data.update(additional_data)
+    Args:
+        group_id: Идентификатор группы
+        group: Данные группы из кэша (task_ids и errors)
+        statuses: Словарь {ID задачи: статус}
+    """
+    task_ids = group['task_ids']
+    actions = {}
+    for action, task_id in task_ids.items():
+        actions[action] = {'task_id': task_id, 'status': statuses.get(task_id, 'FAILURE')}
+    for action, error in group['errors'].items():
+        actions[action] = {'task_id': None, 'status': 'FAILURE', 'error': error}
     
-    # payload - данные для отправки AI-агенту
-    payload = {
-        'prompt': prompt_version.prompt_content,
+    action_statuses = [item['status'] for item in actions.values()]
+    if any(status not in TASK_FINAL_STATUSES for status in action_statuses):
+        status = 'PENDING'
+    elif all(status == 'SUCCESS' for status in action_statuses):
+        status = 'SUCCESS'
+    elif any(status == 'SUCCESS' for status in action_statuses):
+        status = 'PARTIAL'
+    else:
+        status = 'FAILURE'
+    
+    return {
+        'group_id': group_id,
+        'status': status,
+        'actions': actions,
     }
+
+
+def agent_supports_streaming(agent: Optional[AIAgent]) -> bool:
+    """
+    Проверяет, умеет ли агент отдавать результат по частям.
     
-    # Если есть additional_prompt, добавляем его в payload
-    if additional_data and 'additional_prompt' in additional_data:
-        payload['additional_prompt'] = additional_data['additional_prompt']
+    Агент с поддержкой потоковой генерации имеет атрибут supports_streaming
+    и метод stream_generation(ai_task), возвращающий итератор текстовых фрагментов.
+    """
+    return (
+        agent is not None
+        and bool(getattr(agent, 'supports_streaming', False))
+        and callable(getattr(agent, 'stream_generation', None))
+    )
+
+
+def parse_streamed_result(text: str) -> Dict[str, Any]:
+    """
+    Преобразует собранный из фрагментов текст в результат задачи.
+    JSON-объект возвращается как есть, остальной текст - в ключе text.
+    """
+    try:
+        result = json.loads(text)
+    except (TypeError, ValueError):
+        return {'text': text}
+    return result if isinstance(result, dict) else {'text': text}
+
+
+def _fail_streamed_task(task: AITask, message: str) -> None:
+    """Завершает задачу потоковой генерации с ошибкой и сохраняет результат в GeneratedContent."""
+    task.status = 'FAILURE'
+    task.result = {'error': message}
+    task.save(update_fields=['status', 'result'])
+    process_generation_result(task)
+
+
+def stream_generation_task(
+    prompt_version: PromptVersion,
+    content_type: ContentType,
+    object_id: int,
+    action: str,
+    additional_data: Optional[Dict[str, Any]] = None,
+    agent: Optional[AIAgent] = None,
+    object_data: Optional[Dict[str, Any]] = None,
+    generator=None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Выполняет генерацию с потоковой передачей результата.
     
-    # Определяем эндпоинт на основе действия
-    endpoint = f'content_generator_{action}'
+    Создает AITask без отправки через очередь ai_interface, передает фрагменты
+    ответа агента по мере получения и по окончании сохраняет итоговый результат
+    в задачу и в GeneratedContent через process_generation_result.
+    Если клиент отключается раньше (генератор закрывается), генерация у агента
+    прерывается, а задача завершается со статусом FAILURE.
     
-    # Создаем и отправляем задачу
-    task = AITask.create_and_dispatch(
-        endpoint=endpoint,
-        payload=payload,
-        context_data=context_data,
-        agent=agent
+    Args:
+        agent: AI-агент с поддержкой потоковой генерации (см. agent_supports_streaming)
+        Остальные аргументы - как у create_generation_task
+    
+    Yields:
+        События: {'event': 'task', 'task_id'}, {'event': 'chunk', 'text'},
+        затем {'event': 'done', 'task_id', 'generated_content_id'}
+        или {'event': 'error', 'task_id', 'message'}
+    """
+    task_data = build_generation_task_data(
+        prompt_version, content_type, object_id, action, additional_data, agent, object_data, generator
     )
+    task = AITask.objects.create(agent=agent, status='PREPROCESSING', **task_data)
     
-    return task
+    chunks = []
+    stream = None
+    try:
+        yield {'event': 'task', 'task_id': task.id}
+        stream = agent.stream_generation(task)
+        for chunk in stream:
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            yield {'event': 'chunk', 'text': chunk}
+    except GeneratorExit:
+        # Клиент отключился (генератор закрыт): задача не должна остаться в обработке
+        _fail_streamed_task(task, 'Клиент отключился до окончания генерации')
+        raise
+    except Exception as e:
+        _fail_streamed_task(task, str(e))
+        yield {'event': 'error', 'task_id': task.id, 'message': str(e)}
+        return
+    finally:
+        # Прерываем генерацию у агента, если она еще идет
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+    
+    task.status = 'SUCCESS'
+    task.result = parse_streamed_result(''.join(chunks))
+    task.save(update_fields=['status', 'result'])
+    generated_content = process_generation_result(task)
+    
+    yield {
+        'event': 'done',
+        'task_id': task.id,
+        'generated_content_id': generated_content.id if generated_content else None,
+    }
 
 
 def process_generation_result(ai_task: AITask) -> Optional[GeneratedContent]:
@@ -151,18 +892,25 @@ def process_generation_result(ai_task: AITask) -> Optional[GeneratedContent]:
                 'prompt_version': prompt_version,
                 'content_type': content_type,
                 'object_id': model_id,
+                'action': task_data.get('action', ''),
                 'generated_data': result_data,
                 'status': status,
             }
         )
         
         # Если объект уже существовал, обновляем его
+        previous_status = None if created else generated_content.status
         if not created:
             generated_content.prompt_version = prompt_version
             generated_content.generated_data = result_data
             generated_content.status = status
             generated_content.save()
         
+        # Учитываем использование кэша промптов провайдером (один раз на задачу)
+        if status == 'SUCCESS' and previous_status != 'SUCCESS':
+            from content_generator.utils import record_prompt_cache_usage
+            record_prompt_cache_usage(prompt_version.id, result_data)
+        
         return generated_content
         
     except Exception as e:
@@ -1,20 +1,37 @@
+import json
 import traceback
 import threading
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, HttpResponse
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.shortcuts import get_current_site
 
 from content_generator.models import PromptVersion, Prompt
-from content_generator.ai_interface_adapter import create_generation_task
-from content_generator.utils import get_prompt_for_action, ACTION_TO_PROMPT_TYPE
+from content_generator.ai_interface_adapter import (
+    PAYLOAD_LAYOUT,
+    PAYLOAD_LAYOUT_PREFIX,
+    acreate_generation_task,
+    aget_task_group_status,
+    agent_supports_streaming,
+    create_generation_task,
+    create_task_group,
+    dispatch_generation_tasks,
+    get_task_group_status,
+    stream_generation_task,
+)
+from content_generator.routing import aroute_prompt_version, route_prompt_version
+from content_generator.idempotency import idempotent
+from content_generator.utils import ACTION_TO_PROMPT_TYPE, build_object_data
 
 
 @login_required()
+@idempotent
 def generate(request):
     """
     Унифицированный API endpoint для генерации контента.
@@ -25,9 +42,15 @@ def generate(request):
         - action (str): Действие для выполнения (set_seo_params, set_description, etc.)
         - additional_prompt (str, optional): Дополнительный промпт от пользователя
         - async_mode (bool, optional): Выполнять асинхронно (по умолчанию False)
+        - stream (bool, optional): Передавать результат по частям через SSE
+          (если агент генератора не поддерживает потоковую генерацию,
+          задача создается как в асинхронном режиме)
+        - idempotency_key (str, optional): Ключ идемпотентности (или заголовок Idempotency-Key);
+          повтор запроса с тем же ключом возвращает исходный ответ без новой задачи
     
     Возвращает:
         JSON: { "status": "ok", "task_id": <id> } или { "status": "error", "message": <error> }
+        В потоковом режиме: text/event-stream с событиями task, chunk, done или error
     """
     print('generate')
     try:
@@ -37,6 +60,7 @@ def generate(request):
         action = request.GET.get('action')
         additional_prompt = request.GET.get('additional_prompt', '')
         async_mode = request.GET.get('async_mode', 'false').lower() == 'true'
+        stream_mode = request.GET.get('stream', 'false').lower() == 'true'
         
         # Валидация
         if not generator_id or not model_id or not action:
@@ -45,43 +69,10 @@ def generate(request):
                 'message': 'Отсутствуют обязательные параметры: generator_id, model_id, action'
             }, status=400)
         
-        # Получаем генератор и извлекаем информацию о модели
-        try:
-            from content_generator.models import ContentGenerator
-            generator = ContentGenerator.objects.get(id=generator_id)
-        except ContentGenerator.DoesNotExist:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'Генератор с ID {generator_id} не найден'
-            }, status=404)
-        except Exception as e:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'Ошибка при получении генератора: {str(e)}'
-            }, status=500)
-        
-        # Проверяем наличие content_type у генератора
-        if not generator.content_type:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'Генератор с ID {generator_id} не имеет настроенного типа контента'
-            }, status=400)
-        
-        # Получаем модель и объект через content_type
-        try:
-            Model = generator.content_type.model_class()
-            if not Model:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': f'Модель для типа контента {generator.content_type} не найдена'
-                }, status=404)
-            
-            model_instance = get_object_or_404(Model, id=model_id)
-        except Exception as e:
-            return JsonResponse({
-                'status': 'error',
-                'message': f'Объект не найден: {str(e)}'
-            }, status=404)
+        # Получаем генератор и объект модели
+        generator, model_instance, error_response = _get_generator_and_instance(generator_id, model_id)
+        if error_response is not None:
+            return error_response
         
         # Проверяем наличие метода у модели
         if not hasattr(model_instance, action):
@@ -92,7 +83,8 @@ def generate(request):
             }, status=400)
         
         # Получаем версию промпта для конкретного действия
-        prompt_version = get_prompt_for_action(generator, action)
+        # (стабильную или, для части объектов, версию-кандидат A/B-сравнения)
+        prompt_version, ab_variant = route_prompt_version(generator, action, model_instance.pk)
         if not prompt_version:
             prompt_type = ACTION_TO_PROMPT_TYPE.get(action, 'unknown')
             return JsonResponse({
@@ -100,6 +92,32 @@ def generate(request):
                 'message': f'Не найден активный промпт для действия "{action}" (тип: {prompt_type}). Создайте промпт и его версию перед генерацией.'
             }, status=404)
         
+        # Потоковый режим - передаем результат по частям, если агент это поддерживает
+        if stream_mode:
+            if agent_supports_streaming(generator.agent):
+                additional_data = {'ab_variant': ab_variant}
+                if additional_prompt:
+                    additional_data['additional_prompt'] = additional_prompt
+                
+                events = stream_generation_task(
+                    prompt_version=prompt_version,
+                    content_type=ContentType.objects.get_for_model(model_instance),
+                    object_id=int(model_id),
+                    action=action,
+                    additional_data=additional_data,
+                    object_data=_get_object_data(model_instance, action, additional_prompt),
+                    agent=generator.agent,
+                    generator=generator
+                )
+                response = StreamingHttpResponse(_format_sse_events(events), content_type='text/event-stream')
+                response['Cache-Control'] = 'no-cache'
+                # Отключаем буферизацию ответа в nginx
+                response['X-Accel-Buffering'] = 'no'
+                return response
+            
+            # Агент не поддерживает потоковую генерацию - создаем обычную задачу
+            async_mode = True
+        
         # Если асинхронный режим - создаем задачу через ai_interface
         if async_mode:
             try:
@@ -113,7 +131,7 @@ def generate(request):
                 domain = site.domain if site else None
                 
                 # Формируем дополнительные данные
-                additional_data = {}
+                additional_data = {'ab_variant': ab_variant}
                 if additional_prompt:
                     additional_data['additional_prompt'] = additional_prompt
                 
@@ -126,9 +144,11 @@ def generate(request):
                     content_type=content_type,
                     object_id=int(model_id),
                     action=action,
-                    additional_data=additional_data if additional_data else None,
+                    additional_data=additional_data,
+                    object_data=_get_object_data(model_instance, action, additional_prompt),
                     agent=agent,  # Используем агент из ContentGenerator или AILENGO из настроек
-                    domain=domain
+                    domain=domain,
+                    generator=generator
                 )
                 
                 return JsonResponse({
@@ -164,6 +184,402 @@ def generate(request):
         }, status=500)
 
 
+def _get_object_data(model_instance, action, additional_prompt=''):
+    """
+    Возвращает данные объекта для payload задачи.
+    Данные передаются агенту только в режиме payload prefix (CONTENT_GENERATOR_PAYLOAD_LAYOUT).
+    """
+    if PAYLOAD_LAYOUT != PAYLOAD_LAYOUT_PREFIX:
+        return None
+    return build_object_data(model_instance, action, additional_prompt or None)
+
+
+def _format_sse_events(events):
+    """
+    Преобразует события потоковой генерации в формат Server-Sent Events.
+    """
+    try:
+        for event in events:
+            data = {key: value for key, value in event.items() if key != 'event'}
+            yield f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'message': str(e)}, ensure_ascii=False)}\n\n"
+
+
+def _get_generator_and_instance(generator_id, model_id):
+    """
+    Получает генератор контента и объект модели по их ID.
+    
+    Returns:
+        Кортеж (генератор, объект модели, None) или (None, None, JsonResponse с ошибкой)
+    """
+    from content_generator.models import ContentGenerator
+    
+    # Получаем генератор и извлекаем информацию о модели
+    try:
+        generator = ContentGenerator.objects.get(id=generator_id)
+    except ContentGenerator.DoesNotExist:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Генератор с ID {generator_id} не найден'
+        }, status=404)
+    except Exception as e:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Ошибка при получении генератора: {str(e)}'
+        }, status=500)
+    
+    # Проверяем наличие content_type у генератора
+    if not generator.content_type:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Генератор с ID {generator_id} не имеет настроенного типа контента'
+        }, status=400)
+    
+    # Получаем модель и объект через content_type
+    try:
+        Model = generator.content_type.model_class()
+        if not Model:
+            return None, None, JsonResponse({
+                'status': 'error',
+                'message': f'Модель для типа контента {generator.content_type} не найдена'
+            }, status=404)
+        
+        model_instance = get_object_or_404(Model, id=model_id)
+    except Exception as e:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Объект не найден: {str(e)}'
+        }, status=404)
+    
+    return generator, model_instance, None
+
+
+def _parse_actions(request):
+    """
+    Возвращает список действий из параметра actions без повторов.
+    Действия передаются через запятую и/или повторением параметра.
+    """
+    actions = []
+    for value in request.GET.getlist('actions'):
+        for action in value.split(','):
+            action = action.strip()
+            if action and action not in actions:
+                actions.append(action)
+    return actions
+
+
+@login_required()
+@idempotent
+def generate_multi(request):
+    """
+    API endpoint для одновременной генерации нескольких действий для одного объекта.
+    
+    Задачи для всех действий отправляются AI-агентам параллельно, поэтому
+    время ответа определяется самым медленным вызовом, а не суммой вызовов.
+    Действия, которые нельзя выполнить (нет метода у модели или промпта),
+    не прерывают запрос и возвращаются в errors.
+    Статус группы задач проверяется через generate_status.
+    
+    Параметры:
+        - generator_id (int): ID генератора контента (обязательный)
+        - model_id (int): ID объекта модели (обязательный)
+        - actions (str): Действия через запятую или повторением параметра (обязательный)
+        - additional_prompt (str, optional): Дополнительный промпт от пользователя
+        - idempotency_key (str, optional): Ключ идемпотентности (или заголовок Idempotency-Key)
+    
+    Возвращает:
+        JSON: {
+            "status": "ok",
+            "group_id": <id группы>,
+            "tasks": {"set_seo_params": <task_id>, ...},
+            "errors": {"set_description": <ошибка>, ...}
+        } или { "status": "error", "message": <error> }
+    """
+    try:
+        generator_id = request.GET.get('generator_id')
+        model_id = request.GET.get('model_id')
+        actions = _parse_actions(request)
+        additional_prompt = request.GET.get('additional_prompt', '')
+        
+        # Валидация
+        if not generator_id or not model_id or not actions:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Отсутствуют обязательные параметры: generator_id, model_id, actions'
+            }, status=400)
+        
+        generator, model_instance, error_response = _get_generator_and_instance(generator_id, model_id)
+        if error_response is not None:
+            return error_response
+        
+        content_type = ContentType.objects.get_for_model(model_instance)
+        site = get_current_site(request)
+        domain = site.domain if site else None
+        
+        # Проверяем действия; неподдерживаемые действия попадают в errors
+        tasks_kwargs = []
+        errors = {}
+        for action in actions:
+            if not hasattr(model_instance, action):
+                natural_key = f"{generator.content_type.app_label}.{generator.content_type.model}"
+                errors[action] = f'Модель {natural_key} не поддерживает действие {action}'
+                continue
+            
+            prompt_version, ab_variant = route_prompt_version(generator, action, model_instance.pk)
+            if not prompt_version:
+                prompt_type = ACTION_TO_PROMPT_TYPE.get(action, 'unknown')
+                errors[action] = f'Не найден активный промпт для действия "{action}" (тип: {prompt_type})'
+                continue
+            
+            additional_data = {'ab_variant': ab_variant}
+            if additional_prompt:
+                additional_data['additional_prompt'] = additional_prompt
+            
+            tasks_kwargs.append({
+                'prompt_version': prompt_version,
+                'content_type': content_type,
+                'object_id': int(model_id),
+                'action': action,
+                'additional_data': additional_data,
+                'object_data': _get_object_data(model_instance, action, additional_prompt),
+                'agent': generator.agent,
+                'domain': domain,
+                'generator': generator,
+            })
+        
+        if not tasks_kwargs:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Ни одно из действий не может быть выполнено',
+                'errors': errors
+            }, status=400)
+        
+        # Отправляем задачи параллельно
+        results = dispatch_generation_tasks(tasks_kwargs)
+        
+        task_ids = {}
+        for task_kwargs, result in zip(tasks_kwargs, results):
+            if result['task'] is not None:
+                task_ids[task_kwargs['action']] = result['task'].id
+            else:
+                errors[task_kwargs['action']] = result['error']
+        
+        if not task_ids:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Не удалось создать ни одной задачи',
+                'errors': errors
+            }, status=500)
+        
+        group_id = create_task_group(task_ids, errors)
+        
+        return JsonResponse({
+            'status': 'ok',
+            'group_id': group_id,
+            'tasks': task_ids,
+            'errors': errors,
+            'message': 'Задачи созданы и отправлены в AI-агенты'
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }, status=500)
+
+
+@login_required()
+def generate_status(request):
+    """
+    API endpoint для проверки статуса группы задач, созданной generate_multi.
+    
+    Параметры:
+        - group_id (str): ID группы задач (обязательный)
+    
+    Возвращает:
+        JSON: {
+            "status": "PENDING" | "SUCCESS" | "PARTIAL" | "FAILURE",
+            "group_id": <id группы>,
+            "actions": {"set_seo_params": {"task_id": <id>, "status": <статус задачи>}, ...}
+        } или { "status": "error", "message": <error> }
+    """
+    group_id = request.GET.get('group_id')
+    if not group_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Отсутствует обязательный параметр: group_id'
+        }, status=400)
+    
+    group_status = get_task_group_status(group_id)
+    if group_status is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Группа задач {group_id} не найдена'
+        }, status=404)
+    
+    return JsonResponse(group_status)
+
+
+# ============================================================================
+# Асинхронные endpoints для ASGI
+# ============================================================================
+
+async def _aget_generator_and_instance(generator_id, model_id):
+    """
+    Асинхронный вариант _get_generator_and_instance.
+    
+    Returns:
+        Кортеж (генератор, объект модели, None) или (None, None, JsonResponse с ошибкой)
+    """
+    from content_generator.models import ContentGenerator
+    
+    try:
+        generator = await ContentGenerator.objects.select_related('content_type', 'agent').aget(id=generator_id)
+    except (ContentGenerator.DoesNotExist, ValueError):
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Генератор с ID {generator_id} не найден'
+        }, status=404)
+    
+    if not generator.content_type:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Генератор с ID {generator_id} не имеет настроенного типа контента'
+        }, status=400)
+    
+    Model = generator.content_type.model_class()
+    if not Model:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Модель для типа контента {generator.content_type} не найдена'
+        }, status=404)
+    
+    try:
+        model_instance = await Model.objects.aget(id=model_id)
+    except (Model.DoesNotExist, ValueError):
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Объект с ID {model_id} не найден'
+        }, status=404)
+    
+    return generator, model_instance, None
+
+
+@idempotent
+async def generate_async(request):
+    """
+    Асинхронный вариант generate для ASGI.
+    
+    Генератор, объект и версия промпта получаются через асинхронный ORM,
+    задача отправляется через acreate_generation_task, поэтому один
+    ASGI-воркер обслуживает много одновременных запросов. Всегда создает
+    задачу ai_interface (как generate с async_mode=true).
+    
+    Параметры:
+        - generator_id (int): ID генератора контента (обязательный)
+        - model_id (int): ID объекта модели (обязательный)
+        - action (str): Действие для выполнения (обязательный)
+        - additional_prompt (str, optional): Дополнительный промпт от пользователя
+        - idempotency_key (str, optional): Ключ идемпотентности (или заголовок Idempotency-Key)
+    
+    Возвращает:
+        JSON: { "status": "ok", "task_id": <id> } или { "status": "error", "message": <error> }
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    
+    try:
+        generator_id = request.GET.get('generator_id')
+        model_id = request.GET.get('model_id')
+        action = request.GET.get('action')
+        additional_prompt = request.GET.get('additional_prompt', '')
+        
+        # Валидация
+        if not generator_id or not model_id or not action:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Отсутствуют обязательные параметры: generator_id, model_id, action'
+            }, status=400)
+        
+        generator, model_instance, error_response = await _aget_generator_and_instance(generator_id, model_id)
+        if error_response is not None:
+            return error_response
+        
+        if not hasattr(model_instance, action):
+            natural_key = f"{generator.content_type.app_label}.{generator.content_type.model}"
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Модель {natural_key} не поддерживает действие {action}'
+            }, status=400)
+        
+        prompt_version, ab_variant = await aroute_prompt_version(generator, action, model_instance.pk)
+        if not prompt_version:
+            prompt_type = ACTION_TO_PROMPT_TYPE.get(action, 'unknown')
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Не найден активный промпт для действия "{action}" (тип: {prompt_type}). Создайте промпт и его версию перед генерацией.'
+            }, status=404)
+        
+        additional_data = {'ab_variant': ab_variant}
+        if additional_prompt:
+            additional_data['additional_prompt'] = additional_prompt
+        
+        task = await acreate_generation_task(
+            prompt_version=prompt_version,
+            content_type=generator.content_type,
+            object_id=model_instance.pk,
+            action=action,
+            additional_data=additional_data,
+            object_data=await sync_to_async(_get_object_data)(model_instance, action, additional_prompt),
+            agent=generator.agent,
+            generator=generator
+        )
+        
+        return JsonResponse({
+            'status': 'ok',
+            'task_id': task.id,
+            'message': 'Задача создана и отправлена в AI-агент'
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }, status=500)
+
+
+async def generate_status_async(request):
+    """
+    Асинхронный вариант generate_status для ASGI.
+    
+    Параметры:
+        - group_id (str): ID группы задач (обязательный)
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    
+    group_id = request.GET.get('group_id')
+    if not group_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Отсутствует обязательный параметр: group_id'
+        }, status=400)
+    
+    group_status = await aget_task_group_status(group_id)
+    if group_status is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Группа задач {group_id} не найдена'
+        }, status=404)
+    
+    return JsonResponse(group_status)
+
+
 def execute_generation_action(model_instance, action, additional_prompt=''):
     """
     Выполняет действие генерации для модели.
@@ -0,0 +1,84 @@
+"""
+Пользовательские поля моделей content_generator.
+"""
+
+import json
+import zlib
+import base64
+
+from django import forms
+from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class CompressedJSONField(models.TextField):
+    """
+    JSON-поле с прозрачным сжатием zlib.
+
+    Значение хранится в текстовой колонке: короткий JSON - как есть, JSON длиннее
+    compress_min_length - с префиксом COMPRESSED_PREFIX и base64 сжатых данных.
+    Несжатый JSON читается как обычно, поэтому колонку существующего JSONField
+    можно перевести на это поле без конвертации данных: новые и пересохраненные
+    значения будут сжиматься.
+
+    Ограничение: lookups по ключам JSON (generated_data__key) не поддерживаются.
+    """
+    description = 'JSON со сжатием zlib'
+
+    COMPRESSED_PREFIX = 'zlib:'
+
+    def __init__(self, *args, compress_min_length=1024, compression_level=6, encoder=DjangoJSONEncoder, **kwargs):
+        self.compress_min_length = compress_min_length
+        self.compression_level = compression_level
+        self.encoder = encoder
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compress_min_length != 1024:
+            kwargs['compress_min_length'] = self.compress_min_length
+        if self.compression_level != 6:
+            kwargs['compression_level'] = self.compression_level
+        if self.encoder is not DjangoJSONEncoder:
+            kwargs['encoder'] = self.encoder
+        return name, path, args, kwargs
+
+    def compress(self, value):
+        """Сериализует значение в JSON и сжимает его, если он длиннее порога."""
+        text = json.dumps(value, cls=self.encoder, ensure_ascii=False)
+        if len(text) < self.compress_min_length:
+            return text
+        compressed = zlib.compress(text.encode('utf-8'), self.compression_level)
+        return self.COMPRESSED_PREFIX + base64.b64encode(compressed).decode('ascii')
+
+    def decompress(self, value):
+        """Восстанавливает значение из сжатого или обычного JSON."""
+        if value is None or not isinstance(value, str):
+            return value
+        if value.startswith(self.COMPRESSED_PREFIX):
+            value = zlib.decompress(base64.b64decode(value[len(self.COMPRESSED_PREFIX):])).decode('utf-8')
+        try:
+            return json.loads(value)
+        except json.decoder.JSONDecodeError:
+            return value
+
+    def from_db_value(self, value, expression, connection):
+        return self.decompress(value)
+
+    def to_python(self, value):
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return self.compress(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super(models.TextField, self).formfield(**{
+            'form_class': forms.JSONField,
+            'encoder': self.encoder,
+            **kwargs,
+        })
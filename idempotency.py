@@ -0,0 +1,188 @@
+"""
+Ключи идемпотентности для endpoints генерации.
+
+Клиент передает ключ в заголовке Idempotency-Key или параметре idempotency_key.
+Первый запрос с ключом резервирует его в кэше (cache.add атомарен), выполняется
+и сохраняет успешный ответ на IDEMPOTENCY_TTL. Повторы с тем же ключом получают
+сохраненный ответ (тот же task_id) без повторной отправки задачи; пока первый
+запрос выполняется, повтор получает 409. Ответы с ошибкой не сохраняются,
+и запрос можно повторить с тем же ключом.
+
+Ключи действуют в рамках пользователя. Повтор ключа с другими параметрами
+запроса отклоняется с кодом 422. Потоковые ответы не сохраняются.
+"""
+
+import asyncio
+import hashlib
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+# Заголовок и параметр запроса с ключом идемпотентности
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_PARAM = 'idempotency_key'
+
+# Максимальная длина ключа
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# Время хранения ответа по ключу, секунды
+IDEMPOTENCY_TTL = getattr(settings, 'CONTENT_GENERATOR_IDEMPOTENCY_TTL', 10 * 60)
+
+# Время резерва ключа на время выполнения первого запроса, секунды
+IDEMPOTENCY_PENDING_TTL = getattr(settings, 'CONTENT_GENERATOR_IDEMPOTENCY_PENDING_TTL', 5 * 60)
+
+# Состояния ключа
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+
+
+def get_idempotency_key(request) -> Optional[str]:
+    """Возвращает ключ идемпотентности из заголовка или параметра запроса."""
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER) or request.GET.get(IDEMPOTENCY_KEY_PARAM)
+    key = (key or '').strip()
+    return key or None
+
+
+def get_request_fingerprint(request) -> str:
+    """
+    Возвращает отпечаток запроса: путь и параметры без ключа идемпотентности.
+    """
+    params = sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        if name != IDEMPOTENCY_KEY_PARAM
+        for value in values
+    )
+    return hashlib.sha256(f'{request.path}?{params}'.encode('utf-8')).hexdigest()
+
+
+def get_idempotency_cache_key(user_id: int, key: str) -> str:
+    """Возвращает ключ кэша для ключа идемпотентности пользователя."""
+    key_hash = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return f'content_generator_idempotency_{user_id}_{key_hash}'
+
+
+def _pending_entry(fingerprint: str) -> Dict[str, Any]:
+    return {'state': STATE_PENDING, 'fingerprint': fingerprint}
+
+
+def _done_entry(response, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает запись для сохранения ответа или None, если ответ не сохраняется
+    (ошибка, перенаправление или потоковый ответ).
+    """
+    if getattr(response, 'streaming', False) or not 200 <= response.status_code < 300:
+        return None
+    return {
+        'state': STATE_DONE,
+        'fingerprint': fingerprint,
+        'status_code': response.status_code,
+        'content_type': response.get('Content-Type'),
+        'content': response.content,
+    }
+
+
+def _invalid_key_response(key: str) -> Optional[JsonResponse]:
+    """Возвращает ответ с ошибкой, если ключ слишком длинный."""
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Ключ идемпотентности длиннее {MAX_IDEMPOTENCY_KEY_LENGTH} символов'
+        }, status=400)
+    return None
+
+
+def _existing_key_response(entry: Optional[Dict[str, Any]], fingerprint: str) -> HttpResponse:
+    """Возвращает ответ на повтор запроса с уже использованным ключом."""
+    if entry is not None and entry['fingerprint'] != fingerprint:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Ключ идемпотентности уже использован с другими параметрами запроса'
+        }, status=422)
+
+    if entry is None or entry['state'] == STATE_PENDING:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Запрос с этим ключом идемпотентности еще выполняется'
+        }, status=409)
+
+    response = HttpResponse(entry['content'], status=entry['status_code'], content_type=entry['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Декоратор представления генерации, поддерживающий ключи идемпотентности.
+    Работает с синхронными и асинхронными представлениями; запросы без ключа
+    и запросы анонимных пользователей выполняются как обычно.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key = get_idempotency_key(request)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            error_response = _invalid_key_response(key)
+            if error_response is not None:
+                return error_response
+
+            user = await request.auser()
+            if not user.is_authenticated:
+                return await view(request, *args, **kwargs)
+
+            cache_key = get_idempotency_cache_key(user.pk, key)
+            fingerprint = get_request_fingerprint(request)
+            if not await cache.aadd(cache_key, _pending_entry(fingerprint), IDEMPOTENCY_PENDING_TTL):
+                return _existing_key_response(await cache.aget(cache_key), fingerprint)
+
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception:
+                await cache.adelete(cache_key)
+                raise
+
+            entry = _done_entry(response, fingerprint)
+            if entry is None:
+                await cache.adelete(cache_key)
+            else:
+                await cache.aset(cache_key, entry, IDEMPOTENCY_TTL)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = get_idempotency_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        error_response = _invalid_key_response(key)
+        if error_response is not None:
+            return error_response
+
+        if not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        cache_key = get_idempotency_cache_key(request.user.pk, key)
+        fingerprint = get_request_fingerprint(request)
+        if not cache.add(cache_key, _pending_entry(fingerprint), IDEMPOTENCY_PENDING_TTL):
+            return _existing_key_response(cache.get(cache_key), fingerprint)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        entry = _done_entry(response, fingerprint)
+        if entry is None:
+            cache.delete(cache_key)
+        else:
+            cache.set(cache_key, entry, IDEMPOTENCY_TTL)
+        return response
+
+    return wrapper
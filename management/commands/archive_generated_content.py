@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from content_generator.models import GeneratedContent
+from content_generator.retention import (
+    archive_generated_content,
+    get_archivable_content_ids,
+    RETENTION_KEEP_LATEST,
+    RETENTION_KEEP_UNPUBLISHED,
+    DEFAULT_ARCHIVE_BATCH_SIZE,
+)
+
+
+class Command(BaseCommand):
+    help = 'Переносит устаревший сгенерированный контент в архив по политике хранения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-latest',
+            type=int,
+            default=RETENTION_KEEP_LATEST,
+            help='Сколько последних записей хранить на пару (объект, действие) (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Архивировать только записи старше указанного количества дней',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_ARCHIVE_BATCH_SIZE,
+            help='Размер чанка (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--keep-unpublished',
+            action='store_true',
+            default=RETENTION_KEEP_UNPUBLISHED,
+            help='Не архивировать неопубликованный успешный контент сверх последних записей',
+        )
+        parser.add_argument(
+            '--model',
+            help='Применить политику только к контенту модели в формате app_label.model (например, store.product)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество записей для архивации',
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_latest'] < 0:
+            raise CommandError('--keep-latest не может быть отрицательным')
+
+        queryset = GeneratedContent.objects.all()
+
+        if options['model']:
+            try:
+                app_label, model = options['model'].lower().split('.')
+                content_type = ContentType.objects.get(app_label=app_label, model=model)
+            except (ValueError, ContentType.DoesNotExist):
+                raise CommandError(f'Модель {options["model"]} не найдена')
+            queryset = queryset.filter(content_type=content_type)
+
+        older_than = None
+        if options['older_than_days'] is not None:
+            older_than = timezone.now() - timedelta(days=options['older_than_days'])
+
+        if options['dry_run']:
+            count = len(get_archivable_content_ids(
+                queryset, options['keep_latest'], older_than, keep_unpublished=options['keep_unpublished']
+            ))
+            self.stdout.write(f'Записей для архивации: {count}')
+            return
+
+        stats = archive_generated_content(
+            queryset,
+            keep_latest=options['keep_latest'],
+            older_than=older_than,
+            batch_size=options['batch_size'],
+            keep_unpublished=options['keep_unpublished'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Кандидатов: {stats["candidates"]}, перенесено в архив: {stats["archived"]}'
+        ))
@@ -0,0 +1,83 @@
+import timeit
+
+from bs4 import BeautifulSoup
+
+from django.core.management.base import BaseCommand
+
+from content_generator.utils import get_text_from_html, sanitize_html_tags
+
+
+SAMPLE_HTML_BLOCK = (
+    '<div class="product-description">'
+    '<h2>Характеристики &amp; преимущества</h2>'
+    '<p>Прочный корпус из <strong>алюминия</strong>, защита от влаги&nbsp;IP67.</p>'
+    '<ul><li>Вес: 1,2 кг</li><li>Гарантия: <em>24 месяца</em></li></ul>'
+    '<script>window.dataLayer = [];</script>'
+    '<p><a href="/catalog/?page=2&amp;sort=price">Смотреть похожие товары</a><br/></p>'
+    '</div>'
+)
+
+ALLOWED_TAGS = ['p', 'strong', 'em', 'ul', 'li', 'br']
+
+
+def bs4_get_text(html):
+    """Прежняя реализация извлечения текста через BeautifulSoup."""
+    return BeautifulSoup(html, 'html.parser').get_text(separator=' ', strip=True)
+
+
+def bs4_sanitize(html, allowed_tags):
+    """Прежняя реализация фильтрации тегов через BeautifulSoup."""
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup.find_all(True):
+        if tag.name not in allowed_tags:
+            tag.unwrap()
+    return str(soup)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость извлечения текста из HTML: потоковый парсер против BeautifulSoup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='HTML-файл для замера (по умолчанию - синтетическое описание товара)',
+        )
+        parser.add_argument(
+            '--blocks',
+            type=int,
+            default=50,
+            help='Количество повторов блока синтетического описания (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=200,
+            help='Количество прогонов каждого варианта (по умолчанию %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as html_file:
+                html = html_file.read()
+        else:
+            html = SAMPLE_HTML_BLOCK * options['blocks']
+
+        number = options['number']
+        cases = [
+            ('get_text: BeautifulSoup', lambda: bs4_get_text(html)),
+            ('get_text: html.parser', lambda: get_text_from_html(html, use_cache=False)),
+            ('get_text: html.parser + кэш', lambda: get_text_from_html(html)),
+            ('sanitize: BeautifulSoup', lambda: bs4_sanitize(html, ALLOWED_TAGS)),
+            ('sanitize: html.parser', lambda: sanitize_html_tags(html, ALLOWED_TAGS, use_cache=False)),
+            ('sanitize: html.parser + кэш', lambda: sanitize_html_tags(html, ALLOWED_TAGS)),
+        ]
+
+        self.stdout.write(f'Размер HTML: {len(html)} символов, прогонов: {number}')
+        baseline = {}
+        for name, func in cases:
+            seconds = timeit.timeit(func, number=number)
+            per_call_ms = seconds / number * 1000
+            group = name.split(':')[0]
+            baseline.setdefault(group, per_call_ms)
+            speedup = baseline[group] / per_call_ms if per_call_ms else float('inf')
+            self.stdout.write(f'{name:<32} {per_call_ms:9.3f} мс/вызов  x{speedup:.1f}')
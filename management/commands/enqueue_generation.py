@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.contenttypes.models import ContentType
+
+from content_generator.ai_interface_adapter import BATCH_ACTIONS, DEFAULT_OBJECTS_PER_BATCH
+from content_generator.utils import enqueue_generation_for_queryset
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь генерацию действия для объектов модели (для коротких результатов - пакетами)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'model',
+            help='Модель в формате app_label.model (например, store.product)',
+        )
+        parser.add_argument(
+            'action',
+            help='Действие (например, upgrade_name)',
+        )
+        parser.add_argument(
+            '--ids',
+            help='ID объектов через запятую (по умолчанию - все объекты модели)',
+        )
+        parser.add_argument(
+            '--additional-prompt',
+            help='Дополнительный промпт',
+        )
+        parser.add_argument(
+            '--objects-per-batch',
+            type=int,
+            default=DEFAULT_OBJECTS_PER_BATCH,
+            help='Объектов в одной пакетной задаче (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--no-batch',
+            action='store_true',
+            help=f'Создавать задачу на каждый объект (пакетный режим по умолчанию для: {", ".join(BATCH_ACTIONS)})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            app_label, model = options['model'].lower().split('.')
+            Model = ContentType.objects.get(app_label=app_label, model=model).model_class()
+        except (ValueError, ContentType.DoesNotExist):
+            raise CommandError(f'Модель {options["model"]} не найдена')
+        if Model is None:
+            raise CommandError(f'Модель {options["model"]} не найдена')
+
+        queryset = Model.objects.all()
+        if options['ids']:
+            try:
+                ids = [int(object_id) for object_id in options['ids'].split(',') if object_id.strip()]
+            except ValueError:
+                raise CommandError('--ids должен содержать числа через запятую')
+            queryset = queryset.filter(pk__in=ids)
+
+        try:
+            tasks = enqueue_generation_for_queryset(
+                queryset,
+                options['action'],
+                additional_prompt=options['additional_prompt'],
+                batched=False if options['no_batch'] else None,
+                objects_per_batch=options['objects_per_batch'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Создано задач: {len(tasks)}'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from content_generator.models import Prompt
+from content_generator.utils import export_prompts_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Экспортирует промпты и их версии в формате JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для записи (по умолчанию - stdout)',
+        )
+        parser.add_argument(
+            '--prompt',
+            action='append',
+            default=[],
+            help='Название промпта для экспорта (можно указать несколько раз, по умолчанию - все)',
+        )
+
+    def handle(self, *args, **options):
+        prompts = Prompt.objects.all()
+        if options['prompt']:
+            prompts = prompts.filter(name__in=options['prompt'])
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        count = 0
+        try:
+            for line in export_prompts_jsonl(prompts):
+                output.write(line + '\n')
+                count += 1
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f'Экспортировано записей: {count}'))
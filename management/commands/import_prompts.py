@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from content_generator.utils import import_prompts_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Импортирует промпты и их версии из JSON Lines с дедупликацией версий по хэшу содержимого'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл JSON Lines (или "-" для чтения из stdin)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пакета для bulk_create (по умолчанию %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                stats = import_prompts_jsonl(sys.stdin, batch_size=options['batch_size'])
+            else:
+                with open(options['path'], encoding='utf-8') as input_file:
+                    stats = import_prompts_jsonl(input_file, batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано промптов: {stats["prompts_created"]}, '
+            f'создано версий: {stats["versions_created"]}, '
+            f'пропущено дубликатов: {stats["versions_skipped"]}'
+        ))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from content_generator.partitioning import (
+    convert_to_partitioned,
+    create_monthly_partitions,
+    detach_old_partitions,
+    is_partitioned,
+    is_postgresql,
+    list_partitions,
+    DEFAULT_MONTHS_AHEAD,
+)
+
+
+class Command(BaseCommand):
+    help = 'Обслуживает помесячные секции таблицы generated_content (только PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Перевести generated_content в секционированную таблицу (однократно)',
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=DEFAULT_MONTHS_AHEAD,
+            help='На сколько месяцев вперед создавать секции (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            help='Отсоединить секции, все данные которых старше указанного количества месяцев',
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Удалять отсоединенные секции (вместе с --keep-months)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Только показать существующие секции',
+        )
+
+    def handle(self, *args, **options):
+        if not is_postgresql():
+            raise CommandError('Секционирование generated_content поддерживается только для PostgreSQL')
+        if options['drop'] and options['keep_months'] is None:
+            raise CommandError('--drop используется только вместе с --keep-months')
+
+        if options['convert']:
+            if convert_to_partitioned(months_ahead=options['months_ahead']):
+                self.stdout.write(self.style.SUCCESS('Таблица generated_content переведена в секционированную'))
+            else:
+                self.stdout.write('Таблица generated_content уже секционирована')
+        elif not is_partitioned():
+            raise CommandError('Таблица generated_content не секционирована, запустите команду с --convert')
+
+        if options['list']:
+            for name, upper_bound in list_partitions():
+                self.stdout.write(f'{name:<40} до {upper_bound or "-"}')
+            return
+
+        created = create_monthly_partitions(months_ahead=options['months_ahead'])
+        self.stdout.write(f'Создано секций: {len(created)}' + (f' ({", ".join(created)})' if created else ''))
+
+        if options['keep_months'] is not None:
+            result = detach_old_partitions(keep_months=options['keep_months'], drop=options['drop'])
+            detached = result['detached']
+            action = 'Удалено' if options['drop'] else 'Отсоединено'
+            self.stdout.write(f'{action} секций: {len(detached)}' + (f' ({", ".join(detached)})' if detached else ''))
+            if result['protected']:
+                self.stdout.write(self.style.WARNING(
+                    f'Не удалены секции с проверенным или оцененным контентом: {", ".join(result["protected"])}'
+                ))
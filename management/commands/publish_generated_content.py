@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.contenttypes.models import ContentType
+
+from content_generator.models import GeneratedContent
+from content_generator.publishing import (
+    publish_generated_content,
+    get_publishable_content,
+    DEFAULT_PUBLISH_BATCH_SIZE,
+)
+
+
+# Максимальное количество ID пропущенных записей в выводе команды
+MAX_REPORTED_SKIPPED_IDS = 50
+
+
+class Command(BaseCommand):
+    help = 'Пакетно применяет успешный сгенерированный контент к целевым объектам и SEOParameters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_PUBLISH_BATCH_SIZE,
+            help='Размер чанка (по умолчанию %(default)s)',
+        )
+        parser.add_argument(
+            '--model',
+            help='Публиковать только контент указанной модели в формате app_label.model (например, store.product)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество записей для публикации',
+        )
+
+    def handle(self, *args, **options):
+        queryset = GeneratedContent.objects.all()
+
+        if options['model']:
+            try:
+                app_label, model = options['model'].lower().split('.')
+                content_type = ContentType.objects.get(app_label=app_label, model=model)
+            except (ValueError, ContentType.DoesNotExist):
+                raise CommandError(f'Модель {options["model"]} не найдена')
+            queryset = queryset.filter(content_type=content_type)
+
+        if options['dry_run']:
+            count = get_publishable_content(queryset).count()
+            self.stdout.write(f'Записей для публикации: {count}')
+            return
+
+        stats = publish_generated_content(queryset, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Опубликовано: {stats["published"]}, пропущено: {stats["skipped"]}, '
+            f'обновлено объектов: {stats["objects_updated"]}, '
+            f'SEO обновлено: {stats["seo_updated"]}, SEO создано: {stats["seo_created"]}'
+        ))
+
+        if stats['skipped']:
+            reasons = ', '.join(f'{reason}: {count}' for reason, count in stats['skipped_reasons'].items())
+            skipped_ids = stats['skipped_ids']
+            shown_ids = ', '.join(str(content_id) for content_id in skipped_ids[:MAX_REPORTED_SKIPPED_IDS])
+            if len(skipped_ids) > MAX_REPORTED_SKIPPED_IDS:
+                shown_ids += f' и еще {len(skipped_ids) - MAX_REPORTED_SKIPPED_IDS}'
+            self.stdout.write(self.style.WARNING(
+                f'Пропущенные записи остались неопубликованными ({reasons}): {shown_ids}'
+            ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from content_generator.models import PromptVersion
+
+
+class Command(BaseCommand):
+    help = 'Заполняет хэш содержимого (content_hash) у версий промптов, сохраненных до его появления'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пакета для bulk_update (по умолчанию %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = PromptVersion.objects.filter(content_hash='').only('id', 'prompt_content')
+
+        batch = []
+        updated = 0
+        for version in queryset.iterator(chunk_size=batch_size):
+            version.content_hash = PromptVersion.compute_content_hash(version.prompt_content)
+            batch.append(version)
+            if len(batch) >= batch_size:
+                PromptVersion.objects.bulk_update(batch, ['content_hash'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            PromptVersion.objects.bulk_update(batch, ['content_hash'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено версий: {updated}'))
@@ -1,13 +1,16 @@
+import hashlib
 import requests
 import threading
 
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.apps import apps
 from django.conf import settings
-from django.db.models import Avg
+from django.core.validators import MaxValueValidator
+from django.db.models import Avg, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 from django.contrib.sites.models import Site
 from django.contrib.auth import get_user_model
@@ -16,9 +19,30 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 
 from ai_interface.models import AIAgent
 
+from content_generator.fields import CompressedJSONField
+
 User = get_user_model()
 
 
+class DeferredFieldsManager(models.Manager):
+    """
+    Менеджер для списочных запросов: не загружает тяжелые поля.
+    Отложенные поля подгружаются отдельным запросом при первом обращении,
+    поэтому использовать его следует там, где эти поля не нужны.
+    """
+
+    def __init__(self, *deferred_fields):
+        super().__init__()
+        self.deferred_fields = deferred_fields
+
+    def deconstruct(self):
+        manager_as_class, path, qs_class, args, kwargs = super().deconstruct()
+        return manager_as_class, path, qs_class, self.deferred_fields, kwargs
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.deferred_fields)
+
+
 # ========== ПОДСИСТЕМА PROMPTS ==========
 
 class Prompt(models.Model):
@@ -36,6 +60,12 @@ class Prompt(models.Model):
         verbose_name='Описание',
         help_text='Описание назначения промпта'
     )
+    last_version_number = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Последний номер версии',
+        help_text='Счетчик для атомарного выделения номеров версий'
+    )
 
     class Meta:
         verbose_name = 'Промпт'
@@ -83,6 +113,14 @@ class PromptVersion(models.Model):
         verbose_name='Содержимое промпта',
         help_text='Текст промпта для генерации контента (максимум 50000 символов)'
     )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Хэш содержимого',
+        help_text='SHA-256 содержимого промпта, вычисляется автоматически при сохранении'
+    )
     engineer_name = models.CharField(
         max_length=100,
         verbose_name='Имя инженера',
@@ -95,6 +133,10 @@ class PromptVersion(models.Model):
         help_text='Дата и время создания версии'
     )
 
+    objects = models.Manager()
+    # Для списков версий: без полного текста промпта
+    list_objects = DeferredFieldsManager('prompt_content')
+
     class Meta:
         db_table = 'prompt_versions'
         ordering = ['-version_number']
@@ -104,12 +146,58 @@ class PromptVersion(models.Model):
         indexes = [
             models.Index(fields=['prompt', 'version_number']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['prompt', 'content_hash']),
         ]
 
     def __str__(self):
         prompt_name = self.prompt.name if self.prompt else 'Unknown'
         return f'{prompt_name} - Версия {self.version_number}: {self.description[:50]}'
 
+    def save(self, *args, **kwargs):
+        """
+        Пересчитывает хэш содержимого промпта перед сохранением.
+        """
+        self.content_hash = self.compute_content_hash(self.prompt_content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'prompt_content' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'content_hash'}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def compute_content_hash(prompt_content):
+        """
+        Возвращает SHA-256 хэш содержимого промпта (hex, 64 символа).
+        """
+        return hashlib.sha256((prompt_content or '').encode('utf-8')).hexdigest()
+
+    def has_same_content(self, prompt_content):
+        """
+        Проверяет, совпадает ли содержимое версии с переданным текстом.
+        Сравнивает хэши; для версий без сохраненного хэша сравнивает строки.
+        """
+        if self.content_hash:
+            return self.content_hash == self.compute_content_hash(prompt_content)
+        return self.prompt_content == prompt_content
+
+    @classmethod
+    def get_latest_if_identical(cls, prompt, prompt_content):
+        """
+        Возвращает последнюю версию промпта, если ее содержимое совпадает с переданным
+        (сравнение по хэшу), иначе None.
+
+        Более ранние версии с таким же содержимым не учитываются: генерация использует
+        последнюю версию, поэтому повторное создание старого содержимого - это откат,
+        и новая версия для него должна создаваться.
+
+        Args:
+            prompt: Экземпляр Prompt
+            prompt_content: Содержимое промпта
+        """
+        latest = cls.objects.filter(prompt=prompt).defer('prompt_content').order_by('-version_number').first()
+        if latest is not None and latest.has_same_content(prompt_content):
+            return latest
+        return None
+
     def get_generated_content_count(self):
         """
         Возвращает количество сгенерированного контента для данной версии промпта.
@@ -190,6 +278,8 @@ class PromptVersion(models.Model):
     def get_next_version_number_for_prompt(cls, prompt):
         """
         Класс-метод для получения следующего номера версии для конкретного промпта.
+        Номер не резервируется: для создания версий используйте create_next_version
+        или save_as_next_version.
         
         Args:
             prompt: Экземпляр Prompt
@@ -199,6 +289,71 @@ class PromptVersion(models.Model):
             return latest.version_number + 1
         return 1
 
+    @classmethod
+    def allocate_version_numbers(cls, prompt, count=1):
+        """
+        Атомарно выделяет count последовательных номеров версий для промпта.
+
+        Номера выделяются одним UPDATE счетчика Prompt.last_version_number через F(),
+        поэтому конкурентные вызовы никогда не получают одинаковых номеров.
+        Счетчик выравнивается по максимальному существующему номеру версии, так что
+        версии, созданные до появления счетчика или в обход него, учитываются.
+
+        Args:
+            prompt: Экземпляр Prompt
+            count: Количество номеров
+
+        Returns:
+            range: Выделенные номера версий
+        """
+        max_version_number = cls.objects.filter(
+            prompt_id=OuterRef('pk')
+        ).order_by().values('prompt_id').annotate(
+            max_number=Max('version_number')
+        ).values('max_number')
+
+        with transaction.atomic():
+            Prompt.objects.filter(pk=prompt.pk).update(
+                last_version_number=Greatest(
+                    F('last_version_number'),
+                    Coalesce(Subquery(max_version_number), 0),
+                ) + count
+            )
+            last_version_number = Prompt.objects.filter(pk=prompt.pk).values_list(
+                'last_version_number', flat=True
+            ).get()
+
+        prompt.last_version_number = last_version_number
+        return range(last_version_number - count + 1, last_version_number + 1)
+
+    def save_as_next_version(self, *args, **kwargs):
+        """
+        Сохраняет версию под новым номером, выделенным allocate_version_numbers.
+        При конфликте уникальности (номер занят версией, созданной в обход счетчика)
+        повторяет попытку с новым номером.
+        """
+        retries = getattr(settings, 'CONTENT_GENERATOR_VERSION_NUMBER_RETRIES', 5)
+        for attempt in range(retries):
+            try:
+                with transaction.atomic():
+                    self.version_number = self.allocate_version_numbers(self.prompt)[0]
+                    self.save(*args, **kwargs)
+                return self
+            except IntegrityError:
+                if attempt == retries - 1:
+                    raise
+
+    @classmethod
+    def create_next_version(cls, prompt, **fields):
+        """
+        Создает новую версию промпта со следующим номером версии.
+
+        Args:
+            prompt: Экземпляр Prompt
+            **fields: Значения остальных полей версии
+        """
+        return cls(prompt=prompt, **fields).save_as_next_version()
+
 
 # ========== ПОДСИСТЕМА GENERATION ==========
 
@@ -235,6 +390,28 @@ class Action(models.Model):
         related_name='generators',
         verbose_name='Промпт',
     )      
+    stable_version = models.ForeignKey(
+        PromptVersion,
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name='stable_for_actions',
+        verbose_name='Стабильная версия',
+        help_text='Версия промпта для основного трафика (по умолчанию - последняя версия промпта)',
+    )
+    candidate_version = models.ForeignKey(
+        PromptVersion,
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name='candidate_for_actions',
+        verbose_name='Версия-кандидат',
+        help_text='Версия промпта, получающая долю трафика для A/B-сравнения',
+    )
+    candidate_traffic_percent = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(100)],
+        verbose_name='Доля трафика кандидата, %',
+        help_text='Процент генераций, направляемых на версию-кандидат. Объект всегда попадает в одну и ту же группу',
+    )
 
     class Meta:
         verbose_name = 'Действие'
@@ -243,6 +420,22 @@ class Action(models.Model):
     def __str__(self):
         return f'{self.label} ({self.name})'
 
+    def clean(self):
+        """
+        Проверяет, что версии A/B-сравнения относятся к промпту действия.
+        """
+        from django.core.exceptions import ValidationError
+
+        errors = {}
+        for field_name in ('stable_version', 'candidate_version'):
+            version = getattr(self, field_name)
+            if version is not None and self.prompt_id and version.prompt_id != self.prompt_id:
+                errors[field_name] = 'Версия должна относиться к промпту действия.'
+        if self.candidate_traffic_percent and self.candidate_version is None:
+            errors['candidate_version'] = 'Укажите версию-кандидат или обнулите долю ее трафика.'
+        if errors:
+            raise ValidationError(errors)
+
 
 class ContentGenerator(models.Model):
     """
@@ -325,9 +518,16 @@ class GeneratedContent(models.Model):
         help_text='ID связанного объекта'
     )
     content_object = GenericForeignKey('content_type', 'object_id')
-    generated_data = models.JSONField(
+    action = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Действие',
+        help_text='Действие, для которого был сгенерирован контент (set_seo_params, set_description и т.д.)'
+    )
+    generated_data = CompressedJSONField(
         verbose_name='Сгенерированные данные',
-        help_text='Данные, сгенерированные AI'
+        help_text='Данные, сгенерированные AI (большие значения хранятся сжатыми zlib)'
     )
     status = models.CharField(
         max_length=20,
@@ -354,6 +554,31 @@ class GeneratedContent(models.Model):
         verbose_name='Рейтинг',
         help_text='Оценка качества сгенерированного контента (для будущей системы оценок)'
     )
+    published_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата публикации',
+        help_text='Дата и время применения сгенерированного контента к целевому объекту'
+    )
+    review_claimed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='claimed_generated_content',
+        verbose_name='Взят на проверку',
+        help_text='Пользователь, взявший запись из очереди проверки'
+    )
+    review_claimed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата взятия на проверку',
+        help_text='Дата и время, когда запись была выдана проверяющему (резерв истекает по таймауту)'
+    )
+
+    objects = models.Manager()
+    # Для списков и статистики: без сгенерированных данных
+    list_objects = DeferredFieldsManager('generated_data')
 
     class Meta:
         db_table = 'generated_content'
@@ -364,9 +589,123 @@ class GeneratedContent(models.Model):
             models.Index(fields=['content_type', 'object_id']),
             models.Index(fields=['created_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['status', 'published_at']),
+            # Частичный индекс очереди проверки: только непроверенный успешный контент
+            models.Index(
+                fields=['prompt_version', 'created_at'],
+                name='generated_content_review_idx',
+                condition=Q(status='SUCCESS', reviewed_at__isnull=True),
+            ),
         ]
 
     def __str__(self):
         content_type_name = self.content_type.model if self.content_type else 'Unknown'
         return f'GeneratedContent #{self.id} ({content_type_name}, статус: {self.get_status_display()})'
 
+
+
+class GeneratedContentArchive(models.Model):
+    """
+    Архив сгенерированного контента.
+    Сюда политика хранения (retention.py) переносит устаревшие записи GeneratedContent,
+    чтобы основная таблица и статистика по ней оставались компактными.
+    Данные хранятся сжатыми независимо от размера.
+    """
+    original_id = models.PositiveIntegerField(
+        unique=True,
+        verbose_name='ID исходной записи',
+        help_text='ID записи GeneratedContent до архивации'
+    )
+    prompt_version = models.ForeignKey(
+        'PromptVersion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_content',
+        verbose_name='Версия промпта',
+        help_text='Версия промпта, использованная для генерации'
+    )
+    ai_task_id = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        verbose_name='ID AI задачи',
+        help_text='ID задачи из ai_interface (без внешнего ключа: задачи могут удаляться)'
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name='Тип контента',
+        help_text='Тип связанного объекта (Product, Category и т.д.)'
+    )
+    object_id = models.PositiveIntegerField(
+        verbose_name='ID объекта',
+        help_text='ID связанного объекта'
+    )
+    action = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Действие',
+        help_text='Действие, для которого был сгенерирован контент'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=GeneratedContent.STATUS_CHOICES,
+        verbose_name='Статус генерации',
+        help_text='Статус записи на момент архивации'
+    )
+    generated_data = CompressedJSONField(
+        compress_min_length=0,
+        verbose_name='Сгенерированные данные',
+        help_text='Данные, сгенерированные AI (всегда хранятся сжатыми)'
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания',
+        help_text='Дата и время создания исходной записи'
+    )
+    published_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата публикации',
+        help_text='Дата и время применения контента к целевому объекту'
+    )
+    archived_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата архивации',
+        help_text='Дата и время переноса записи в архив'
+    )
+
+    objects = models.Manager()
+    list_objects = DeferredFieldsManager('generated_data')
+
+    class Meta:
+        db_table = 'generated_content_archive'
+        ordering = ['-created_at']
+        verbose_name = 'Архивный сгенерированный контент'
+        verbose_name_plural = 'Архив сгенерированного контента'
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['archived_at']),
+        ]
+
+    def __str__(self):
+        return f'GeneratedContentArchive #{self.original_id} ({self.get_status_display()})'
+
+    @classmethod
+    def from_generated_content(cls, generated_content: 'GeneratedContent') -> 'GeneratedContentArchive':
+        """
+        Создает (не сохраняя) архивную запись из записи GeneratedContent.
+        """
+        return cls(
+            original_id=generated_content.id,
+            prompt_version_id=generated_content.prompt_version_id,
+            ai_task_id=str(generated_content.ai_task_id or ''),
+            content_type_id=generated_content.content_type_id,
+            object_id=generated_content.object_id,
+            action=generated_content.action,
+            status=generated_content.status,
+            generated_data=generated_content.generated_data,
+            created_at=generated_content.created_at,
+            published_at=generated_content.published_at,
+        )
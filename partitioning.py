@@ -0,0 +1,352 @@
+"""
+Секционирование таблицы generated_content по created_at (только PostgreSQL).
+
+Таблица переводится в декларативное секционирование RANGE (created_at) с
+помесячными секциями generated_content_pYYYYMM. Запросы по свежему контенту
+с условием на created_at затрагивают одну-две секции, а старые месяцы можно
+отсоединить (DETACH) или удалить без долгого DELETE.
+
+Перевод выполняется один раз (convert_to_partitioned): существующая таблица
+переименовывается в generated_content_legacy и подключается как секция для
+всех данных до текущего месяца. Для вызова из миграции проекта:
+
+    migrations.RunPython(
+        lambda apps, schema_editor: convert_to_partitioned(schema_editor.connection),
+        migrations.RunPython.noop,
+    )
+
+Дальше секции обслуживаются командой manage_generated_content_partitions
+(например, ежедневно по cron). Ограничения секционированной таблицы:
+первичный ключ - (id, created_at), уникальность id обеспечивается только
+последовательностью; внешние ключи на generated_content невозможны.
+"""
+
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connection as default_connection, transaction
+
+from content_generator.models import GeneratedContent
+
+
+# Имя секционируемой таблицы
+PARTITIONED_TABLE = GeneratedContent._meta.db_table
+
+# Секция с данными, существовавшими до перевода таблицы
+LEGACY_PARTITION = f'{PARTITIONED_TABLE}_legacy'
+
+# Секция по умолчанию для строк вне созданных диапазонов
+DEFAULT_PARTITION = f'{PARTITIONED_TABLE}_default'
+
+# На сколько месяцев вперед создавать секции
+DEFAULT_MONTHS_AHEAD = 3
+
+# Индексы секционированной таблицы (повторяют Meta.indexes и индексы внешних ключей)
+PARTITIONED_INDEXES = (
+    ('content_type_id', 'object_id'),
+    ('created_at',),
+    ('status',),
+    ('status', 'published_at'),
+    ('prompt_version_id',),
+    ('ai_task_id',),
+    ('review_claimed_by_id',),
+)
+
+# Частичные индексы: (имя, столбцы, условие)
+PARTITIONED_PARTIAL_INDEXES = (
+    ('generated_content_review_part_idx', ('prompt_version_id', 'created_at'),
+     "status = 'SUCCESS' AND reviewed_at IS NULL"),
+)
+
+# Условие строк, которые политика хранения обещает сохранить (проверенные и оцененные):
+# секции с такими строками не удаляются
+PROTECTED_ROWS_CONDITION = "status = 'REVIEWED' OR reviewed_at IS NOT NULL OR rating IS NOT NULL"
+
+PARTITION_UPPER_BOUND_RE = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})")
+
+
+def is_postgresql(connection=None) -> bool:
+    """Проверяет, что используется PostgreSQL."""
+    connection = connection or default_connection
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(connection=None) -> bool:
+    """Проверяет, что generated_content уже является секционированной таблицей."""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = %s AND n.nspname = current_schema()",
+            [PARTITIONED_TABLE],
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def month_start(value: date) -> date:
+    """Возвращает первый день месяца."""
+    return value.replace(day=1)
+
+
+def add_months(value: date, months: int) -> date:
+    """Сдвигает первый день месяца на указанное количество месяцев."""
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_partition_name(month: date) -> str:
+    """Возвращает имя помесячной секции."""
+    return f'{PARTITIONED_TABLE}_p{month:%Y%m}'
+
+
+def _check_postgresql(connection) -> None:
+    if not is_postgresql(connection):
+        raise NotImplementedError('Секционирование generated_content поддерживается только для PostgreSQL')
+
+
+def convert_to_partitioned(connection=None, today: Optional[date] = None,
+                           months_ahead: int = DEFAULT_MONTHS_AHEAD) -> bool:
+    """
+    Переводит generated_content в секционированную по created_at таблицу.
+
+    Существующая таблица становится секцией generated_content_legacy для данных
+    до начала текущего месяца, создаются секции текущего месяца, months_ahead
+    следующих и секция по умолчанию. Последовательность id переносится на новую
+    таблицу. Выполняется в одной транзакции; при подключении старой таблицы
+    PostgreSQL проверяет ее строки, поэтому на больших таблицах операция
+    выполняется под блокировкой заметное время.
+
+    Returns:
+        False, если таблица уже секционирована, иначе True
+    """
+    connection = connection or default_connection
+    _check_postgresql(connection)
+    if is_partitioned(connection):
+        return False
+
+    current_month = month_start(today or date.today())
+    quote = connection.ops.quote_name
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [PARTITIONED_TABLE],
+        )
+        is_identity = cursor.fetchone()[0] != ''
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [PARTITIONED_TABLE, 'id'])
+        sequence_name = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {quote(PARTITIONED_TABLE)} RENAME TO {quote(LEGACY_PARTITION)}')
+        cursor.execute(
+            f'ALTER TABLE {quote(LEGACY_PARTITION)} '
+            f'RENAME CONSTRAINT {quote(PARTITIONED_TABLE + "_pkey")} TO {quote(LEGACY_PARTITION + "_pkey")}'
+        )
+        if is_identity:
+            # Секция не может иметь собственный identity-столбец: id будет
+            # заполняться обычной последовательностью секционированной таблицы
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {quote(LEGACY_PARTITION)}')
+            max_id = cursor.fetchone()[0]
+            cursor.execute(f'ALTER TABLE {quote(LEGACY_PARTITION)} ALTER COLUMN id DROP IDENTITY')
+
+        # Для serial-столбца значение по умолчанию (nextval) копируется вместе со структурой
+        cursor.execute(
+            f'CREATE TABLE {quote(PARTITIONED_TABLE)} '
+            f'(LIKE {quote(LEGACY_PARTITION)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(PARTITIONED_TABLE)} '
+            f'ADD CONSTRAINT {quote(PARTITIONED_TABLE + "_pkey")} PRIMARY KEY (id, created_at)'
+        )
+        if is_identity:
+            sequence_name = quote(f'{PARTITIONED_TABLE}_id_seq')
+            cursor.execute(f'CREATE SEQUENCE {sequence_name}')
+            if max_id:
+                cursor.execute('SELECT setval(%s, %s)', [sequence_name, max_id])
+            cursor.execute(
+                f'ALTER TABLE {quote(PARTITIONED_TABLE)} '
+                f"ALTER COLUMN id SET DEFAULT nextval('{sequence_name}')"
+            )
+        if sequence_name:
+            # Иначе последовательность удалится вместе с отсоединенной legacy-секцией
+            cursor.execute(f'ALTER SEQUENCE {sequence_name} OWNED BY {quote(PARTITIONED_TABLE)}.id')
+
+        for columns in PARTITIONED_INDEXES:
+            index_name = f'{PARTITIONED_TABLE}_{"_".join(columns)}_part_idx'
+            cursor.execute(
+                f'CREATE INDEX {quote(index_name)} ON {quote(PARTITIONED_TABLE)} '
+                f'({", ".join(quote(column) for column in columns)})'
+            )
+        for index_name, columns, condition in PARTITIONED_PARTIAL_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX {quote(index_name)} ON {quote(PARTITIONED_TABLE)} '
+                f'({", ".join(quote(column) for column in columns)}) WHERE {condition}'
+            )
+
+        cursor.execute(
+            f'ALTER TABLE {quote(PARTITIONED_TABLE)} ATTACH PARTITION {quote(LEGACY_PARTITION)} '
+            f"FOR VALUES FROM (MINVALUE) TO ('{current_month.isoformat()}')"
+        )
+        cursor.execute(
+            f'CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(PARTITIONED_TABLE)} DEFAULT'
+        )
+
+    create_monthly_partitions(connection, today=current_month, months_ahead=months_ahead)
+    return True
+
+
+def create_monthly_partitions(connection=None, today: Optional[date] = None,
+                              months_ahead: int = DEFAULT_MONTHS_AHEAD) -> List[str]:
+    """
+    Создает недостающие помесячные секции: текущий месяц и months_ahead следующих.
+
+    Если в секции по умолчанию уже есть строки из диапазона новой секции
+    (например, команда долго не запускалась), PostgreSQL не даст создать
+    секцию. Тогда секция создается отдельной таблицей, строки переносятся
+    в нее из секции по умолчанию, и она подключается к таблице - все в одной
+    транзакции.
+
+    Returns:
+        Список имен созданных секций
+    """
+    connection = connection or default_connection
+    _check_postgresql(connection)
+    quote = connection.ops.quote_name
+
+    existing = {name for name, _ in list_partitions(connection)}
+    current_month = month_start(today or date.today())
+
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(current_month, offset)
+            name = get_partition_name(month)
+            if name in existing:
+                continue
+            lower_bound, upper_bound = month.isoformat(), add_months(month, 1).isoformat()
+
+            if DEFAULT_PARTITION in existing and _has_rows_in_range(cursor, quote, DEFAULT_PARTITION,
+                                                                    lower_bound, upper_bound):
+                _create_partition_from_default(connection, cursor, quote, name, lower_bound, upper_bound)
+            else:
+                cursor.execute(
+                    f'CREATE TABLE {quote(name)} PARTITION OF {quote(PARTITIONED_TABLE)} '
+                    f"FOR VALUES FROM ('{lower_bound}') TO ('{upper_bound}')"
+                )
+            created.append(name)
+    return created
+
+
+def _has_rows_in_range(cursor, quote, table: str, lower_bound: str, upper_bound: str) -> bool:
+    """Проверяет, есть ли в таблице строки с created_at в диапазоне [lower_bound, upper_bound)."""
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {quote(table)} WHERE created_at >= %s AND created_at < %s)',
+        [lower_bound, upper_bound],
+    )
+    return cursor.fetchone()[0]
+
+
+def _create_partition_from_default(connection, cursor, quote, name: str,
+                                   lower_bound: str, upper_bound: str) -> None:
+    """
+    Создает секцию и переносит в нее строки ее диапазона из секции по умолчанию.
+    Индексы секционированной таблицы создаются PostgreSQL при подключении секции.
+    """
+    with transaction.atomic(using=connection.alias):
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} '
+            f'(LIKE {quote(PARTITIONED_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS ('
+            f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s RETURNING *'
+            f') INSERT INTO {quote(name)} SELECT * FROM moved',
+            [lower_bound, upper_bound],
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(PARTITIONED_TABLE)} ATTACH PARTITION {quote(name)} '
+            f"FOR VALUES FROM ('{lower_bound}') TO ('{upper_bound}')"
+        )
+
+
+def list_partitions(connection=None) -> List[Tuple[str, Optional[date]]]:
+    """
+    Возвращает секции generated_content и верхние границы их диапазонов.
+
+    Returns:
+        Список (имя секции, верхняя граница); для секции по умолчанию граница - None
+    """
+    connection = connection or default_connection
+    _check_postgresql(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_namespace n ON n.oid = parent.relnamespace "
+            "WHERE parent.relname = %s AND n.nspname = current_schema() "
+            "ORDER BY child.relname",
+            [PARTITIONED_TABLE],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_UPPER_BOUND_RE.search(bound or '')
+        partitions.append((name, date.fromisoformat(match.group(1)) if match else None))
+    return partitions
+
+
+def get_expired_partitions(partitions: List[Tuple[str, Optional[date]]], cutoff: date) -> List[str]:
+    """
+    Возвращает помесячные секции, все данные которых старше cutoff.
+    Секция по умолчанию и legacy-секция (все данные до перевода таблицы) не возвращаются.
+    """
+    return [
+        name for name, upper_bound in partitions
+        if upper_bound is not None and upper_bound <= cutoff and name not in (LEGACY_PARTITION, DEFAULT_PARTITION)
+    ]
+
+
+def _has_protected_rows(cursor, quote, partition: str) -> bool:
+    """Проверяет, есть ли в секции проверенные или оцененные строки."""
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(partition)} WHERE {PROTECTED_ROWS_CONDITION})')
+    return cursor.fetchone()[0]
+
+
+def detach_old_partitions(connection=None, keep_months: int = 12, today: Optional[date] = None,
+                          drop: bool = False) -> Dict[str, List[str]]:
+    """
+    Отсоединяет помесячные секции, все данные которых старше keep_months месяцев.
+
+    Отсоединенная секция остается обычной таблицей (ее можно выгрузить или
+    перенести в архив) либо удаляется при drop=True. Секция по умолчанию и
+    legacy-секция не затрагиваются. При drop=True секции с проверенными или
+    оцененными строками (их политика хранения сохраняет) не отсоединяются
+    и не удаляются.
+
+    Returns:
+        Словарь со списками имен секций: detached (отсоединенные или удаленные),
+        protected (оставлены из-за проверенных или оцененных строк)
+    """
+    connection = connection or default_connection
+    _check_postgresql(connection)
+    quote = connection.ops.quote_name
+
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    result = {'detached': [], 'protected': []}
+    with connection.cursor() as cursor:
+        for name in get_expired_partitions(list_partitions(connection), cutoff):
+            if drop and _has_protected_rows(cursor, quote, name):
+                result['protected'].append(name)
+                continue
+            with transaction.atomic(using=connection.alias):
+                cursor.execute(f'ALTER TABLE {quote(PARTITIONED_TABLE)} DETACH PARTITION {quote(name)}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {quote(name)}')
+            result['detached'].append(name)
+    return result
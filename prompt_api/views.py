@@ -5,18 +5,38 @@ API ViewSets для подсистемы Prompts.
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from content_generator.models import PromptVersion
+from content_generator.models import Prompt, PromptVersion, GeneratedContent
+from content_generator.review import (
+    claim_review_batch,
+    get_claimed_content,
+    get_review_queue,
+    release_review_claims,
+    submit_review,
+    submit_reviews_bulk,
+    DEFAULT_REVIEW_BATCH_SIZE,
+)
 from content_generator.serializers import (
+    BulkReviewSerializer,
+    GeneratedContentReviewSerializer,
+    ReviewSubmitSerializer,
     PromptVersionSerializer,
+    PromptVersionListSerializer,
     PromptVersionDetailSerializer,
     PromptVersionCreateSerializer,
     PromptVersionUpdateSerializer,
 )
-from content_generator.utils import compare_prompt_versions
+from content_generator.utils import (
+    compare_prompt_versions_cached,
+    export_prompts_jsonl,
+    import_prompts_jsonl,
+    get_prompt_version_list_queryset,
+)
 from content_generator.prompt_api.permissions import AdminOrEngineerPermission, AdminPermission
 
 
@@ -27,7 +47,7 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
     ViewSet для управления версиями промптов.
     
     Предоставляет следующие операции:
-    - list: список всех версий промптов
+    - list: список всех версий промптов (превью вместо полного текста)
     - retrieve: детальный просмотр версии с статистикой
     - create: создание новой версии
     - update: обновление версии (с умным версионированием)
@@ -35,14 +55,26 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
     - destroy: удаление версии (только для admin)
     - clone: клонирование версии
     - compare: сравнение двух версий
+    - export: экспорт промптов и версий в JSON Lines
+    - import_jsonl: импорт промптов и версий из JSON Lines (только для admin)
     """
     queryset = PromptVersion.objects.all().order_by('-version_number')
     permission_classes = [IsAuthenticated, AdminOrEngineerPermission]
     
+    def get_queryset(self):
+        """
+        Для списка возвращает queryset без полного текста промпта, с превью и статистикой.
+        """
+        if self.action == 'list':
+            return get_prompt_version_list_queryset().order_by('-version_number')
+        return super().get_queryset()
+    
     def get_serializer_class(self):
         """
         Возвращает соответствующий сериализатор в зависимости от действия.
         """
+        if self.action == 'list':
+            return PromptVersionListSerializer
         if self.action == 'retrieve':
             return PromptVersionDetailSerializer
         elif self.action == 'create':
@@ -55,12 +87,34 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
         """
         Настраивает права доступа в зависимости от действия.
         """
-        if self.action == 'destroy':
-            # Удаление доступно только администраторам
+        if self.action in ['destroy', 'import_jsonl']:
+            # Удаление и массовый импорт доступны только администраторам
             return [IsAuthenticated(), AdminPermission()]
         # Остальные действия доступны admin или engineer
         return [IsAuthenticated(), AdminOrEngineerPermission()]
     
+    def create(self, request, *args, **kwargs):
+        """
+        Создает новую версию промпта.
+        Если последняя версия промпта уже содержит такой текст, новая версия не создается:
+        возвращается последняя версия с кодом 200.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        prompt = Prompt.objects.filter(id=serializer.validated_data['prompt_id']).first()
+        if prompt is not None:
+            latest_version = PromptVersion.get_latest_if_identical(
+                prompt,
+                serializer.validated_data.get('prompt_content'),
+            )
+            if latest_version:
+                return Response(PromptVersionDetailSerializer(latest_version).data, status=status.HTTP_200_OK)
+
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
     def perform_create(self, serializer):
         """
         Создает новую версию промпта.
@@ -99,13 +153,21 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
         """
         Клонирует версию промпта.
         Создает новую версию с копией содержимого и автоматически генерирует описание.
+        Если последняя версия промпта уже содержит такой текст, возвращает ее (код 200);
+        клон более старой версии создается - это откат к ней.
         
         POST /api/prompt-versions/<id>/clone/
         """
         original_version = self.get_object()
         
-        # Генерируем номер новой версии для того же промпта
-        new_version_number = PromptVersion.get_next_version_number_for_prompt(original_version.prompt)
+        # Если последняя версия промпта уже содержит такой текст, возвращаем ее вместо дубликата
+        latest_version = PromptVersion.get_latest_if_identical(
+            original_version.prompt,
+            original_version.prompt_content,
+        )
+        if latest_version:
+            serializer = PromptVersionDetailSerializer(latest_version)
+            return Response(serializer.data, status=status.HTTP_200_OK)
         
         # Создаем описание для клона
         clone_description = f'Клон версии {original_version.version_number}: {original_version.description}'
@@ -114,10 +176,9 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
         user = request.user
         engineer_name = user.get_full_name() or user.username
         
-        # Создаем новую версию с копией содержимого
-        cloned_version = PromptVersion.objects.create(
+        # Создаем новую версию с копией содержимого и следующим номером для того же промпта
+        cloned_version = PromptVersion.create_next_version(
             prompt=original_version.prompt,
-            version_number=new_version_number,
             description=clone_description,
             prompt_content=original_version.prompt_content,
             engineer_name=engineer_name,
@@ -146,11 +207,8 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
         version1 = get_object_or_404(PromptVersion, pk=id1)
         version2 = get_object_or_404(PromptVersion, pk=id2)
         
-        # Выполняем сравнение
-        comparison_result = compare_prompt_versions(
-            version1.prompt_content,
-            version2.prompt_content
-        )
+        # Выполняем сравнение (результат кэшируется по хэшам содержимого)
+        comparison_result = compare_prompt_versions_cached(version1, version2)
         
         # Получаем режим отображения из GET параметров
         display_mode = request.GET.get('mode', 'side-by-side')
@@ -171,3 +229,173 @@ class PromptVersionViewSet(viewsets.ModelViewSet):
             'display_mode': display_mode,
         })
 
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Экспортирует промпты и их версии потоком JSON Lines.
+        
+        GET /api/prompt-versions/export/
+        
+        Параметры:
+        - prompt_id (optional, можно несколько): ID промптов для экспорта (по умолчанию - все)
+        """
+        prompts = Prompt.objects.all()
+        prompt_ids = [prompt_id for prompt_id in request.GET.getlist('prompt_id') if prompt_id.isdigit()]
+        if prompt_ids:
+            prompts = prompts.filter(id__in=prompt_ids)
+
+        response = StreamingHttpResponse(
+            (line + '\n' for line in export_prompts_jsonl(prompts)),
+            content_type='application/x-ndjson; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename="prompts.jsonl"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_jsonl(self, request):
+        """
+        Импортирует промпты и их версии из JSON Lines.
+        Версии с уже существующим содержимым пропускаются.
+        
+        POST /api/prompt-versions/import/
+        
+        Принимает файл в поле file (multipart/form-data) или JSON Lines в теле запроса.
+        """
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if not upload:
+                return Response(
+                    {'error': 'Не передан файл в поле file.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            lines = upload
+        else:
+            lines = request.body.decode('utf-8').splitlines()
+
+        try:
+            stats = import_prompts_jsonl(lines)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class ReviewQueueViewSet(viewsets.GenericViewSet):
+    """
+    ViewSet очереди проверки сгенерированного контента.
+    
+    Предоставляет следующие операции:
+    - list: записи, зарезервированные текущим пользователем, и размер очереди
+    - claim: выдача следующей пачки непроверенных записей
+    - review: отметка записи проверенной с оценкой
+    - bulk: пакетная проверка и оценка записей одним запросом
+    - release: возврат зарезервированных записей в очередь
+    
+    Параметр prompt_version (optional) ограничивает очередь одной версией промпта.
+    """
+    queryset = GeneratedContent.objects.all()
+    serializer_class = GeneratedContentReviewSerializer
+    permission_classes = [IsAuthenticated, AdminOrEngineerPermission]
+    
+    def get_prompt_version(self, request):
+        """
+        Возвращает версию промпта из параметра prompt_version или None.
+        """
+        prompt_version_id = request.query_params.get('prompt_version') or request.data.get('prompt_version')
+        if not prompt_version_id:
+            return None
+        try:
+            prompt_version_id = int(prompt_version_id)
+        except (TypeError, ValueError):
+            raise ValidationError({'prompt_version': 'ID версии промпта должен быть целым числом'})
+        return get_object_or_404(PromptVersion, pk=prompt_version_id)
+    
+    def list(self, request):
+        """
+        Возвращает записи, зарезервированные текущим пользователем, и размер очереди.
+        
+        GET /api/review-queue/
+        """
+        prompt_version = self.get_prompt_version(request)
+        claimed = get_claimed_content(request.user, prompt_version).select_related('content_type', 'prompt_version')
+        return Response({
+            'claimed': self.get_serializer(claimed, many=True).data,
+            'queue_size': get_review_queue(prompt_version).count(),
+        })
+    
+    @action(detail=False, methods=['post'], url_path='claim')
+    def claim(self, request):
+        """
+        Выдает текущему пользователю следующую пачку записей на проверку.
+        
+        POST /api/review-queue/claim/
+        
+        Параметры:
+        - prompt_version (optional): ID версии промпта
+        - batch_size (optional): размер пачки (по умолчанию 10, максимум 100)
+        """
+        prompt_version = self.get_prompt_version(request)
+        try:
+            batch_size = int(request.data.get('batch_size', DEFAULT_REVIEW_BATCH_SIZE))
+        except (TypeError, ValueError):
+            return Response({'error': 'batch_size должен быть целым числом'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        contents = claim_review_batch(request.user, prompt_version, batch_size)
+        return Response({'results': self.get_serializer(contents, many=True).data})
+    
+    @action(detail=True, methods=['post'], url_path='review')
+    def review(self, request, pk=None):
+        """
+        Отмечает запись проверенной.
+        
+        POST /api/review-queue/<id>/review/
+        
+        Параметры:
+        - rating (optional): оценка от 1 до 5
+        """
+        serializer = ReviewSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            content = submit_review(pk, request.user, serializer.validated_data.get('rating'))
+        except GeneratedContent.DoesNotExist:
+            return Response({'error': 'Запись не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'id': content.id, 'status': content.status, 'rating': content.rating})
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Пакетно отмечает записи проверенными и сохраняет оценки.
+        Все изменения сохраняются одним bulk_update.
+        
+        POST /api/review-queue/bulk/
+        
+        Тело запроса: {"items": [{"id": 1, "rating": 5}, {"id": 2, "rating": null}, ...]}
+        
+        Возвращает списки ID: updated, skipped (записи проверяет другой пользователь),
+        not_reviewable (неудачные и незавершенные генерации), not_found
+        """
+        serializer = BulkReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(item['id'], item.get('rating')) for item in serializer.validated_data['items']]
+        return Response(submit_reviews_bulk(items, request.user))
+    
+    @action(detail=False, methods=['post'], url_path='release')
+    def release(self, request):
+        """
+        Возвращает зарезервированные текущим пользователем записи в очередь.
+        
+        POST /api/review-queue/release/
+        
+        Параметры:
+        - ids (optional): список ID записей (по умолчанию - все резервы пользователя)
+        """
+        content_ids = request.data.get('ids')
+        if content_ids is not None and (
+            not isinstance(content_ids, list)
+            or not all(isinstance(content_id, int) for content_id in content_ids)
+        ):
+            return Response({'error': 'ids должен быть списком целых чисел'}, status=status.HTTP_400_BAD_REQUEST)
+        released = release_review_claims(request.user, content_ids)
+        return Response({'released': released})
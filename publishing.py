@@ -0,0 +1,251 @@
+"""
+Публикация сгенерированного контента.
+
+Применяет успешные результаты генерации (GeneratedContent) к целевым объектам
+и их SEOParameters пакетно: через bulk_update/bulk_create, чанками, внутри транзакций.
+В отличие от set_*_of_model в utils.py не вызывает save() целевых моделей,
+поэтому сигналы моделей магазина при массовой публикации не срабатывают.
+"""
+
+from typing import Dict, Any, Iterable, List, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+
+from content_generator.models import GeneratedContent
+
+
+# Статусы GeneratedContent, результаты которых можно публиковать
+PUBLISHABLE_STATUSES = ('SUCCESS', 'REVIEWED')
+
+# Размер чанка по умолчанию
+DEFAULT_PUBLISH_BATCH_SIZE = 500
+
+# Маппинг действий на поля целевых объектов.
+# Формат: {поле модели или SEOParameters: ключ в generated_data}.
+# Повторяет семантику set_*_of_model из utils.py.
+PUBLISH_FIELDS_BY_ACTION = {
+    'set_seo_params': {
+        'model': {},
+        'seo': {'title': 'title', 'description': 'description'},
+    },
+    'set_description': {
+        'model': {'description': 'description_html'},
+        'seo': {},
+    },
+    'upgrade_name': {
+        'model': {'name': 'new_name'},
+        'seo': {},
+    },
+    'set_some_params': {
+        'model': {'description': 'description', 'name': 'new_name'},
+        'seo': {'title': 'title', 'description': 'description'},
+    },
+}
+
+
+def get_publishable_content(queryset: Optional[QuerySet] = None) -> QuerySet:
+    """
+    Возвращает queryset успешного, еще не опубликованного контента.
+
+    Args:
+        queryset: Исходный queryset GeneratedContent (по умолчанию - все записи)
+    """
+    if queryset is None:
+        queryset = GeneratedContent.objects.all()
+    return queryset.filter(
+        status__in=PUBLISHABLE_STATUSES,
+        published_at__isnull=True,
+    )
+
+
+def get_content_action(generated_content: GeneratedContent) -> str:
+    """
+    Возвращает действие, для которого был сгенерирован контент.
+    Для старых записей без поля action берет его из context_data задачи.
+    """
+    if generated_content.action:
+        return generated_content.action
+    if generated_content.ai_task_id and generated_content.ai_task:
+        return (generated_content.ai_task.context_data or {}).get('action', '')
+    return ''
+
+
+def _chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    """Разбивает список на чанки заданного размера."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _skip_content(content: GeneratedContent, reason: str, stats: Dict[str, Any]) -> None:
+    """Учитывает пропущенную запись и причину пропуска в статистике."""
+    stats['skipped'] += 1
+    stats['skipped_ids'].append(content.id)
+    stats['skipped_reasons'][reason] = stats['skipped_reasons'].get(reason, 0) + 1
+
+
+def _publish_content_type_group(content_type_id: int, contents: List[GeneratedContent],
+                                batch_size: int, stats: Dict[str, Any]) -> List[int]:
+    """
+    Публикует группу GeneratedContent одного типа контента.
+
+    Returns:
+        Список ID опубликованных записей GeneratedContent
+    """
+    Model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if Model is None:
+        for content in contents:
+            _skip_content(content, 'unknown_model', stats)
+        return []
+
+    objects = Model._default_manager.in_bulk({content.object_id for content in contents})
+
+    changed_objects = {}
+    changed_fields = set()
+    seo_values = {}
+    published_ids = []
+
+    # Контент применяется в порядке создания, более поздний результат перекрывает ранний
+    for content in sorted(contents, key=lambda item: (item.created_at, item.id)):
+        mapping = PUBLISH_FIELDS_BY_ACTION.get(get_content_action(content))
+        data = content.generated_data
+        obj = objects.get(content.object_id)
+        if not mapping:
+            _skip_content(content, 'unknown_action', stats)
+            continue
+        if not isinstance(data, dict):
+            _skip_content(content, 'invalid_data', stats)
+            continue
+        if obj is None:
+            _skip_content(content, 'object_not_found', stats)
+            continue
+
+        for field_name, data_key in mapping['model'].items():
+            if data_key in data and data[data_key] is not None and hasattr(obj, field_name):
+                setattr(obj, field_name, data[data_key])
+                changed_fields.add(field_name)
+                changed_objects[obj.pk] = obj
+
+        for field_name, data_key in mapping['seo'].items():
+            if data_key in data:
+                seo_values.setdefault(obj.pk, {})[field_name] = data[data_key]
+
+        published_ids.append(content.id)
+
+    if changed_objects:
+        Model._default_manager.bulk_update(
+            list(changed_objects.values()),
+            fields=sorted(changed_fields),
+            batch_size=batch_size,
+        )
+        stats['objects_updated'] += len(changed_objects)
+
+    if seo_values:
+        _publish_seo_parameters(content_type_id, seo_values, batch_size, stats)
+
+    return published_ids
+
+
+def _publish_seo_parameters(content_type_id: int, seo_values: Dict[int, Dict[str, Any]],
+                            batch_size: int, stats: Dict[str, Any]) -> None:
+    """
+    Обновляет существующие SEOParameters и создает недостающие одним bulk-запросом на чанк.
+    """
+    SEOParameters = apps.get_model('seo_parameters', 'SEOParameters')
+
+    existing = {
+        seo_parameters.object_id: seo_parameters
+        for seo_parameters in SEOParameters.objects.filter(
+            content_type_id=content_type_id,
+            object_id__in=list(seo_values.keys()),
+        )
+    }
+
+    to_update = []
+    to_create = []
+    update_fields = set()
+    for object_id, values in seo_values.items():
+        seo_parameters = existing.get(object_id)
+        if seo_parameters is None:
+            to_create.append(SEOParameters(
+                content_type_id=content_type_id,
+                object_id=object_id,
+                **values
+            ))
+            continue
+        for field_name, value in values.items():
+            setattr(seo_parameters, field_name, value)
+            update_fields.add(field_name)
+        to_update.append(seo_parameters)
+
+    if to_update:
+        SEOParameters.objects.bulk_update(to_update, fields=sorted(update_fields), batch_size=batch_size)
+        stats['seo_updated'] += len(to_update)
+    if to_create:
+        SEOParameters.objects.bulk_create(to_create, batch_size=batch_size)
+        stats['seo_created'] += len(to_create)
+
+
+def publish_generated_content(queryset: Optional[QuerySet] = None,
+                              batch_size: int = DEFAULT_PUBLISH_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Пакетно применяет успешный сгенерированный контент к целевым объектам.
+
+    Обрабатывает записи чанками по batch_size: каждый чанк публикуется в отдельной
+    транзакции, поля целевых моделей обновляются через bulk_update, SEOParameters -
+    через bulk_update/bulk_create. Опубликованные записи помечаются published_at.
+    Записи с неизвестным действием или моделью, некорректными данными или без
+    целевого объекта пропускаются и остаются неопубликованными; их ID и причины
+    пропуска возвращаются в статистике.
+
+    Args:
+        queryset: queryset GeneratedContent для публикации (по умолчанию - весь
+            успешный неопубликованный контент)
+        batch_size: Размер чанка
+
+    Returns:
+        Словарь со статистикой: published, skipped, skipped_ids,
+        skipped_reasons ({причина: количество}), objects_updated, seo_updated, seo_created
+    """
+    stats = {
+        'published': 0,
+        'skipped': 0,
+        'skipped_ids': [],
+        'skipped_reasons': {},
+        'objects_updated': 0,
+        'seo_updated': 0,
+        'seo_created': 0,
+    }
+
+    content_ids = list(
+        get_publishable_content(queryset).order_by('id').values_list('id', flat=True)
+    )
+
+    for chunk_ids in _chunks(content_ids, batch_size):
+        with transaction.atomic():
+            contents = list(
+                get_publishable_content()
+                .filter(id__in=chunk_ids)
+                .select_related('ai_task')
+            )
+
+            groups = {}
+            for content in contents:
+                groups.setdefault(content.content_type_id, []).append(content)
+
+            published_ids = []
+            for content_type_id, group in groups.items():
+                published_ids.extend(
+                    _publish_content_type_group(content_type_id, group, batch_size, stats)
+                )
+
+            if published_ids:
+                stats['published'] += GeneratedContent.objects.filter(
+                    id__in=published_ids,
+                    published_at__isnull=True,
+                ).update(published_at=timezone.now())
+
+    return stats
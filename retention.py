@@ -0,0 +1,235 @@
+"""
+Политика хранения сгенерированного контента.
+
+Каждая генерация добавляет строку в generated_content, поэтому таблица растет
+без ограничений. Политика оставляет в основной таблице последние N записей
+по каждой паре (объект, действие), а также всё проверенное, оцененное
+и незавершенное; остальное переносится в GeneratedContentArchive чанками,
+каждый чанк - в отдельной транзакции. Более старый неопубликованный успешный
+контент архивируется, если не включена настройка
+CONTENT_GENERATOR_RETENTION_KEEP_UNPUBLISHED.
+
+Отбор выполняется в SQL пачками объектов: сначала находятся объекты, у которых
+записей больше N, затем для пачки таких объектов ROW_NUMBER считается в
+подзапросе, и в Python возвращаются только ID записей для архивации.
+
+Статистика версий промптов (get_prompt_statistics, аннотации списков) считается
+по основной таблице: после архивации generated_count уменьшается, рейтинги
+и проверки сохраняются, так как оцененные записи не архивируются.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, QuerySet, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from content_generator.models import GeneratedContent, GeneratedContentArchive
+from content_generator.utils import get_prompt_statistics_cache_key
+
+
+# Сколько последних записей хранить по каждой паре (объект, действие)
+RETENTION_KEEP_LATEST = getattr(settings, 'CONTENT_GENERATOR_RETENTION_KEEP_LATEST', 3)
+
+# Хранить ли неопубликованный успешный контент сверх последних N записей.
+# По умолчанию такие записи вытесняются новыми генерациями и архивируются:
+# published_at заполняет только publish_generated_content
+RETENTION_KEEP_UNPUBLISHED = getattr(settings, 'CONTENT_GENERATOR_RETENTION_KEEP_UNPUBLISHED', False)
+
+# Размер чанка по умолчанию
+DEFAULT_ARCHIVE_BATCH_SIZE = 500
+
+# Статусы незавершенных генераций: такие записи не архивируются
+IN_PROGRESS_STATUSES = ('PENDING', 'PROCESSING')
+
+
+def _chunks(items: List[int], size: int) -> Iterable[List[int]]:
+    """Разбивает список на чанки заданного размера."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _exclude_retained(queryset: QuerySet, keep_unpublished: bool) -> QuerySet:
+    """
+    Исключает из queryset'а записи, которые политика хранения не архивирует:
+    проверенные, оцененные, незавершенные и, при keep_unpublished,
+    неопубликованный успешный контент.
+    """
+    queryset = queryset.filter(
+        reviewed_at__isnull=True,
+        rating__isnull=True,
+    ).exclude(
+        status__in=IN_PROGRESS_STATUSES,
+    )
+    if keep_unpublished:
+        queryset = queryset.exclude(status='SUCCESS', published_at__isnull=True)
+    return queryset
+
+
+def _get_ranked_ids_sql(queryset: QuerySet, keep_latest: int) -> RawSQL:
+    """
+    Возвращает подзапрос ID записей queryset'а с номером больше keep_latest.
+    Записи нумеруются оконной функцией ROW_NUMBER в разрезе
+    (content_type, object_id, action) от новых к старым.
+    """
+    ranked = queryset.order_by().annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('content_type_id'), F('object_id'), F('action')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        )
+    ).values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    quote_name = connection.ops.quote_name
+    return RawSQL(
+        f'SELECT {quote_name("ranked")}.{quote_name("id")} FROM ({sql}) {quote_name("ranked")} '
+        f'WHERE {quote_name("ranked")}.{quote_name("row_number")} > %s',
+        (*params, keep_latest),
+    )
+
+
+def iter_archivable_content_ids(queryset: Optional[QuerySet] = None,
+                                keep_latest: Optional[int] = None,
+                                older_than: Optional[datetime] = None,
+                                batch_size: int = DEFAULT_ARCHIVE_BATCH_SIZE,
+                                keep_unpublished: Optional[bool] = None) -> Iterator[List[int]]:
+    """
+    Возвращает пачки ID записей GeneratedContent, которые политика хранения
+    переносит в архив.
+
+    Объекты, у которых записей не больше keep_latest, отсекаются агрегатным
+    запросом. Для пачки из batch_size остальных объектов записи нумеруются
+    в подзапросе, и в архив попадают записи с номером больше keep_latest,
+    если они не проверены, не оценены и не находятся в процессе генерации.
+
+    Args:
+        queryset: Исходный queryset GeneratedContent (по умолчанию - все записи)
+        keep_latest: Сколько последних записей хранить на пару (объект, действие)
+        older_than: Архивировать только записи, созданные раньше этой даты
+        batch_size: Количество объектов в пачке
+        keep_unpublished: Не архивировать неопубликованный успешный контент
+            (по умолчанию RETENTION_KEEP_UNPUBLISHED)
+    """
+    if queryset is None:
+        queryset = GeneratedContent.objects.all()
+    if keep_latest is None:
+        keep_latest = RETENTION_KEEP_LATEST
+    if keep_unpublished is None:
+        keep_unpublished = RETENTION_KEEP_UNPUBLISHED
+
+    # Объекты, у которых больше keep_latest записей (по всем действиям)
+    over_limit = queryset.order_by().values('content_type_id', 'object_id').annotate(
+        total=Count('id')
+    ).filter(total__gt=keep_latest)
+
+    content_type_ids = list(
+        over_limit.order_by('content_type_id').values_list('content_type_id', flat=True).distinct()
+    )
+    for content_type_id in content_type_ids:
+        last_object_id = -1
+        while True:
+            object_ids = list(
+                over_limit.filter(content_type_id=content_type_id, object_id__gt=last_object_id)
+                .order_by('object_id')
+                .values_list('object_id', flat=True)[:batch_size]
+            )
+            if not object_ids:
+                break
+            last_object_id = object_ids[-1]
+
+            objects_queryset = queryset.filter(content_type_id=content_type_id, object_id__in=object_ids)
+            candidates = _exclude_retained(
+                GeneratedContent.objects.filter(id__in=_get_ranked_ids_sql(objects_queryset, keep_latest)),
+                keep_unpublished,
+            )
+            if older_than is not None:
+                candidates = candidates.filter(created_at__lt=older_than)
+
+            content_ids = list(candidates.order_by('id').values_list('id', flat=True))
+            if content_ids:
+                yield content_ids
+
+
+def get_archivable_content_ids(queryset: Optional[QuerySet] = None,
+                               keep_latest: Optional[int] = None,
+                               older_than: Optional[datetime] = None,
+                               keep_unpublished: Optional[bool] = None) -> List[int]:
+    """
+    Возвращает отсортированный список ID записей GeneratedContent, которые
+    политика хранения переносит в архив (см. iter_archivable_content_ids).
+    """
+    content_ids = []
+    for batch_ids in iter_archivable_content_ids(queryset, keep_latest, older_than,
+                                                 keep_unpublished=keep_unpublished):
+        content_ids.extend(batch_ids)
+    content_ids.sort()
+    return content_ids
+
+
+def archive_generated_content(queryset: Optional[QuerySet] = None,
+                              keep_latest: Optional[int] = None,
+                              older_than: Optional[datetime] = None,
+                              batch_size: int = DEFAULT_ARCHIVE_BATCH_SIZE,
+                              keep_unpublished: Optional[bool] = None) -> Dict[str, int]:
+    """
+    Переносит устаревший сгенерированный контент в GeneratedContentArchive.
+
+    Кандидаты отбираются пачками объектов (iter_archivable_content_ids), каждый
+    чанк обрабатывается в отдельной транзакции: архивные записи создаются
+    через bulk_create, исходные удаляются одним запросом. Кэш статистики
+    затронутых версий промптов сбрасывается.
+
+    Args:
+        queryset: queryset GeneratedContent, к которому применяется политика
+        keep_latest: Сколько последних записей хранить на пару (объект, действие)
+        older_than: Архивировать только записи, созданные раньше этой даты
+        batch_size: Размер чанка
+        keep_unpublished: Не архивировать неопубликованный успешный контент
+            (по умолчанию RETENTION_KEEP_UNPUBLISHED)
+
+    Returns:
+        Словарь со статистикой: candidates, archived
+    """
+    if keep_unpublished is None:
+        keep_unpublished = RETENTION_KEEP_UNPUBLISHED
+    stats = {
+        'candidates': 0,
+        'archived': 0,
+    }
+
+    for batch_ids in iter_archivable_content_ids(queryset, keep_latest, older_than, batch_size, keep_unpublished):
+        stats['candidates'] += len(batch_ids)
+        for chunk_ids in _chunks(batch_ids, batch_size):
+            _archive_chunk(chunk_ids, batch_size, stats, keep_unpublished)
+
+    return stats
+
+
+def _archive_chunk(chunk_ids: List[int], batch_size: int, stats: Dict[str, int],
+                   keep_unpublished: bool) -> None:
+    """
+    Переносит чанк записей в архив в одной транзакции.
+    Условия политики перепроверяются под блокировкой строк.
+    """
+    with transaction.atomic():
+        contents = list(_exclude_retained(
+            GeneratedContent.objects.select_for_update().filter(id__in=chunk_ids),
+            keep_unpublished,
+        ))
+        if not contents:
+            return
+
+        GeneratedContentArchive.objects.bulk_create(
+            [GeneratedContentArchive.from_generated_content(content) for content in contents],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        GeneratedContent.objects.filter(id__in=[content.id for content in contents]).delete()
+        stats['archived'] += len(contents)
+
+        prompt_version_ids = {content.prompt_version_id for content in contents if content.prompt_version_id}
+        cache.delete_many([get_prompt_statistics_cache_key(version_id) for version_id in prompt_version_ids])
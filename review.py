@@ -0,0 +1,304 @@
+"""
+Очередь проверки сгенерированного контента.
+
+Проверяющим выдаются пачки непроверенного успешного контента (по версии промпта
+или из общей очереди). Выдача идет через SELECT ... FOR UPDATE SKIP LOCKED:
+параллельные запросы пропускают строки, которые в этот момент резервирует
+другой проверяющий, и не ждут друг друга. Выданные записи помечаются
+review_claimed_by/review_claimed_at; резерв истекает через REVIEW_CLAIM_TTL,
+после чего брошенные записи возвращаются в очередь.
+
+Выборка очереди опирается на частичный индекс generated_content_review_idx
+(prompt_version, created_at) WHERE status = 'SUCCESS' AND reviewed_at IS NULL.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from content_generator.models import GeneratedContent, PromptVersion
+from content_generator.utils import apply_prompt_statistics_delta
+
+
+# Время резерва выданной записи, секунды
+REVIEW_CLAIM_TTL = getattr(settings, 'CONTENT_GENERATOR_REVIEW_CLAIM_TTL', 30 * 60)
+
+# Размер пачки по умолчанию
+DEFAULT_REVIEW_BATCH_SIZE = 10
+
+# Максимальный размер пачки
+MAX_REVIEW_BATCH_SIZE = 100
+
+# Максимальное количество записей в одном пакетном запросе проверки
+MAX_BULK_REVIEW_ITEMS = 1000
+
+# Поля, которые изменяет проверка
+REVIEW_UPDATE_FIELDS = ['reviewed_at', 'rating', 'status', 'review_claimed_by', 'review_claimed_at']
+
+# Статусы записей, которые можно проверить (REVIEWED - повторная оценка)
+REVIEWABLE_STATUSES = ('SUCCESS', 'REVIEWED')
+
+# Допустимые оценки
+MIN_RATING = 1
+MAX_RATING = 5
+
+
+def _claim_expired_before(now: Optional[datetime] = None) -> datetime:
+    """Возвращает момент, раньше которого резервы считаются истекшими."""
+    return (now or timezone.now()) - timedelta(seconds=REVIEW_CLAIM_TTL)
+
+
+def get_review_queue(prompt_version: Optional[PromptVersion] = None,
+                     now: Optional[datetime] = None) -> QuerySet:
+    """
+    Возвращает queryset записей, доступных для выдачи на проверку:
+    успешный непроверенный контент без действующего резерва, от старых к новым.
+
+    Args:
+        prompt_version: Версия промпта (по умолчанию - все версии)
+        now: Текущее время (для расчета истекших резервов)
+    """
+    queryset = GeneratedContent.objects.filter(
+        status='SUCCESS',
+        reviewed_at__isnull=True,
+    ).filter(
+        Q(review_claimed_at__isnull=True) | Q(review_claimed_at__lt=_claim_expired_before(now))
+    )
+    if prompt_version is not None:
+        queryset = queryset.filter(prompt_version=prompt_version)
+    return queryset.order_by('created_at', 'id')
+
+
+def get_claimed_content(user, prompt_version: Optional[PromptVersion] = None,
+                        now: Optional[datetime] = None) -> QuerySet:
+    """
+    Возвращает записи, зарезервированные пользователем и еще не проверенные.
+    """
+    queryset = GeneratedContent.objects.filter(
+        review_claimed_by=user,
+        review_claimed_at__gte=_claim_expired_before(now),
+        reviewed_at__isnull=True,
+    )
+    if prompt_version is not None:
+        queryset = queryset.filter(prompt_version=prompt_version)
+    return queryset.order_by('created_at', 'id')
+
+
+def claim_review_batch(user, prompt_version: Optional[PromptVersion] = None,
+                       batch_size: int = DEFAULT_REVIEW_BATCH_SIZE) -> List[GeneratedContent]:
+    """
+    Выдает пользователю пачку записей на проверку.
+
+    Сначала возвращаются уже зарезервированные пользователем записи (например,
+    после перезагрузки страницы), пачка дополняется из очереди. Записи из очереди
+    блокируются с SKIP LOCKED и резервируются одним UPDATE в той же транзакции,
+    поэтому одна запись не выдается двум проверяющим.
+
+    Args:
+        user: Проверяющий
+        prompt_version: Версия промпта (по умолчанию - общая очередь)
+        batch_size: Размер пачки (не больше MAX_REVIEW_BATCH_SIZE)
+
+    Returns:
+        Список GeneratedContent от старых к новым
+    """
+    batch_size = max(1, min(batch_size, MAX_REVIEW_BATCH_SIZE))
+    now = timezone.now()
+
+    content_ids = list(
+        get_claimed_content(user, prompt_version, now).values_list('id', flat=True)[:batch_size]
+    )
+
+    if len(content_ids) < batch_size:
+        with transaction.atomic():
+            new_ids = list(
+                get_review_queue(prompt_version, now)
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:batch_size - len(content_ids)]
+            )
+            if new_ids:
+                GeneratedContent.objects.filter(id__in=new_ids).update(
+                    review_claimed_by=user,
+                    review_claimed_at=now,
+                )
+        content_ids.extend(new_ids)
+
+    return list(
+        GeneratedContent.objects.filter(id__in=content_ids)
+        .select_related('content_type', 'prompt_version')
+        .order_by('created_at', 'id')
+    )
+
+
+def release_review_claims(user, content_ids: Optional[List[int]] = None) -> int:
+    """
+    Возвращает зарезервированные пользователем записи в очередь.
+
+    Args:
+        user: Проверяющий
+        content_ids: ID записей (по умолчанию - все непроверенные записи пользователя)
+
+    Returns:
+        Количество освобожденных записей
+    """
+    queryset = GeneratedContent.objects.filter(review_claimed_by=user, reviewed_at__isnull=True)
+    if content_ids is not None:
+        queryset = queryset.filter(id__in=content_ids)
+    return queryset.update(review_claimed_by=None, review_claimed_at=None)
+
+
+def validate_rating(rating: Optional[int]) -> Optional[int]:
+    """
+    Проверяет оценку: None или целое число от MIN_RATING до MAX_RATING.
+
+    Raises:
+        ValueError: если оценка вне допустимого диапазона
+    """
+    if rating is None:
+        return None
+    if isinstance(rating, bool) or not isinstance(rating, int) or not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f'Оценка должна быть целым числом от {MIN_RATING} до {MAX_RATING}')
+    return rating
+
+
+def submit_review(content_id: int, user, rating: Optional[int] = None) -> GeneratedContent:
+    """
+    Отмечает запись проверенной и сохраняет оценку.
+
+    Запись должна быть в одном из статусов REVIEWABLE_STATUSES, не проверена
+    и не зарезервирована другим пользователем (истекший чужой резерв не мешает). Резерв снимается, статус SUCCESS
+    меняется на REVIEWED, закэшированная статистика версии промпта
+    обновляется инкрементально.
+
+    Raises:
+        GeneratedContent.DoesNotExist: если запись не найдена
+        ValueError: если запись уже проверена, не завершилась успешно,
+            зарезервирована другим пользователем или оценка некорректна
+    """
+    rating = validate_rating(rating)
+    now = timezone.now()
+
+    with transaction.atomic():
+        content = GeneratedContent.objects.select_for_update().get(id=content_id)
+        if content.reviewed_at is not None:
+            raise ValueError(f'Запись #{content.id} уже проверена')
+        if content.status not in REVIEWABLE_STATUSES:
+            raise ValueError(f'Запись #{content.id} в статусе {content.status} нельзя проверить')
+        if _is_claimed_by_other(content, user, now):
+            raise ValueError(f'Запись #{content.id} проверяет другой пользователь')
+
+        delta = _apply_review(content, rating, now)
+        content.save(update_fields=REVIEW_UPDATE_FIELDS)
+
+    if content.prompt_version_id:
+        apply_prompt_statistics_delta(content.prompt_version_id, **delta)
+    return content
+
+
+def _is_claimed_by_other(content: GeneratedContent, user, now: datetime) -> bool:
+    """Проверяет, что запись зарезервирована другим пользователем и резерв не истек."""
+    return (
+        content.review_claimed_by_id is not None
+        and content.review_claimed_by_id != user.pk
+        and content.review_claimed_at is not None
+        and content.review_claimed_at >= _claim_expired_before(now)
+    )
+
+
+def _apply_review(content: GeneratedContent, rating: Optional[int], now: datetime) -> Dict[str, int]:
+    """
+    Применяет результат проверки к записи (без сохранения).
+
+    Returns:
+        Изменения статистики версии промпта для apply_prompt_statistics_delta
+    """
+    delta = {
+        'reviewed': 0 if content.reviewed_at is not None else 1,
+        'rated': int(rating is not None) - int(content.rating is not None),
+        'rating_sum': (rating or 0) - (content.rating or 0),
+        'success': -1 if content.status == 'SUCCESS' else 0,
+    }
+
+    content.reviewed_at = now
+    content.rating = rating
+    if content.status == 'SUCCESS':
+        content.status = 'REVIEWED'
+    content.review_claimed_by = None
+    content.review_claimed_at = None
+    return delta
+
+
+def submit_reviews_bulk(items: Iterable[Tuple[int, Optional[int]]], user) -> Dict[str, List[int]]:
+    """
+    Пакетно отмечает записи проверенными и сохраняет оценки.
+
+    Все записи блокируются одним SELECT ... FOR UPDATE и сохраняются одним
+    bulk_update. В отличие от submit_review допускается повторная оценка уже
+    проверенных записей: в статистику попадает только разница со старой оценкой.
+    Записи, зарезервированные другим пользователем, пропускаются, записи не в
+    статусах REVIEWABLE_STATUSES (неудачные и незавершенные генерации) не
+    проверяются. Закэшированная статистика версий промптов обновляется
+    инкрементально - по одному изменению кэша на версию.
+
+    Args:
+        items: Пары (ID записи, оценка или None); для повторяющихся ID берется последняя
+        user: Проверяющий
+
+    Returns:
+        Словарь со списками ID: updated, skipped (чужой резерв),
+        not_reviewable (статус не из REVIEWABLE_STATUSES), not_found
+
+    Raises:
+        ValueError: если записей больше MAX_BULK_REVIEW_ITEMS или оценка некорректна
+    """
+    ratings = {}
+    for content_id, rating in items:
+        ratings[content_id] = validate_rating(rating)
+    if len(ratings) > MAX_BULK_REVIEW_ITEMS:
+        raise ValueError(f'За один запрос можно проверить не более {MAX_BULK_REVIEW_ITEMS} записей')
+
+    now = timezone.now()
+    result = {'updated': [], 'skipped': [], 'not_reviewable': [], 'not_found': []}
+    deltas = {}
+
+    with transaction.atomic():
+        contents = {
+            content.id: content
+            for content in GeneratedContent.objects.select_for_update().filter(
+                id__in=list(ratings.keys())
+            ).only('id', 'prompt_version_id', 'status', 'reviewed_at', 'rating',
+                   'review_claimed_by_id', 'review_claimed_at')
+        }
+
+        to_update = []
+        for content_id, rating in ratings.items():
+            content = contents.get(content_id)
+            if content is None:
+                result['not_found'].append(content_id)
+                continue
+            if content.status not in REVIEWABLE_STATUSES:
+                result['not_reviewable'].append(content_id)
+                continue
+            if _is_claimed_by_other(content, user, now):
+                result['skipped'].append(content_id)
+                continue
+
+            delta = _apply_review(content, rating, now)
+            to_update.append(content)
+            result['updated'].append(content_id)
+
+            if content.prompt_version_id:
+                version_delta = deltas.setdefault(content.prompt_version_id, dict.fromkeys(delta, 0))
+                for key, value in delta.items():
+                    version_delta[key] += value
+
+        if to_update:
+            GeneratedContent.objects.bulk_update(to_update, REVIEW_UPDATE_FIELDS, batch_size=MAX_BULK_REVIEW_ITEMS)
+
+    for prompt_version_id, delta in deltas.items():
+        apply_prompt_statistics_delta(prompt_version_id, **delta)
+    return result
@@ -0,0 +1,209 @@
+"""
+Маршрутизация генераций между версиями промптов (A/B-сравнение).
+
+Для каждого Action можно задать стабильную версию промпта и версию-кандидат
+с долей трафика candidate_traffic_percent. Объект закрепляется за группой
+по хэшу (действие, ID объекта), поэтому повторные генерации для одного
+объекта всегда идут на одну и ту же версию.
+
+Маршруты кэшируются в памяти процесса (с TTL) вместе с версией кэша маршрутов
+из общего Django cache. Сигналы изменения действий, генераторов, промптов и их
+версий увеличивают версию, и маршруты сбрасываются во всех процессах. На горячем
+пути генерации выбор версии не делает запросов к БД - только чтение версии из кэша.
+
+Результаты генераций сохраняются с prompt_version выбранной версии и попадают
+в ее статистику; вариант (stable/candidate) дополнительно пишется в
+context_data задачи как ab_variant.
+"""
+
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from content_generator.models import Action, PromptVersion
+
+
+# Время жизни маршрутов в кэше процесса, секунды
+ROUTING_CACHE_TTL = getattr(settings, 'CONTENT_GENERATOR_ROUTING_CACHE_TTL', 300)
+
+# Варианты маршрутизации
+VARIANT_STABLE = 'stable'
+VARIANT_CANDIDATE = 'candidate'
+
+# Ключ общего кэша с версией маршрутов
+ROUTING_CACHE_VERSION_KEY = 'content_generator_routing_version'
+
+# Кэш маршрутов: {(generator_id или None, action): (маршрут, время получения, версия)}
+_routing_cache = {}
+_routing_cache_lock = threading.Lock()
+
+
+def get_traffic_bucket(action: str, object_id: Optional[int] = None) -> int:
+    """
+    Возвращает номер группы трафика от 0 до 99.
+    Для одного объекта и действия номер всегда одинаков; без object_id выбирается случайно.
+    """
+    if object_id is None:
+        return random.randrange(100)
+    digest = hashlib.sha256(f'{action}:{object_id}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % 100
+
+
+def _load_route(generator, action: str) -> Dict[str, Any]:
+    """
+    Загружает маршрут действия: стабильную версию, кандидата, долю трафика кандидата
+    и последнюю версию системного промпта.
+    Действие ищется среди действий генератора, затем - среди всех действий.
+    """
+    queryset = Action.objects.select_related('prompt', 'system_prompt', 'stable_version', 'candidate_version')
+    action_obj = None
+    if generator is not None:
+        action_obj = queryset.filter(contentgenerator=generator, name=action).first()
+    if action_obj is None:
+        action_obj = queryset.filter(name=action).first()
+
+    route = {
+        'stable': None,
+        'candidate': None,
+        'candidate_traffic_percent': 0,
+        'system_prompt': None,
+    }
+    if action_obj is None:
+        return route
+
+    if action_obj.system_prompt is not None:
+        route['system_prompt'] = action_obj.system_prompt.get_latest_version()
+
+    stable = action_obj.stable_version
+    if stable is None and action_obj.prompt is not None:
+        stable = action_obj.prompt.get_latest_version()
+    route['stable'] = stable
+
+    candidate = action_obj.candidate_version
+    if candidate is not None and action_obj.candidate_traffic_percent and candidate != stable:
+        route['candidate'] = candidate
+        route['candidate_traffic_percent'] = min(action_obj.candidate_traffic_percent, 100)
+    return route
+
+
+def _get_routing_version() -> int:
+    """Возвращает текущую версию кэша маршрутов из общего кэша."""
+    version = cache.get(ROUTING_CACHE_VERSION_KEY)
+    if version is None:
+        # Начальная версия от времени, чтобы не совпасть с версией до вытеснения ключа
+        cache.add(ROUTING_CACHE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(ROUTING_CACHE_VERSION_KEY, 0)
+    return version
+
+
+def _get_cached_route(cache_key: Tuple[Optional[int], str], now: float,
+                      version: int) -> Optional[Dict[str, Any]]:
+    """Возвращает маршрут из кэша процесса, если срок его хранения не истек и версия актуальна."""
+    cached = _routing_cache.get(cache_key)
+    if cached is not None and cached[2] == version and now - cached[1] < ROUTING_CACHE_TTL:
+        return cached[0]
+    return None
+
+
+def get_action_route(generator, action: str) -> Dict[str, Any]:
+    """
+    Возвращает маршрут действия из кэша процесса или загружает его из БД.
+    """
+    cache_key = (getattr(generator, 'pk', None), action)
+    now = time.monotonic()
+    version = _get_routing_version()
+    route = _get_cached_route(cache_key, now, version)
+    if route is not None:
+        return route
+
+    route = _load_route(generator, action)
+    with _routing_cache_lock:
+        _routing_cache[cache_key] = (route, now, version)
+    return route
+
+
+async def aget_action_route(generator, action: str) -> Dict[str, Any]:
+    """
+    Асинхронный вариант get_action_route.
+    Маршрут из кэша возвращается без обращения к пулу потоков.
+    """
+    cache_key = (getattr(generator, 'pk', None), action)
+    now = time.monotonic()
+    version = _get_routing_version()
+    route = _get_cached_route(cache_key, now, version)
+    if route is not None:
+        return route
+
+    route = await sync_to_async(_load_route)(generator, action)
+    with _routing_cache_lock:
+        _routing_cache[cache_key] = (route, now, version)
+    return route
+
+
+def route_prompt_version(generator, action: str,
+                         object_id: Optional[int] = None) -> Tuple[Optional[PromptVersion], str]:
+    """
+    Выбирает версию промпта для генерации.
+
+    Args:
+        generator: ContentGenerator (может быть None)
+        action: Название действия
+        object_id: ID объекта для закрепления за группой трафика
+
+    Returns:
+        Кортеж (версия промпта или None, вариант: 'stable' или 'candidate')
+    """
+    return _choose_variant(get_action_route(generator, action), action, object_id)
+
+
+async def aroute_prompt_version(generator, action: str,
+                                object_id: Optional[int] = None) -> Tuple[Optional[PromptVersion], str]:
+    """
+    Асинхронный вариант route_prompt_version.
+    """
+    return _choose_variant(await aget_action_route(generator, action), action, object_id)
+
+
+def _choose_variant(route: Dict[str, Any], action: str,
+                    object_id: Optional[int] = None) -> Tuple[Optional[PromptVersion], str]:
+    """Выбирает версию промпта маршрута по группе трафика объекта."""
+    if route['candidate'] is not None and get_traffic_bucket(action, object_id) < route['candidate_traffic_percent']:
+        return route['candidate'], VARIANT_CANDIDATE
+    return route['stable'], VARIANT_STABLE
+
+
+def invalidate_routing_cache(**kwargs):
+    """
+    Сбрасывает кэш маршрутов во всех процессах, увеличивая версию в общем кэше.
+    Подключается к сигналам изменения Action, ContentGenerator, Prompt и PromptVersion;
+    после bulk_create (без post_save) вызывается явно.
+    """
+    try:
+        cache.incr(ROUTING_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(ROUTING_CACHE_VERSION_KEY, int(time.time() * 1000), None)
+    with _routing_cache_lock:
+        _routing_cache.clear()
+
+
+def get_action_ab_statistics(action_obj: Action) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Возвращает статистику стабильной версии и версии-кандидата действия
+    для сравнения результатов A/B-теста.
+    """
+    from content_generator.utils import get_prompt_statistics
+
+    stable = action_obj.stable_version
+    if stable is None and action_obj.prompt is not None:
+        stable = action_obj.prompt.get_latest_version()
+    candidate = action_obj.candidate_version
+    return {
+        VARIANT_STABLE: get_prompt_statistics(stable) if stable else None,
+        VARIANT_CANDIDATE: get_prompt_statistics(candidate) if candidate else None,
+    }
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Prompt, PromptVersion
+from .models import Prompt, PromptVersion, GeneratedContent
+from .review import MIN_RATING, MAX_RATING, MAX_BULK_REVIEW_ITEMS
+from .utils import get_annotated_version_stats
 
 
 # ========== ПОДСИСТЕМА PROMPTS ==========
@@ -55,6 +57,62 @@ class PromptVersionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'version_number', 'created_at']
 
 
+class PromptVersionListSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор списка версий промптов.
+    Вместо полного prompt_content отдает превью, статистику берет из аннотаций
+    get_prompt_version_list_queryset - без дополнительных запросов на каждую версию.
+    """
+    prompt_id = serializers.IntegerField(read_only=True)
+    prompt_name = serializers.CharField(source='prompt.name', read_only=True, default=None)
+    content_preview = serializers.CharField(read_only=True)
+    generated_content_count = serializers.SerializerMethodField()
+    reviewed_content_count = serializers.SerializerMethodField()
+    review_percentage = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PromptVersion
+        fields = [
+            'id',
+            'prompt_id',
+            'prompt_name',
+            'version_number',
+            'description',
+            'content_preview',
+            'content_hash',
+            'engineer_name',
+            'created_at',
+            'generated_content_count',
+            'reviewed_content_count',
+            'review_percentage',
+            'average_rating',
+        ]
+        read_only_fields = fields
+
+    def _get_stats(self, obj):
+        """Возвращает статистику версии из аннотаций (с запасным вычислением)."""
+        if not hasattr(obj, '_list_stats'):
+            obj._list_stats = get_annotated_version_stats(obj)
+        return obj._list_stats
+
+    def get_generated_content_count(self, obj):
+        """Возвращает количество сгенерированного контента."""
+        return self._get_stats(obj)['generated_count']
+
+    def get_reviewed_content_count(self, obj):
+        """Возвращает количество проверенного контента."""
+        return self._get_stats(obj)['reviewed_count']
+
+    def get_review_percentage(self, obj):
+        """Возвращает процент проверенного контента."""
+        return self._get_stats(obj)['review_percentage']
+
+    def get_average_rating(self, obj):
+        """Возвращает средний рейтинг."""
+        return self._get_stats(obj)['average_rating']
+
+
 class PromptVersionDetailSerializer(serializers.ModelSerializer):
     """
     Детальный сериализатор для версий промптов с включением статистики.
@@ -134,13 +192,9 @@ class PromptVersionCreateSerializer(serializers.ModelSerializer):
         except Prompt.DoesNotExist:
             raise serializers.ValidationError({'prompt_id': 'Промпт с указанным ID не найден.'})
         
-        # Генерируем следующий номер версии для конкретного промпта
-        version_number = PromptVersion.get_next_version_number_for_prompt(prompt)
-        
-        # Создаем новую версию
-        version = PromptVersion.objects.create(
+        # Создаем новую версию со следующим номером для конкретного промпта
+        version = PromptVersion.create_next_version(
             prompt=prompt,
-            version_number=version_number,
             **validated_data
         )
         
@@ -165,19 +219,22 @@ class PromptVersionUpdateSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """
         Обновляет версию промпта с реализацией "умного версионирования".
+        Если новый текст совпадает с последней версией промпта, возвращает ее без создания новой.
         """
-        original_prompt_content = instance.prompt_content
-        new_prompt_content = validated_data.get('prompt_content', original_prompt_content)
+        new_prompt_content = validated_data.get('prompt_content', instance.prompt_content)
         new_description = validated_data.get('description', instance.description)
         new_engineer_name = validated_data.get('engineer_name', instance.engineer_name)
         
-        # Проверяем, изменилось ли содержимое промпта
-        if original_prompt_content != new_prompt_content:
+        # Проверяем, изменилось ли содержимое промпта (по хэшу содержимого)
+        if not instance.has_same_content(new_prompt_content):
+            # Если последняя версия промпта уже содержит такой текст, новая не создается
+            latest_version = PromptVersion.get_latest_if_identical(instance.prompt, new_prompt_content)
+            if latest_version:
+                return latest_version
+
             # Создаем новую версию при изменении содержимого
-            new_version_number = PromptVersion.get_next_version_number_for_prompt(instance.prompt)
-            new_version = PromptVersion.objects.create(
+            new_version = PromptVersion.create_next_version(
                 prompt=instance.prompt,
-                version_number=new_version_number,
                 description=new_description,
                 prompt_content=new_prompt_content,
                 engineer_name=new_engineer_name,
@@ -189,3 +246,68 @@ class PromptVersionUpdateSerializer(serializers.ModelSerializer):
             instance.engineer_name = new_engineer_name
             instance.save()
             return instance
+
+
+class GeneratedContentReviewSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор записи очереди проверки.
+    Отдает сгенерированные данные и сведения о целевом объекте.
+    """
+    content_type = serializers.CharField(source='content_type.model', read_only=True)
+    prompt_version_number = serializers.IntegerField(
+        source='prompt_version.version_number',
+        read_only=True,
+        default=None
+    )
+
+    class Meta:
+        model = GeneratedContent
+        fields = [
+            'id',
+            'prompt_version_id',
+            'prompt_version_number',
+            'content_type',
+            'object_id',
+            'action',
+            'generated_data',
+            'status',
+            'created_at',
+            'review_claimed_at',
+        ]
+        read_only_fields = fields
+
+
+class ReviewSubmitSerializer(serializers.Serializer):
+    """
+    Сериализатор отправки результата проверки.
+    """
+    rating = serializers.IntegerField(
+        required=False,
+        allow_null=True,
+        min_value=MIN_RATING,
+        max_value=MAX_RATING
+    )
+
+
+class BulkReviewItemSerializer(serializers.Serializer):
+    """
+    Элемент пакетной проверки: ID записи и оценка.
+    """
+    id = serializers.IntegerField(min_value=1)
+    rating = serializers.IntegerField(
+        required=False,
+        allow_null=True,
+        min_value=MIN_RATING,
+        max_value=MAX_RATING
+    )
+
+
+class BulkReviewSerializer(serializers.Serializer):
+    """
+    Сериализатор пакетной проверки сгенерированного контента.
+    """
+    items = serializers.ListField(
+        child=BulkReviewItemSerializer(),
+        allow_empty=False,
+        max_length=MAX_BULK_REVIEW_ITEMS
+    )
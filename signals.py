@@ -3,11 +3,15 @@
 """
 
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_migrate
+from django.contrib.sites.models import Site
+from django.db.models.signals import post_save, post_delete, post_migrate, m2m_changed
 
-from content_generator.models import Action
+from main.models import SitePreferences
+from content_generator.models import Action, ContentGenerator, Prompt, PromptVersion
+from content_generator.routing import invalidate_routing_cache
+from content_generator.ai_interface_adapter import BATCH_ACTIONS, get_batch_endpoint
 from ai_interface.actions import register_postprocessor
-from content_generator.utils import process_generation_result
+from content_generator.utils import process_generation_result, invalidate_site_preferences_cache
 
 # ========== ПОДСИСТЕМА INTEGRATION ==========
 
@@ -37,6 +41,27 @@ register_postprocessor('content_generator_set_description', process_content_gene
 register_postprocessor('content_generator_upgrade_name', process_content_generation_result)
 register_postprocessor('content_generator_set_some_params', process_content_generation_result)
 
+# Пакетные задачи (несколько объектов в одном запросе)
+for batch_action in BATCH_ACTIONS:
+    register_postprocessor(get_batch_endpoint(batch_action), process_content_generation_result)
+
+
+# ========== ПОДСИСТЕМА PAYLOADS ==========
+
+# Сброс кэша настроек сайта, используемого при построении payload'ов
+for sender in (SitePreferences, Site):
+    post_save.connect(invalidate_site_preferences_cache, sender=sender, dispatch_uid=f'content_generator_site_preferences_{sender.__name__}_save')
+    post_delete.connect(invalidate_site_preferences_cache, sender=sender, dispatch_uid=f'content_generator_site_preferences_{sender.__name__}_delete')
+
+
+# ========== ПОДСИСТЕМА PROMPTS ==========
+
+# Сброс кэша маршрутов A/B-сравнения версий промптов
+for sender in (Action, ContentGenerator, Prompt, PromptVersion):
+    post_save.connect(invalidate_routing_cache, sender=sender, dispatch_uid=f'content_generator_routing_{sender.__name__}_save')
+    post_delete.connect(invalidate_routing_cache, sender=sender, dispatch_uid=f'content_generator_routing_{sender.__name__}_delete')
+m2m_changed.connect(invalidate_routing_cache, sender=ContentGenerator.actions.through, dispatch_uid='content_generator_routing_generator_actions')
+
 
 ACTIONS = [
     { 
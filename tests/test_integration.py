@@ -2,18 +2,51 @@
 Интеграционные тесты для content_generator.
 """
 
+import threading
+from datetime import timedelta
 from unittest.mock import Mock, patch, MagicMock
 from django.test import TestCase
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.utils import timezone
 
-from content_generator.models import PromptVersion, GeneratedContent
+from content_generator.models import Action, ContentGenerator, Prompt, PromptVersion, GeneratedContent, GeneratedContentArchive
+from content_generator.routing import invalidate_routing_cache
 from content_generator.ai_interface_adapter import (
     create_generation_task,
     process_generation_result,
-    link_content_with_prompt
+    link_content_with_prompt,
+    dispatch_generation_tasks,
+    create_task_group,
+    get_task_group_status,
+    agent_supports_streaming,
+    parse_streamed_result,
+    stream_generation_task,
+    create_generation_tasks_bulk,
+    build_generation_task_data,
+    create_batch_generation_task,
+    split_batch_result,
+    process_batch_generation_result,
 )
-from content_generator.utils import process_generation_result as utils_process_result
+from content_generator.utils import (
+    process_generation_result as utils_process_result,
+    apply_prompt_statistics_delta,
+    get_prompt_statistics,
+    get_prompt_statistics_counter_key,
+)
+from content_generator.publishing import publish_generated_content, get_publishable_content
+from content_generator.retention import archive_generated_content, get_archivable_content_ids
+from content_generator.review import (
+    claim_review_batch,
+    get_review_queue,
+    release_review_claims,
+    submit_review,
+    submit_reviews_bulk,
+    REVIEW_CLAIM_TTL,
+)
+
+User = get_user_model()
 
 
 class AITaskMock:
@@ -44,15 +77,31 @@ class AIInterfaceIntegrationTest(TestCase):
             model='product'
         )
 
+    def test_prompt_text_shipped_once_to_caching_agent(self):
+        """Тест: агенту с кэшем промптов текст передается только для новой версии."""
+        cache.clear()
+        agent = Mock(pk=1, supports_prompt_cache=True)
+
+        first = build_generation_task_data(self.prompt_version, self.content_type, 1, 'set_seo_params', agent=agent)
+        second = build_generation_task_data(self.prompt_version, self.content_type, 2, 'set_seo_params', agent=agent)
+
+        self.assertEqual(first['payload']['prompt'], self.prompt_version.prompt_content)
+        self.assertNotIn('prompt', second['payload'])
+        self.assertEqual(second['payload']['prompt_hash'], self.prompt_version.content_hash)
+        self.assertEqual(second['payload']['prompt_version_id'], self.prompt_version.id)
+
+        # Другой агент и агент без кэша промптов получают текст
+        other_agent = Mock(pk=2, supports_prompt_cache=True)
+        self.assertIn('prompt', build_generation_task_data(
+            self.prompt_version, self.content_type, 1, 'set_seo_params', agent=other_agent)['payload'])
+        self.assertIn('prompt', build_generation_task_data(
+            self.prompt_version, self.content_type, 1, 'set_seo_params', agent=Mock(supports_prompt_cache=False))['payload'])
+        cache.clear()
+
     @patch('content_generator.ai_interface_adapter.AITask')
-    @patch('content_generator.ai_interface_adapter.Site')
-    def test_create_generation_task(self, mock_site, mock_aitask):
+    def test_create_generation_task(self, mock_aitask):
         """Тест создания задачи генерации через ai_interface."""
         # Настраиваем моки
-        mock_site_obj = Mock()
-        mock_site_obj.domain = 'test.com'
-        mock_site.objects.get_current.return_value = mock_site_obj
-        
         mock_task = Mock()
         mock_task.id = 1
         mock_task.create_and_dispatch = Mock(return_value=mock_task)
@@ -77,7 +126,8 @@ class AIInterfaceIntegrationTest(TestCase):
         self.assertIn('payload', call_args[1])
         self.assertIn('prompt_version_id', call_args[1]['context_data'])
         self.assertEqual(call_args[1]['context_data']['prompt_version_id'], self.prompt_version.id)
-        self.assertEqual(call_args[1]['context_data']['prompt_content'], self.prompt_version.prompt_content)
+        self.assertEqual(call_args[1]['context_data']['prompt_content_hash'], self.prompt_version.content_hash)
+        self.assertNotIn('prompt_content', call_args[1]['context_data'])
         self.assertIn('prompt', call_args[1]['payload'])
         self.assertEqual(call_args[1]['payload']['prompt'], self.prompt_version.prompt_content)
 
@@ -450,3 +500,955 @@ class GeneratedContentPromptVersionRelationshipTest(TestCase):
         self.assertEqual(self.prompt_version1.get_review_percentage(), round((2 / 3) * 100, 2))
         self.assertEqual(self.prompt_version1.get_average_rating(), 4.5)  # (5 + 4) / 2
 
+
+
+class PublishGeneratedContentTest(TestCase):
+    """Тесты пакетной публикации сгенерированного контента."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.content_type = ContentType.objects.create(
+            app_label='store',
+            model='product'
+        )
+
+    def test_publishable_content_filters_status_and_published(self):
+        """Тест отбора только успешного неопубликованного контента."""
+        success = GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=1,
+            action='upgrade_name',
+            generated_data={'new_name': 'Новое название'},
+            status='SUCCESS'
+        )
+        GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=2,
+            action='upgrade_name',
+            generated_data={},
+            status='FAILURE'
+        )
+        GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=3,
+            action='upgrade_name',
+            generated_data={'new_name': 'Уже опубликовано'},
+            status='SUCCESS',
+            published_at=timezone.now()
+        )
+
+        self.assertEqual(list(get_publishable_content()), [success])
+
+    def test_publish_skips_unknown_action(self):
+        """Тест пропуска контента с неизвестным действием."""
+        content = GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=1,
+            action='unknown_action',
+            generated_data={'new_name': 'Новое название'},
+            status='SUCCESS'
+        )
+
+        stats = publish_generated_content()
+
+        self.assertEqual(stats['published'], 0)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['skipped_ids'], [content.id])
+        self.assertEqual(stats['skipped_reasons'], {'unknown_action': 1})
+        content.refresh_from_db()
+        self.assertIsNone(content.published_at)
+
+    def test_publish_in_several_chunks_reports_skipped(self):
+        """Тест публикации несколькими чанками с пропуском записей без объекта."""
+        prompts = [Prompt.objects.create(name=f'Промпт {index}') for index in range(5)]
+        prompt_type = ContentType.objects.get_for_model(Prompt)
+        contents = [
+            GeneratedContent.objects.create(
+                content_type=prompt_type,
+                object_id=prompt.id,
+                action='upgrade_name',
+                generated_data={'new_name': f'Новое название {prompt.id}'},
+                status='SUCCESS'
+            )
+            for prompt in prompts
+        ]
+        missing = GeneratedContent.objects.create(
+            content_type=prompt_type,
+            object_id=max(prompt.id for prompt in prompts) + 100,
+            action='upgrade_name',
+            generated_data={'new_name': 'Нет объекта'},
+            status='SUCCESS'
+        )
+
+        stats = publish_generated_content(batch_size=2)
+
+        self.assertEqual(stats['published'], 5)
+        self.assertEqual(stats['objects_updated'], 5)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(stats['skipped_ids'], [missing.id])
+        self.assertEqual(stats['skipped_reasons'], {'object_not_found': 1})
+        for prompt in prompts:
+            prompt.refresh_from_db()
+            self.assertEqual(prompt.name, f'Новое название {prompt.id}')
+        self.assertFalse(GeneratedContent.objects.filter(
+            id__in=[content.id for content in contents], published_at__isnull=True
+        ).exists())
+        missing.refresh_from_db()
+        self.assertIsNone(missing.published_at)
+
+        # Повторный запуск не публикует уже опубликованное
+        self.assertEqual(publish_generated_content(batch_size=2)['published'], 0)
+
+
+class GeneratedContentRetentionTest(TestCase):
+    """Тесты политики хранения и архивации сгенерированного контента."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.content_type = ContentType.objects.create(
+            app_label='store',
+            model='product'
+        )
+        self.contents = [
+            GeneratedContent.objects.create(
+                content_type=self.content_type,
+                object_id=1,
+                action='upgrade_name',
+                generated_data={'new_name': f'Название {index}'},
+                status='SUCCESS',
+                published_at=timezone.now()
+            )
+            for index in range(5)
+        ]
+        # Самая старая запись оценена - она должна остаться в основной таблице
+        self.contents[0].rating = 5
+        self.contents[0].save()
+
+        self.other_object = GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=2,
+            action='upgrade_name',
+            generated_data={'new_name': 'Другой объект'},
+            status='SUCCESS'
+        )
+
+    def test_archivable_ids_keep_latest_and_rated(self):
+        """Тест отбора записей: последние N и оцененные не архивируются."""
+        archivable_ids = get_archivable_content_ids(keep_latest=2)
+        self.assertEqual(archivable_ids, [self.contents[1].id, self.contents[2].id])
+
+    def test_archive_moves_rows(self):
+        """Тест переноса записей в архив чанками."""
+        stats = archive_generated_content(keep_latest=2, batch_size=1)
+
+        self.assertEqual(stats, {'candidates': 2, 'archived': 2})
+        self.assertFalse(GeneratedContent.objects.filter(
+            id__in=[self.contents[1].id, self.contents[2].id]
+        ).exists())
+        self.assertEqual(GeneratedContent.objects.count(), 4)
+
+        archived = GeneratedContentArchive.objects.get(original_id=self.contents[1].id)
+        self.assertEqual(archived.generated_data, {'new_name': 'Название 1'})
+        self.assertEqual(archived.action, 'upgrade_name')
+        self.assertEqual(archived.object_id, 1)
+
+    def test_archive_respects_older_than(self):
+        """Тест, что свежие записи не архивируются при заданном older_than."""
+        stats = archive_generated_content(
+            keep_latest=2,
+            older_than=timezone.now() - timedelta(days=1)
+        )
+
+        self.assertEqual(stats, {'candidates': 0, 'archived': 0})
+        self.assertEqual(GeneratedContent.objects.count(), 6)
+
+    def test_unpublished_success_archived_beyond_keep_latest(self):
+        """Тест: неопубликованный успешный контент архивируется сверх последних N, если не включено его хранение."""
+        GeneratedContent.objects.filter(
+            id__in=[self.contents[1].id, self.contents[4].id]
+        ).update(published_at=None)
+
+        self.assertEqual(
+            get_archivable_content_ids(keep_latest=2),
+            [self.contents[1].id, self.contents[2].id]
+        )
+        self.assertEqual(
+            get_archivable_content_ids(keep_latest=2, keep_unpublished=True),
+            [self.contents[2].id]
+        )
+
+    def test_archive_in_object_batches(self):
+        """Тест отбора кандидатов пачками объектов."""
+        other_contents = [
+            GeneratedContent.objects.create(
+                content_type=self.content_type,
+                object_id=2,
+                action='upgrade_name',
+                generated_data={'new_name': f'Другое название {index}'},
+                status='FAILURE'
+            )
+            for index in range(3)
+        ]
+
+        stats = archive_generated_content(keep_latest=2, batch_size=1)
+
+        # У объекта 2 четыре записи: архивируются две старые, включая неопубликованную
+        self.assertEqual(stats, {'candidates': 4, 'archived': 4})
+        self.assertFalse(GeneratedContent.objects.filter(
+            id__in=[self.contents[1].id, self.contents[2].id, self.other_object.id, other_contents[0].id]
+        ).exists())
+        self.assertEqual(GeneratedContent.objects.filter(object_id=2).count(), 2)
+
+
+class ReviewQueueTest(TestCase):
+    """Тесты очереди проверки сгенерированного контента."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.content_type = ContentType.objects.create(
+            app_label='store',
+            model='product'
+        )
+        self.reviewer1 = User.objects.create_user(email='reviewer1@test.com', password='testpass123', username='reviewer1')
+        self.reviewer2 = User.objects.create_user(email='reviewer2@test.com', password='testpass123', username='reviewer2')
+        self.contents = [
+            GeneratedContent.objects.create(
+                content_type=self.content_type,
+                object_id=index,
+                action='upgrade_name',
+                generated_data={'new_name': f'Название {index}'},
+                status='SUCCESS'
+            )
+            for index in range(4)
+        ]
+        self.failed = GeneratedContent.objects.create(
+            content_type=self.content_type,
+            object_id=10,
+            generated_data={},
+            status='FAILURE'
+        )
+
+    def test_claim_hands_out_distinct_batches(self):
+        """Тест, что проверяющие получают разные записи."""
+        batch1 = claim_review_batch(self.reviewer1, batch_size=2)
+        batch2 = claim_review_batch(self.reviewer2, batch_size=5)
+
+        self.assertEqual(batch1, self.contents[:2])
+        self.assertEqual(batch2, self.contents[2:])
+        self.assertTrue(all(content.review_claimed_by == self.reviewer1 for content in batch1))
+        self.assertEqual(get_review_queue().count(), 0)
+
+    def test_claim_returns_existing_claims_first(self):
+        """Тест повторной выдачи уже зарезервированных записей."""
+        first = claim_review_batch(self.reviewer1, batch_size=2)
+        again = claim_review_batch(self.reviewer1, batch_size=2)
+
+        self.assertEqual(first, again)
+
+    def test_expired_claim_returns_to_queue(self):
+        """Тест возврата в очередь записей с истекшим резервом."""
+        claim_review_batch(self.reviewer1, batch_size=4)
+        GeneratedContent.objects.filter(id=self.contents[0].id).update(
+            review_claimed_at=timezone.now() - timedelta(seconds=REVIEW_CLAIM_TTL + 60)
+        )
+
+        self.assertEqual(claim_review_batch(self.reviewer2, batch_size=4), [self.contents[0]])
+
+    def test_submit_review(self):
+        """Тест сохранения результата проверки."""
+        claim_review_batch(self.reviewer1, batch_size=1)
+        content = submit_review(self.contents[0].id, self.reviewer1, rating=4)
+
+        self.assertEqual(content.status, 'REVIEWED')
+        self.assertEqual(content.rating, 4)
+        self.assertIsNotNone(content.reviewed_at)
+        self.assertIsNone(content.review_claimed_by)
+
+    def test_submit_review_rejects_foreign_claim_and_bad_rating(self):
+        """Тест запрета проверки чужой записи и некорректной оценки."""
+        claim_review_batch(self.reviewer1, batch_size=1)
+
+        with self.assertRaises(ValueError):
+            submit_review(self.contents[0].id, self.reviewer2, rating=4)
+        with self.assertRaises(ValueError):
+            submit_review(self.contents[1].id, self.reviewer2, rating=6)
+
+    def test_submit_review_rejects_failed_generation(self):
+        """Тест запрета проверки неудачной генерации."""
+        with self.assertRaises(ValueError):
+            submit_review(self.failed.id, self.reviewer1, rating=4)
+
+        self.failed.refresh_from_db()
+        self.assertIsNone(self.failed.reviewed_at)
+        self.assertIsNone(self.failed.rating)
+
+    def test_release_claims(self):
+        """Тест возврата резервов в очередь."""
+        claim_review_batch(self.reviewer1, batch_size=3)
+
+        self.assertEqual(release_review_claims(self.reviewer1), 3)
+        self.assertEqual(get_review_queue().count(), 4)
+
+
+class BulkReviewTest(TestCase):
+    """Тесты пакетной проверки и инкрементального обновления статистики."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        cache.clear()
+        self.content_type = ContentType.objects.create(
+            app_label='store',
+            model='product'
+        )
+        self.prompt = Prompt.objects.create(name='Названия')
+        self.prompt_version = PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=1,
+            description='Тестовая версия',
+            prompt_content='Тестовое содержимое промпта',
+            engineer_name='Тестовый инженер'
+        )
+        self.reviewer1 = User.objects.create_user(email='reviewer1@test.com', password='testpass123', username='reviewer1')
+        self.reviewer2 = User.objects.create_user(email='reviewer2@test.com', password='testpass123', username='reviewer2')
+        self.contents = [
+            GeneratedContent.objects.create(
+                prompt_version=self.prompt_version,
+                content_type=self.content_type,
+                object_id=index,
+                action='upgrade_name',
+                generated_data={'new_name': f'Название {index}'},
+                status='SUCCESS'
+            )
+            for index in range(4)
+        ]
+
+    def test_bulk_review_updates_rows(self):
+        """Тест пакетного сохранения оценок."""
+        claim_review_batch(self.reviewer2, batch_size=1)
+
+        result = submit_reviews_bulk([
+            (self.contents[0].id, 5),
+            (self.contents[1].id, 3),
+            (self.contents[2].id, None),
+            (999999, 4),
+        ], self.reviewer1)
+
+        self.assertEqual(result, {
+            'updated': [self.contents[1].id, self.contents[2].id],
+            'skipped': [self.contents[0].id],
+            'not_reviewable': [],
+            'not_found': [999999],
+        })
+        self.contents[1].refresh_from_db()
+        self.assertEqual(self.contents[1].rating, 3)
+        self.assertEqual(self.contents[1].status, 'REVIEWED')
+        self.assertIsNotNone(self.contents[1].reviewed_at)
+
+    def test_bulk_review_rejects_invalid_rating(self):
+        """Тест отказа при некорректной оценке."""
+        with self.assertRaises(ValueError):
+            submit_reviews_bulk([(self.contents[0].id, 0)], self.reviewer1)
+
+    def test_bulk_review_updates_cached_statistics_incrementally(self):
+        """Тест, что закэшированная статистика совпадает с пересчитанной по БД."""
+        get_prompt_statistics(self.prompt_version)
+
+        submit_reviews_bulk([(self.contents[0].id, 5), (self.contents[1].id, 2)], self.reviewer1)
+        # Повторная оценка уже проверенной записи
+        submit_reviews_bulk([(self.contents[1].id, 4)], self.reviewer1)
+
+        cached = get_prompt_statistics(self.prompt_version)
+        cache.clear()
+        fresh = get_prompt_statistics(self.prompt_version)
+
+        self.assertEqual(cached, fresh)
+        self.assertEqual(cached['reviewed_count'], 2)
+        self.assertEqual(cached['average_rating'], 4.5)
+        self.assertEqual(cached['success_count'], 2)
+
+    def test_bulk_review_skips_unfinished_generations(self):
+        """Тест, что неудачные генерации не проверяются и не попадают в статистику."""
+        failed = GeneratedContent.objects.create(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=10,
+            generated_data={},
+            status='FAILURE'
+        )
+        get_prompt_statistics(self.prompt_version)
+
+        result = submit_reviews_bulk([(failed.id, 5), (self.contents[0].id, 3)], self.reviewer1)
+
+        self.assertEqual(result['updated'], [self.contents[0].id])
+        self.assertEqual(result['not_reviewable'], [failed.id])
+        failed.refresh_from_db()
+        self.assertIsNone(failed.reviewed_at)
+        self.assertIsNone(failed.rating)
+        self.assertEqual(get_prompt_statistics(self.prompt_version)['rated_count'], 1)
+
+    def test_statistics_delta_keeps_concurrent_updates(self):
+        """Тест, что изменения статистики из разных запросов не затирают друг друга."""
+        get_prompt_statistics(self.prompt_version)
+
+        # Два запроса прочитали статистику до обновления и применяют свои изменения
+        self.assertTrue(apply_prompt_statistics_delta(self.prompt_version.id, reviewed=1, rated=1, rating_sum=5, success=-1))
+        self.assertTrue(apply_prompt_statistics_delta(self.prompt_version.id, reviewed=1, rated=1, rating_sum=3, success=-1))
+
+        stats = get_prompt_statistics(self.prompt_version)
+        self.assertEqual(stats['reviewed_count'], 2)
+        self.assertEqual(stats['rated_count'], 2)
+        self.assertEqual(stats['average_rating'], 4.0)
+        self.assertEqual(stats['success_count'], 2)
+
+    def test_statistics_delta_without_cache_forces_recount(self):
+        """Тест пересчета статистики, если счетчиков нет в кэше."""
+        get_prompt_statistics(self.prompt_version)
+        cache.delete(get_prompt_statistics_counter_key(self.prompt_version.id, 'rated_count'))
+
+        self.assertFalse(apply_prompt_statistics_delta(self.prompt_version.id, rated=1, rating_sum=5))
+        self.assertEqual(get_prompt_statistics(self.prompt_version)['rated_count'], 0)
+
+
+class ParallelGenerationTest(TestCase):
+    """Тесты параллельной отправки задач для нескольких действий."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        cache.clear()
+        self.prompt_version = PromptVersion.objects.create(
+            version_number=1,
+            prompt_content='Промпт',
+        )
+        self.content_type = ContentType.objects.create(app_label='store', model='product')
+
+    def tearDown(self):
+        cache.clear()
+
+    def _kwargs(self, action):
+        return {
+            'prompt_version': self.prompt_version,
+            'content_type': self.content_type,
+            'object_id': 1,
+            'action': action,
+            'domain': 'test.com',
+        }
+
+    def test_tasks_are_dispatched_concurrently(self):
+        """Тест: вызовы агентов выполняются одновременно, а не по очереди."""
+        actions = ['set_seo_params', 'set_description', 'upgrade_name']
+        # Барьер пропускает потоки, только когда все три вызова идут одновременно
+        barrier = threading.Barrier(len(actions), timeout=5)
+
+        def fake_create(**kwargs):
+            barrier.wait()
+            return Mock(id=actions.index(kwargs['action']) + 1)
+
+        with patch('content_generator.ai_interface_adapter.create_generation_task', side_effect=fake_create):
+            results = dispatch_generation_tasks([self._kwargs(action) for action in actions])
+
+        self.assertEqual([result['task'].id for result in results], [1, 2, 3])
+        self.assertTrue(all(result['error'] is None for result in results))
+
+    def test_failed_task_does_not_block_others(self):
+        """Тест: ошибка одной задачи не мешает отправке остальных."""
+        def fake_create(**kwargs):
+            if kwargs['action'] == 'set_description':
+                raise RuntimeError('Агент недоступен')
+            return Mock(id=1)
+
+        with patch('content_generator.ai_interface_adapter.create_generation_task', side_effect=fake_create):
+            results = dispatch_generation_tasks([
+                self._kwargs('set_seo_params'),
+                self._kwargs('set_description'),
+            ])
+
+        self.assertEqual(results[0]['task'].id, 1)
+        self.assertIsNone(results[1]['task'])
+        self.assertEqual(results[1]['error'], 'Агент недоступен')
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_task_group_status(self, mock_aitask):
+        """Тест: сводный статус группы задач."""
+        group_id = create_task_group({'set_seo_params': 1, 'set_description': 2})
+        values_list = mock_aitask.objects.filter.return_value.values_list
+
+        values_list.return_value = [(1, 'SUCCESS'), (2, 'PENDING')]
+        status = get_task_group_status(group_id)
+        self.assertEqual(status['status'], 'PENDING')
+        self.assertEqual(status['actions']['set_seo_params'], {'task_id': 1, 'status': 'SUCCESS'})
+
+        values_list.return_value = [(1, 'SUCCESS'), (2, 'SUCCESS')]
+        self.assertEqual(get_task_group_status(group_id)['status'], 'SUCCESS')
+
+        values_list.return_value = [(1, 'SUCCESS'), (2, 'FAILURE')]
+        self.assertEqual(get_task_group_status(group_id)['status'], 'PARTIAL')
+
+        self.assertIsNone(get_task_group_status('unknown'))
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_task_group_status_includes_dispatch_errors(self, mock_aitask):
+        """Тест: неотправленные задачи учитываются в статусе группы как ошибки."""
+        group_id = create_task_group({'set_seo_params': 1}, {'set_description': 'Агент недоступен'})
+        mock_aitask.objects.filter.return_value.values_list.return_value = [(1, 'SUCCESS')]
+
+        status = get_task_group_status(group_id)
+
+        self.assertEqual(status['status'], 'PARTIAL')
+        self.assertEqual(status['actions']['set_description']['error'], 'Агент недоступен')
+
+
+class StreamingGenerationTest(TestCase):
+    """Тесты потоковой генерации."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt_version = PromptVersion.objects.create(
+            version_number=1,
+            prompt_content='Промпт',
+        )
+        self.content_type = ContentType.objects.create(app_label='store', model='product')
+
+        self.task = Mock(id=7)
+        self.agent = Mock(supports_streaming=True)
+
+    def _stream(self):
+        return list(stream_generation_task(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=1,
+            action='set_description',
+            agent=self.agent,
+        ))
+
+    def test_agent_supports_streaming(self):
+        """Тест определения поддержки потоковой генерации агентом."""
+        self.assertTrue(agent_supports_streaming(self.agent))
+        self.assertFalse(agent_supports_streaming(None))
+        self.assertFalse(agent_supports_streaming(Mock(supports_streaming=False)))
+
+    def test_parse_streamed_result(self):
+        """Тест: JSON-объект разбирается, прочий текст сохраняется в text."""
+        self.assertEqual(parse_streamed_result('{"description": "Текст"}'), {'description': 'Текст'})
+        self.assertEqual(parse_streamed_result('Просто текст'), {'text': 'Просто текст'})
+        self.assertEqual(parse_streamed_result('[1, 2]'), {'text': '[1, 2]'})
+
+    @patch('content_generator.ai_interface_adapter.process_generation_result')
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_chunks_are_relayed_and_result_persisted(self, mock_aitask, mock_process):
+        """Тест: фрагменты передаются по мере получения, итог сохраняется через process_generation_result."""
+        mock_aitask.objects.create.return_value = self.task
+        mock_process.return_value = Mock(id=11)
+        self.agent.stream_generation.return_value = iter(['{"description": ', '"Текст"}'])
+
+        events = self._stream()
+
+        self.assertEqual(events[0], {'event': 'task', 'task_id': 7})
+        self.assertEqual([e['text'] for e in events if e['event'] == 'chunk'], ['{"description": ', '"Текст"}'])
+        self.assertEqual(events[-1], {'event': 'done', 'task_id': 7, 'generated_content_id': 11})
+
+        create_kwargs = mock_aitask.objects.create.call_args[1]
+        self.assertEqual(create_kwargs['endpoint'], 'content_generator_set_description')
+        self.assertEqual(create_kwargs['context_data']['prompt_version_id'], self.prompt_version.id)
+        self.assertEqual(self.task.status, 'SUCCESS')
+        self.assertEqual(self.task.result, {'description': 'Текст'})
+        mock_process.assert_called_once_with(self.task)
+
+    @patch('content_generator.ai_interface_adapter.process_generation_result')
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_stream_error_marks_task_failed(self, mock_aitask, mock_process):
+        """Тест: ошибка агента во время передачи завершает задачу с ошибкой."""
+        mock_aitask.objects.create.return_value = self.task
+
+        def broken_stream(task):
+            yield 'Начало'
+            raise RuntimeError('Обрыв соединения')
+
+        self.agent.stream_generation.side_effect = broken_stream
+
+        events = self._stream()
+
+        self.assertEqual(events[-1], {'event': 'error', 'task_id': 7, 'message': 'Обрыв соединения'})
+        self.assertEqual(self.task.status, 'FAILURE')
+        mock_process.assert_called_once_with(self.task)
+
+    @patch('content_generator.ai_interface_adapter.process_generation_result')
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_client_disconnect_marks_task_failed(self, mock_aitask, mock_process):
+        """Тест: при отключении клиента генерация прерывается, задача завершается с ошибкой."""
+        mock_aitask.objects.create.return_value = self.task
+        agent_stream_closed = []
+
+        def endless_stream(task):
+            try:
+                while True:
+                    yield 'Фрагмент'
+            finally:
+                agent_stream_closed.append(True)
+
+        self.agent.stream_generation.side_effect = endless_stream
+
+        stream = stream_generation_task(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=1,
+            action='set_description',
+            agent=self.agent,
+        )
+        self.assertEqual(next(stream), {'event': 'task', 'task_id': 7})
+        self.assertEqual(next(stream), {'event': 'chunk', 'text': 'Фрагмент'})
+        stream.close()
+
+        self.assertEqual(mock_aitask.objects.create.call_args[1]['status'], 'PREPROCESSING')
+        self.assertEqual(self.task.status, 'FAILURE')
+        self.assertIn('error', self.task.result)
+        self.assertEqual(agent_stream_closed, [True])
+        mock_process.assert_called_once_with(self.task)
+
+
+class BulkGenerationTaskTest(TestCase):
+    """Тесты пакетного создания задач генерации."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt_version = PromptVersion.objects.create(
+            version_number=1,
+            prompt_content='Промпт',
+        )
+        self.content_type = ContentType.objects.create(app_label='store', model='product')
+        self.generations = [
+            {
+                'prompt_version': self.prompt_version,
+                'content_type': self.content_type,
+                'object_id': object_id,
+                'action': 'set_description',
+            }
+            for object_id in range(1, 6)
+        ]
+
+    def _mock_aitask(self, mock_aitask):
+        mock_aitask.side_effect = lambda **kwargs: Mock(**kwargs)
+        mock_aitask.objects.bulk_create.side_effect = lambda tasks: tasks
+        mock_aitask.dispatch_bulk = None
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_tasks_are_created_in_batches(self, mock_aitask):
+        """Тест: задачи сохраняются пачками и отправляются агенту."""
+        self._mock_aitask(mock_aitask)
+        agent = Mock()
+
+        tasks = create_generation_tasks_bulk(self.generations, agent=agent, batch_size=2)
+
+        self.assertEqual(len(tasks), 5)
+        self.assertEqual(mock_aitask.objects.bulk_create.call_count, 3)
+        self.assertEqual([task.context_data['model_id'] for task in tasks], [1, 2, 3, 4, 5])
+        self.assertTrue(all(task.agent is agent for task in tasks))
+        self.assertEqual(tasks[0].endpoint, 'content_generator_set_description')
+        for task in tasks:
+            task.dispatch.assert_called_once()
+        mock_aitask.objects.bulk_update.assert_not_called()
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_failed_dispatch_marks_tasks_in_one_update(self, mock_aitask):
+        """Тест: задачи с ошибкой отправки помечаются FAILURE одним обновлением."""
+        self._mock_aitask(mock_aitask)
+        original_bulk_create = mock_aitask.objects.bulk_create.side_effect
+
+        def bulk_create(tasks):
+            tasks[1].dispatch.side_effect = RuntimeError('Агент недоступен')
+            return original_bulk_create(tasks)
+
+        mock_aitask.objects.bulk_create.side_effect = bulk_create
+
+        tasks = create_generation_tasks_bulk(self.generations)
+
+        mock_aitask.objects.bulk_update.assert_called_once_with([tasks[1]], ['status', 'result'])
+        self.assertEqual(tasks[1].status, 'FAILURE')
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_bulk_dispatch_is_used_when_available(self, mock_aitask):
+        """Тест: при наличии AITask.dispatch_bulk пачка отправляется одним вызовом."""
+        self._mock_aitask(mock_aitask)
+        mock_aitask.dispatch_bulk = Mock()
+
+        tasks = create_generation_tasks_bulk(self.generations, batch_size=10)
+
+        mock_aitask.dispatch_bulk.assert_called_once_with(tasks)
+        tasks[0].dispatch.assert_not_called()
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_missing_dispatch_fails_before_saving(self, mock_aitask):
+        """Тест: без dispatch_bulk и dispatch задачи не сохраняются, ошибка понятна."""
+        self._mock_aitask(mock_aitask)
+        del mock_aitask.dispatch
+
+        with self.assertRaises(NotImplementedError):
+            create_generation_tasks_bulk(self.generations)
+
+        mock_aitask.objects.bulk_create.assert_not_called()
+
+
+class PrefixPayloadLayoutTest(TestCase):
+    """Тесты режима payload со стабильным префиксом."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        cache.clear()
+        invalidate_routing_cache()
+        system_prompt = Prompt.objects.create(name='Системный')
+        self.system_version = PromptVersion.objects.create(
+            prompt=system_prompt,
+            version_number=1,
+            prompt_content='Ты - редактор интернет-магазина',
+        )
+        prompt = Prompt.objects.create(name='Названия')
+        self.prompt_version = PromptVersion.objects.create(
+            prompt=prompt,
+            version_number=1,
+            prompt_content='Улучши название товара',
+        )
+        action, _ = Action.objects.get_or_create(
+            name='upgrade_name',
+            defaults={'label': 'Улучшить название', 'icon': '✨'}
+        )
+        action.system_prompt = system_prompt
+        action.prompt = prompt
+        action.save()
+        self.content_type = ContentType.objects.create(app_label='store', model='product')
+
+    def tearDown(self):
+        cache.clear()
+        invalidate_routing_cache()
+
+    def _payload(self, object_id, object_data):
+        return build_generation_task_data(
+            self.prompt_version, self.content_type, object_id, 'upgrade_name',
+            additional_data={'additional_prompt': 'Коротко'},
+            object_data=object_data,
+        )['payload']
+
+    @patch('content_generator.ai_interface_adapter.PAYLOAD_LAYOUT', 'prefix')
+    def test_stable_prefix_comes_first(self):
+        """Тест: системный промпт и текст версии идут первыми, данные объекта - последними."""
+        payload = self._payload(1, {'name': 'Товар 1', 'category': 'Чайники'})
+
+        self.assertEqual(list(payload.keys()), [
+            'layout', 'prefix_hash', 'system_prompt_hash', 'system_prompt',
+            'prompt_version_id', 'prompt_hash', 'prompt', 'additional_prompt', 'object_data',
+        ])
+        self.assertEqual(payload['system_prompt'], self.system_version.prompt_content)
+        self.assertEqual(payload['prompt'], self.prompt_version.prompt_content)
+        self.assertEqual(payload['object_data'], '{"category": "Чайники", "name": "Товар 1"}')
+
+    @patch('content_generator.ai_interface_adapter.PAYLOAD_LAYOUT', 'prefix')
+    def test_prefix_hash_is_shared_between_objects(self):
+        """Тест: префикс одинаков для разных объектов действия."""
+        first = self._payload(1, {'name': 'Товар 1'})
+        second = self._payload(2, {'name': 'Товар 2'})
+
+        self.assertEqual(first['prefix_hash'], second['prefix_hash'])
+        self.assertNotEqual(first['object_data'], second['object_data'])
+
+    @patch('content_generator.ai_interface_adapter.PAYLOAD_LAYOUT', 'prefix')
+    def test_system_prompt_of_generator_action(self):
+        """Тест: системный промпт берется из действия генератора, а не из одноименного действия другого генератора."""
+        generator_prompt = Prompt.objects.create(name='Системный для категорий')
+        generator_version = PromptVersion.objects.create(
+            prompt=generator_prompt,
+            version_number=1,
+            prompt_content='Ты - редактор каталога категорий',
+        )
+        generator_action = Action.objects.create(
+            name='upgrade_name',
+            label='Улучшить название категории',
+            icon='✨',
+            system_prompt=generator_prompt,
+        )
+        generator = ContentGenerator.objects.create(
+            content_type=ContentType.objects.create(app_label='store', model='category'),
+        )
+        generator.actions.add(generator_action)
+
+        payload = build_generation_task_data(
+            self.prompt_version, self.content_type, 1, 'upgrade_name', generator=generator,
+        )['payload']
+
+        self.assertEqual(payload['system_prompt'], generator_version.prompt_content)
+        self.assertEqual(payload['system_prompt_hash'], generator_version.content_hash)
+
+    @patch('content_generator.utils.record_prompt_cache_usage')
+    def test_cache_usage_recorded_once_per_task(self, mock_record):
+        """Тест: использование кэша провайдера учитывается при первом успешном результате задачи."""
+        ContentType.objects.get_or_create(app_label='store', model='product')
+        ai_task = AITaskMock(
+            id=501,
+            status='SUCCESS',
+            context_data={
+                'prompt_version_id': self.prompt_version.id,
+                'class_name': 'product',
+                'model_id': 1,
+                'action': 'upgrade_name',
+            },
+            result={'name': 'Новое название', 'usage': {'prompt_tokens': 100, 'cached_tokens': 80}},
+        )
+
+        process_generation_result(ai_task)
+        process_generation_result(ai_task)
+
+        mock_record.assert_called_once_with(self.prompt_version.id, ai_task.result)
+
+
+class BatchGenerationTest(TestCase):
+    """Тесты пакетной генерации нескольких объектов одним запросом."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        cache.clear()
+        self.prompt_version = PromptVersion.objects.create(
+            version_number=1,
+            prompt_content='Улучши названия товаров',
+        )
+        self.content_type, _ = ContentType.objects.get_or_create(app_label='store', model='product')
+
+    def tearDown(self):
+        cache.clear()
+
+    def _batch_task(self, status='SUCCESS', result=None):
+        return AITaskMock(
+            id=601,
+            status=status,
+            context_data={
+                'prompt_version_id': self.prompt_version.id,
+                'class_name': 'product',
+                'action': 'upgrade_name',
+                'batch': True,
+                'model_ids': [1, 2, 3],
+                'ab_variant': 'stable',
+            },
+            payload={'items': [
+                {'id': 1, 'data': {'name': 'Товар 1'}},
+                {'id': 2, 'data': {'name': 'Товар 2'}},
+                {'id': 3, 'data': {'name': 'Товар 3'}},
+            ]},
+            result=result,
+        )
+
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_batch_task_payload(self, mock_aitask):
+        """Тест: объекты передаются агенту одной задачей."""
+        mock_aitask.create_and_dispatch.return_value = Mock(id=1)
+
+        create_batch_generation_task(
+            self.prompt_version, self.content_type,
+            {1: {'name': 'Товар 1'}, 2: {'name': 'Товар 2'}}, 'upgrade_name',
+        )
+
+        call_kwargs = mock_aitask.create_and_dispatch.call_args[1]
+        self.assertEqual(call_kwargs['endpoint'], 'content_generator_upgrade_name_batch')
+        self.assertEqual(call_kwargs['context_data']['model_ids'], [1, 2])
+        self.assertTrue(call_kwargs['context_data']['batch'])
+        self.assertNotIn('model_id', call_kwargs['context_data'])
+        self.assertEqual(call_kwargs['payload']['items'][1], {'id': 2, 'data': {'name': 'Товар 2'}})
+
+    def test_split_batch_result(self):
+        """Тест разбиения результата: некорректные и чужие элементы пропускаются."""
+        parsed, failed = split_batch_result(
+            {'items': [
+                {'id': 1, 'name': 'Новое 1'},
+                {'id': '2', 'name': 'Новое 2'},
+                {'id': 9, 'name': 'Чужой'},
+                {'id': 'x', 'name': 'Без id'},
+                {'id': 3},
+            ]},
+            [1, 2, 3]
+        )
+        self.assertEqual(parsed, {1: {'name': 'Новое 1'}, 2: {'name': 'Новое 2'}})
+        self.assertEqual(failed, [3])
+
+        self.assertEqual(split_batch_result('[{"id": 1, "name": "A"}]', [1]), ({1: {'name': 'A'}}, []))
+        self.assertEqual(split_batch_result('не JSON', [1, 2]), ({}, [1, 2]))
+
+    @patch('content_generator.ai_interface_adapter.create_generation_tasks_bulk')
+    def test_result_split_into_rows_with_fallback(self, mock_bulk):
+        """Тест: результат разбивается на записи по объектам, остальные объекты уходят обычными задачами."""
+        ai_task = self._batch_task(result={'items': [
+            {'id': 1, 'name': 'Новое 1'},
+            {'id': 2, 'name': 'Новое 2'},
+        ]})
+
+        outcome = process_batch_generation_result(ai_task)
+
+        contents = GeneratedContent.objects.filter(ai_task_id=601).order_by('object_id')
+        self.assertEqual([content.object_id for content in contents], [1, 2])
+        self.assertEqual(contents[0].generated_data, {'name': 'Новое 1'})
+        self.assertEqual(contents[0].status, 'SUCCESS')
+        self.assertEqual(contents[0].action, 'upgrade_name')
+        self.assertEqual(sorted(outcome['created']), [content.id for content in contents])
+        self.assertEqual(outcome['fallback'], [3])
+
+        generations = mock_bulk.call_args[0][0]
+        self.assertEqual([generation['object_id'] for generation in generations], [3])
+        self.assertEqual(generations[0]['object_data'], {'name': 'Товар 3'})
+        self.assertEqual(generations[0]['additional_data'], {'ab_variant': 'stable'})
+
+        # Повторная обработка не создает дубликатов и повторных задач
+        process_batch_generation_result(ai_task)
+        self.assertEqual(GeneratedContent.objects.filter(ai_task_id=601).count(), 2)
+        mock_bulk.assert_called_once()
+
+    @patch('content_generator.ai_interface_adapter.create_generation_tasks_bulk')
+    def test_failed_batch_falls_back_to_single_tasks(self, mock_bulk):
+        """Тест: при ошибке пакетной задачи все объекты уходят обычными задачами."""
+        outcome = process_batch_generation_result(self._batch_task(status='FAILURE'))
+
+        self.assertEqual(outcome, {'created': [], 'fallback': [1, 2, 3]})
+        self.assertFalse(GeneratedContent.objects.filter(ai_task_id=601).exists())
+
+    @patch('content_generator.ai_interface_adapter.PAYLOAD_LAYOUT', 'prefix')
+    @patch('content_generator.ai_interface_adapter.AITask')
+    def test_fallback_uses_generator_of_batch_task(self, mock_aitask):
+        """Тест: обычные задачи после пакетной берут системный промпт действия ее генератора."""
+        invalidate_routing_cache()
+        generators = {}
+        for model, prompt_content in (('product', 'Ты - редактор товаров'), ('category', 'Ты - редактор категорий')):
+            system_prompt = Prompt.objects.create(name=f'Системный {model}')
+            PromptVersion.objects.create(prompt=system_prompt, version_number=1, prompt_content=prompt_content)
+            action = Action.objects.create(
+                name='upgrade_name',
+                label='Улучшить название',
+                icon='✨',
+                system_prompt=system_prompt,
+            )
+            generator = ContentGenerator.objects.create(
+                content_type=ContentType.objects.get_or_create(app_label='store', model=model)[0],
+            )
+            generator.actions.add(action)
+            generators[model] = generator
+
+        mock_aitask.create_and_dispatch.return_value = Mock(id=1)
+        create_batch_generation_task(
+            self.prompt_version, self.content_type,
+            {1: {'name': 'Товар 1'}}, 'upgrade_name', generator=generators['category'],
+        )
+        context_data = mock_aitask.create_and_dispatch.call_args[1]['context_data']
+        self.assertEqual(context_data['generator_id'], generators['category'].pk)
+
+        mock_aitask.side_effect = lambda **kwargs: Mock(**kwargs)
+        mock_aitask.objects.bulk_create.side_effect = lambda tasks: tasks
+        ai_task = self._batch_task(status='FAILURE')
+        ai_task.context_data['generator_id'] = generators['category'].pk
+
+        process_batch_generation_result(ai_task)
+
+        tasks = mock_aitask.objects.bulk_create.call_args[0][0]
+        self.assertEqual(len(tasks), 3)
+        self.assertTrue(all(task.payload['system_prompt'] == 'Ты - редактор категорий' for task in tasks))
+        invalidate_routing_cache()
+
+    @patch('content_generator.ai_interface_adapter.create_generation_tasks_bulk')
+    def test_utils_wrapper_handles_batch_task(self, mock_bulk):
+        """Тест: обработчик результатов распознает пакетную задачу."""
+        result = utils_process_result(self._batch_task(result={'items': [{'id': 1, 'name': 'Новое'}]}))
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(len(result['generated_content_ids']), 1)
+        self.assertEqual(result['fallback_object_ids'], [2, 3])
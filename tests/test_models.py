@@ -2,13 +2,17 @@
 Тесты для моделей content_generator.
 """
 
+import json
+
+from django.db import connection
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from datetime import timedelta
 
-from content_generator.models import PromptVersion, GeneratedContent
+from content_generator.fields import CompressedJSONField
+from content_generator.models import Prompt, PromptVersion, GeneratedContent
 
 User = get_user_model()
 
@@ -502,3 +506,163 @@ class GeneratedContentModelTest(TestCase):
         self.assertEqual(contents[0].id, content2.id)
         self.assertEqual(contents[1].id, content1.id)
 
+
+class PromptVersionNumberAllocationTest(TestCase):
+    """Тесты атомарного выделения номеров версий."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt = Prompt.objects.create(name='SEO')
+
+    def test_allocate_first_number(self):
+        """Тест выделения первого номера версии."""
+        self.assertEqual(list(PromptVersion.allocate_version_numbers(self.prompt)), [1])
+
+    def test_allocate_numbers_are_unique(self):
+        """Тест выделения разных номеров при повторных вызовах."""
+        first = PromptVersion.allocate_version_numbers(self.prompt)
+        second = PromptVersion.allocate_version_numbers(self.prompt, count=3)
+
+        self.assertEqual(list(first), [1])
+        self.assertEqual(list(second), [2, 3, 4])
+
+    def test_allocate_respects_existing_versions(self):
+        """Тест учета версий, созданных в обход счетчика."""
+        PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=7,
+            description='Версия 7',
+            prompt_content='Контент 7',
+            engineer_name='Инженер'
+        )
+
+        self.assertEqual(list(PromptVersion.allocate_version_numbers(self.prompt)), [8])
+
+    def test_create_next_version(self):
+        """Тест создания версий со следующими номерами."""
+        version1 = PromptVersion.create_next_version(
+            prompt=self.prompt,
+            description='Версия 1',
+            prompt_content='Контент 1',
+            engineer_name='Инженер'
+        )
+        version2 = PromptVersion.create_next_version(
+            prompt=self.prompt,
+            description='Версия 2',
+            prompt_content='Контент 2',
+            engineer_name='Инженер'
+        )
+
+        self.assertEqual(version1.version_number, 1)
+        self.assertEqual(version2.version_number, 2)
+
+
+class PromptVersionContentHashTest(TestCase):
+    """Тесты хэша содержимого версий промптов."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt = Prompt.objects.create(name='SEO')
+        self.version = PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=1,
+            description='Версия 1',
+            prompt_content='Контент 1',
+            engineer_name='Инженер'
+        )
+
+    def test_hash_computed_on_save(self):
+        """Тест вычисления хэша при сохранении."""
+        self.assertEqual(self.version.content_hash, PromptVersion.compute_content_hash('Контент 1'))
+        self.assertEqual(len(self.version.content_hash), 64)
+
+    def test_has_same_content(self):
+        """Тест сравнения содержимого по хэшу."""
+        self.assertTrue(self.version.has_same_content('Контент 1'))
+        self.assertFalse(self.version.has_same_content('Контент 2'))
+
+    def test_get_latest_if_identical(self):
+        """Тест сравнения содержимого только с последней версией промпта."""
+        self.assertEqual(PromptVersion.get_latest_if_identical(self.prompt, 'Контент 1'), self.version)
+        self.assertIsNone(PromptVersion.get_latest_if_identical(self.prompt, 'Контент 2'))
+
+        PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=2,
+            description='Версия 2',
+            prompt_content='Контент 2',
+            engineer_name='Инженер'
+        )
+        # Содержимое более старой версии не считается дубликатом: это откат
+        self.assertIsNone(PromptVersion.get_latest_if_identical(self.prompt, 'Контент 1'))
+
+
+class CompressedStorageTest(TestCase):
+    """Тесты сжатого хранения generated_data и списочных менеджеров."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt = Prompt.objects.create(name='SEO')
+        self.prompt_version = PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=1,
+            description='Версия 1',
+            prompt_content='Контент 1',
+            engineer_name='Инженер'
+        )
+        self.content_type = ContentType.objects.get_for_model(Prompt)
+
+    def _stored_value(self, content):
+        """Возвращает значение generated_data в том виде, в котором оно лежит в БД."""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT generated_data FROM generated_content WHERE id = %s', [content.id])
+            return cursor.fetchone()[0]
+
+    def test_large_data_is_compressed(self):
+        """Тест сжатия больших данных и их прозрачного чтения."""
+        generated_data = {'description_html': '<p>Описание товара</p>' * 500}
+        content = GeneratedContent.objects.create(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=1,
+            generated_data=generated_data,
+            status='SUCCESS'
+        )
+
+        stored = self._stored_value(content)
+        self.assertTrue(stored.startswith(CompressedJSONField.COMPRESSED_PREFIX))
+        self.assertLess(len(stored), len(generated_data['description_html']))
+
+        content.refresh_from_db()
+        self.assertEqual(content.generated_data, generated_data)
+
+    def test_small_data_stored_as_plain_json(self):
+        """Тест хранения небольших данных обычным JSON."""
+        content = GeneratedContent.objects.create(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=1,
+            generated_data={'title': 'Заголовок'},
+            status='SUCCESS'
+        )
+
+        self.assertEqual(json.loads(self._stored_value(content)), {'title': 'Заголовок'})
+        content.refresh_from_db()
+        self.assertEqual(content.generated_data, {'title': 'Заголовок'})
+
+    def test_list_managers_defer_heavy_fields(self):
+        """Тест отложенной загрузки тяжелых полей списочными менеджерами."""
+        GeneratedContent.objects.create(
+            prompt_version=self.prompt_version,
+            content_type=self.content_type,
+            object_id=1,
+            generated_data={'title': 'Заголовок'},
+            status='SUCCESS'
+        )
+
+        version = PromptVersion.list_objects.get(pk=self.prompt_version.pk)
+        content = GeneratedContent.list_objects.get(prompt_version=self.prompt_version)
+
+        self.assertIn('prompt_content', version.get_deferred_fields())
+        self.assertIn('generated_data', content.get_deferred_fields())
+        self.assertEqual(content.generated_data, {'title': 'Заголовок'})
@@ -2,18 +2,51 @@
 Тесты для утилит content_generator.
 """
 
+import threading
+from datetime import date
+from unittest.mock import Mock, patch
+
+from asgiref.sync import async_to_sync
 from django.test import TestCase
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from django.core.cache import cache
 
-from content_generator.models import PromptVersion, GeneratedContent
+from content_generator.models import Action, Prompt, PromptVersion, GeneratedContent
+from content_generator.routing import (
+    ROUTING_CACHE_VERSION_KEY,
+    aroute_prompt_version,
+    invalidate_routing_cache,
+    route_prompt_version,
+)
+from content_generator.partitioning import (
+    add_months,
+    create_monthly_partitions,
+    get_expired_partitions,
+    get_partition_name,
+    is_postgresql,
+)
 from content_generator.utils import (
     compare_prompt_versions,
     get_prompt_statistics,
     sanitize_html_tags,
     validate_prompt_length,
-    validate_generation_data
+    validate_generation_data,
+    build_payloads_for_queryset,
+    get_payload_queryset,
+    get_global_site_preferences,
+    get_model_site_preferences,
+    invalidate_site_preferences_cache,
+    get_text_from_html,
+    estimate_tokens,
+    trim_text_to_tokens,
+    apply_input_budget,
+    export_prompts_jsonl,
+    import_prompts_jsonl,
+    get_prompt_for_action,
+    extract_prompt_cache_usage,
+    record_prompt_cache_usage,
+    get_prompt_cache_metrics,
 )
 
 
@@ -253,6 +286,206 @@ class GetPromptStatisticsTest(TestCase):
         self.assertEqual(stats1.keys(), stats2.keys())
 
 
+class BuildPayloadsTest(TestCase):
+    """Тесты для пакетного построения payload'ов."""
+
+    def test_unknown_action_raises(self):
+        """Тест ошибки для действия без построителя payload."""
+        with self.assertRaises(ValueError):
+            list(build_payloads_for_queryset(PromptVersion.objects.all(), 'unknown_action'))
+
+    def test_payload_queryset_without_config(self):
+        """Тест queryset'а модели без настроек связанных данных."""
+        queryset = PromptVersion.objects.all()
+        self.assertEqual(get_payload_queryset(queryset).query.select_related, False)
+
+    @patch.dict('content_generator.utils.PAYLOAD_RELATED', {
+        'promptversion': {
+            'select_related': ['prompt', 'missing', 'generated_content'],
+            'prefetch_related': ['generated_content', 'missing__relation'],
+        },
+    })
+    def test_payload_queryset_skips_unknown_relations(self):
+        """Тест пропуска несуществующих и множественных связей в select_related."""
+        queryset = get_payload_queryset(PromptVersion.objects.all())
+        self.assertEqual(queryset.query.select_related, {'prompt': {}})
+        self.assertEqual(queryset._prefetch_related_lookups, ('generated_content',))
+
+    @patch('content_generator.utils.SitePreferences')
+    @patch.dict('content_generator.utils.PAYLOAD_RELATED', {
+        'promptversion': {
+            'select_related': ['prompt'],
+            'prefetch_related': ['generated_content'],
+        },
+    })
+    def test_queries_do_not_grow_with_objects(self, mock_site_preferences):
+        """Тест: количество запросов зависит от количества чанков, а не объектов."""
+        invalidate_site_preferences_cache()
+        mock_site_preferences.get_model.return_value = 'preferences'
+        prompt = Prompt.objects.create(name='SEO')
+        content_type = ContentType.objects.get_for_model(Prompt)
+        for number in range(1, 6):
+            version = PromptVersion.objects.create(
+                prompt=prompt,
+                version_number=number,
+                description=f'Версия {number}',
+                prompt_content=f'Контент {number}',
+                engineer_name='Инженер'
+            )
+            GeneratedContent.objects.create(
+                prompt_version=version,
+                content_type=content_type,
+                object_id=prompt.id,
+                generated_data={},
+                status='SUCCESS'
+            )
+
+        def builder(model, site_preferences=None, additional_prompt=None):
+            return None, {
+                'prompt': model.prompt.name,
+                'generated': len(model.generated_content.all()),
+                'preferences': site_preferences,
+            }
+
+        with patch.dict('content_generator.utils.PAYLOAD_BUILDERS', {'test_action': builder}):
+            # 1 запрос ID + по 2 запроса (объекты и prefetch) на каждый из 3 чанков
+            with self.assertNumQueries(7):
+                payloads = list(build_payloads_for_queryset(
+                    PromptVersion.objects.filter(prompt=prompt), 'test_action', batch_size=2
+                ))
+
+        self.assertEqual(len(payloads), 5)
+        self.assertTrue(all(data == {'prompt': 'SEO', 'generated': 1, 'preferences': 'preferences'}
+                            for _, _, data in payloads))
+        mock_site_preferences.get_model.assert_called_once()
+        invalidate_site_preferences_cache()
+
+
+class SitePreferencesCacheTest(TestCase):
+    """Тесты для кэша настроек сайта."""
+
+    def setUp(self):
+        """Очищаем кэш перед каждым тестом."""
+        invalidate_site_preferences_cache()
+
+    def tearDown(self):
+        """Очищаем кэш после каждого теста."""
+        invalidate_site_preferences_cache()
+
+    @patch('content_generator.utils.SitePreferences')
+    def test_preferences_cached(self, mock_site_preferences):
+        """Тест повторного использования настроек из кэша."""
+        mock_site_preferences.get_model.return_value = 'preferences'
+        get_global_site_preferences()
+        get_global_site_preferences()
+
+        mock_site_preferences.get_model.assert_called_once()
+
+    @patch('content_generator.utils.SitePreferences')
+    def test_missing_preferences_cached(self, mock_site_preferences):
+        """Тест кэширования отсутствующих настроек."""
+        mock_site_preferences.get_model.return_value = None
+        self.assertIsNone(get_global_site_preferences())
+        self.assertIsNone(get_global_site_preferences())
+
+        mock_site_preferences.get_model.assert_called_once()
+
+    @patch('content_generator.utils.SitePreferences')
+    def test_sites_without_preferences_share_global(self, mock_site_preferences):
+        """Тест: для сайтов без своих настроек глобальные настройки загружаются один раз."""
+        mock_site_preferences.get_model.return_value = 'preferences'
+        for site_id in range(1, 4):
+            model = Mock(site_id=site_id)
+            model.site.preferences = None
+            self.assertEqual(get_model_site_preferences(model), 'preferences')
+
+        mock_site_preferences.get_model.assert_called_once()
+
+    @patch('content_generator.utils.SitePreferences')
+    def test_preferences_invalidation(self, mock_site_preferences):
+        """Тест сброса кэша настроек."""
+        mock_site_preferences.get_model.return_value = 'preferences'
+        get_global_site_preferences()
+        invalidate_site_preferences_cache()
+        get_global_site_preferences()
+
+        self.assertEqual(mock_site_preferences.get_model.call_count, 2)
+
+    @patch('content_generator.utils.SitePreferences')
+    def test_invalidation_without_version_key(self, mock_site_preferences):
+        """Тест сброса кэша после вытеснения ключа версии."""
+        mock_site_preferences.get_model.return_value = 'preferences'
+        get_global_site_preferences()
+        cache.delete('content_generator_site_preferences_version')
+        invalidate_site_preferences_cache()
+        get_global_site_preferences()
+
+        self.assertEqual(mock_site_preferences.get_model.call_count, 2)
+
+
+class PromptsJsonlTest(TestCase):
+    """Тесты экспорта и импорта промптов в JSON Lines."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.prompt = Prompt.objects.create(name='SEO', description='SEO промпт')
+        PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=1,
+            description='Версия 1',
+            prompt_content='Контент 1',
+            engineer_name='Инженер'
+        )
+        PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=2,
+            description='Версия 2',
+            prompt_content='Контент 2',
+            engineer_name='Инженер'
+        )
+
+    def test_export_lines(self):
+        """Тест формата экспорта."""
+        lines = list(export_prompts_jsonl())
+
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"type": "prompt"', lines[0])
+        self.assertIn('"version_number": 1', lines[1])
+
+    def test_import_deduplicates_existing_versions(self):
+        """Тест пропуска версий с уже существующим содержимым."""
+        lines = list(export_prompts_jsonl())
+        stats = import_prompts_jsonl(lines)
+
+        self.assertEqual(stats['prompts_created'], 0)
+        self.assertEqual(stats['versions_created'], 0)
+        self.assertEqual(stats['versions_skipped'], 2)
+
+    def test_import_creates_prompts_and_versions(self):
+        """Тест создания новых промптов и версий."""
+        lines = [
+            '{"type": "prompt", "name": "Описание", "description": ""}',
+            '{"type": "version", "prompt": "Описание", "version_number": 5, "description": "v5", "prompt_content": "B", "engineer_name": "Инженер"}',
+            '{"type": "version", "prompt": "Описание", "version_number": 3, "description": "v3", "prompt_content": "A", "engineer_name": "Инженер"}',
+            '{"type": "version", "prompt": "Описание", "version_number": 6, "description": "v6", "prompt_content": "A", "engineer_name": "Инженер"}',
+        ]
+        stats = import_prompts_jsonl(lines)
+
+        self.assertEqual(stats['prompts_created'], 1)
+        self.assertEqual(stats['versions_created'], 2)
+        self.assertEqual(stats['versions_skipped'], 1)
+        prompt = Prompt.objects.get(name='Описание')
+        self.assertEqual(
+            list(prompt.versions.order_by('version_number').values_list('version_number', 'prompt_content')),
+            [(1, 'A'), (2, 'B')]
+        )
+
+    def test_import_invalid_line(self):
+        """Тест ошибки при некорректной строке."""
+        with self.assertRaises(ValueError):
+            import_prompts_jsonl(['не json'])
+
+
 class SanitizeHtmlTagsTest(TestCase):
     """Тесты для функции sanitize_html_tags."""
 
@@ -295,6 +528,26 @@ class SanitizeHtmlTagsTest(TestCase):
         # Запрещенные теги должны быть удалены
         self.assertNotIn('<script>', result)
 
+    def test_sanitize_allowed_tags_escapes_text(self):
+        """Тест экранирования текста при сохранении разрешенных тегов."""
+        text = '<p>a &amp; b</p><div>c</div>'
+        result = sanitize_html_tags(text, allowed_tags=['p'])
+
+        self.assertEqual(result, '<p>a &amp; b</p>c')
+
+    def test_sanitize_allowed_tags_matches_tree_output(self):
+        """Тест совпадения вывода с деревом BeautifulSoup: закрытие тегов и пустые элементы."""
+        cases = [
+            ('<div>A<p>B', 'A<p>B</p>'),
+            ('<div><p>A</div>B</p>', '<p>A</p>B'),
+            ('x</p>y', 'xy'),
+            ('a<br>b<br/>c</br>', 'a<br/>b<br/>c'),
+            ('<p/>x', '<p></p>x'),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(sanitize_html_tags(text, allowed_tags=['p', 'br'], use_cache=False), expected)
+
     def test_sanitize_html_entities(self):
         """Тест обработки HTML-сущностей."""
         text = 'Текст с &nbsp; и &amp; символами'
@@ -305,6 +558,94 @@ class SanitizeHtmlTagsTest(TestCase):
         self.assertIn('&', result)  # &amp; -> &
 
 
+class GetTextFromHtmlTest(TestCase):
+    """Тесты для функции get_text_from_html."""
+
+    def test_extracts_text_with_separator(self):
+        """Тест извлечения текста с разделителем между фрагментами."""
+        html = '<div><p>Первый</p><p>Второй <b>абзац</b></p></div>'
+        self.assertEqual(get_text_from_html(html), 'Первый Второй абзац')
+
+    def test_skips_script_and_style(self):
+        """Тест пропуска содержимого script и style."""
+        html = '<p>Текст</p><script>var a = 1;</script><style>p {}</style>'
+        self.assertEqual(get_text_from_html(html), 'Текст')
+
+    def test_decodes_entities(self):
+        """Тест декодирования HTML-сущностей."""
+        self.assertEqual(get_text_from_html('<p>a &lt; b &amp; c</p>'), 'a < b & c')
+
+    def test_empty_input(self):
+        """Тест обработки пустого значения."""
+        self.assertEqual(get_text_from_html(None), '')
+        self.assertEqual(get_text_from_html(''), '')
+
+    def test_cached_result_matches(self):
+        """Тест совпадения результата с кэшем и без него."""
+        html = '<p>Кэшируемый <i>текст</i></p>'
+        self.assertEqual(get_text_from_html(html), get_text_from_html(html, use_cache=False))
+
+    @patch('content_generator.utils.HTML_TEXT_CACHE_SIZE', 4)
+    def test_cache_is_thread_safe(self):
+        """Тест параллельного использования кэша с вытеснением записей."""
+        errors = []
+
+        def worker(offset):
+            try:
+                for number in range(200):
+                    text = f'<p>Текст {(number + offset) % 8}</p>'
+                    self.assertEqual(get_text_from_html(text), f'Текст {(number + offset) % 8}')
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+
+class InputBudgetTest(TestCase):
+    """Тесты для бюджета входных данных в токенах."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        self.long_text = 'Прочный корпус из алюминия. Защита от влаги IP67. ' * 50
+
+    def test_estimate_tokens(self):
+        """Тест оценки количества токенов."""
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertGreater(estimate_tokens(self.long_text), estimate_tokens('Прочный корпус'))
+
+    def test_trim_text_within_budget(self):
+        """Тест обрезки текста до бюджета."""
+        result = trim_text_to_tokens(self.long_text, 50)
+
+        self.assertLessEqual(estimate_tokens(result), 50)
+        self.assertTrue(self.long_text.startswith(result))
+
+    def test_trim_short_text_unchanged(self):
+        """Тест сохранения текста, укладывающегося в бюджет."""
+        self.assertEqual(trim_text_to_tokens('Короткий текст', 50), 'Короткий текст')
+
+    def test_apply_input_budget_trims_fields(self):
+        """Тест сокращения полей payload'а до бюджета действия."""
+        data = {'name': 'Товар', 'description': self.long_text}
+        result = apply_input_budget('set_seo_params', data)
+
+        self.assertEqual(result['name'], 'Товар')
+        self.assertLess(len(result['description']), len(self.long_text))
+        # Исходные данные не изменяются
+        self.assertEqual(data['description'], self.long_text)
+
+    def test_apply_input_budget_unknown_action(self):
+        """Тест payload'а действия без бюджета."""
+        data = {'description': self.long_text}
+        self.assertEqual(apply_input_budget('unknown_action', data), data)
+
+
 class ValidatePromptLengthTest(TestCase):
     """Тесты для функции validate_prompt_length."""
 
@@ -494,3 +835,179 @@ class ValidateGenerationDataTest(TestCase):
             is_valid, error = validate_generation_data(data)
             self.assertTrue(is_valid, f'Action {action} should be valid')
 
+
+
+class GeneratedContentPartitioningTest(TestCase):
+    """Тесты вспомогательных функций секционирования generated_content."""
+
+    def test_add_months(self):
+        """Тест сдвига месяца с переходом через год."""
+        self.assertEqual(add_months(date(2026, 11, 1), 1), date(2026, 12, 1))
+        self.assertEqual(add_months(date(2026, 12, 1), 1), date(2027, 1, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -13), date(2024, 12, 1))
+
+    def test_partition_name(self):
+        """Тест имени помесячной секции."""
+        self.assertEqual(get_partition_name(date(2026, 3, 1)), 'generated_content_p202603')
+
+    def test_expired_partitions_skip_legacy_and_default(self):
+        """Тест: legacy-секция и секция по умолчанию не отсоединяются."""
+        partitions = [
+            ('generated_content_default', None),
+            ('generated_content_legacy', date(2025, 1, 1)),
+            ('generated_content_p202501', date(2025, 2, 1)),
+            ('generated_content_p202603', date(2026, 4, 1)),
+        ]
+        self.assertEqual(get_expired_partitions(partitions, date(2026, 1, 1)), ['generated_content_p202501'])
+
+    def test_requires_postgresql(self):
+        """Тест, что на других СУБД обслуживание секций недоступно."""
+        if is_postgresql():
+            self.skipTest('Используется PostgreSQL')
+        with self.assertRaises(NotImplementedError):
+            create_monthly_partitions()
+
+
+class PromptRoutingTest(TestCase):
+    """Тесты A/B-маршрутизации генераций между версиями промптов."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        invalidate_routing_cache()
+        self.prompt = Prompt.objects.create(name='Названия')
+        self.version1 = PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=1,
+            description='Версия 1',
+            prompt_content='Контент 1',
+            engineer_name='Инженер'
+        )
+        self.version2 = PromptVersion.objects.create(
+            prompt=self.prompt,
+            version_number=2,
+            description='Версия 2',
+            prompt_content='Контент 2',
+            engineer_name='Инженер'
+        )
+        self.action, _ = Action.objects.get_or_create(
+            name='upgrade_name',
+            defaults={'label': 'Улучшить название', 'icon': '✨'}
+        )
+        self.action.prompt = self.prompt
+        self.action.save()
+
+    def test_latest_version_by_default(self):
+        """Тест выбора последней версии промпта без настройки A/B."""
+        self.assertEqual(route_prompt_version(None, 'upgrade_name', 1), (self.version2, 'stable'))
+        self.assertEqual(get_prompt_for_action(None, 'upgrade_name', 1), self.version2)
+
+    def test_unknown_action(self):
+        """Тест отсутствия версии для неизвестного действия."""
+        self.assertEqual(route_prompt_version(None, 'unknown_action', 1), (None, 'stable'))
+
+    def test_candidate_traffic_split_is_sticky(self):
+        """Тест доли трафика кандидата и закрепления объекта за группой."""
+        self.action.stable_version = self.version1
+        self.action.candidate_version = self.version2
+        self.action.candidate_traffic_percent = 30
+        self.action.save()
+
+        variants = [route_prompt_version(None, 'upgrade_name', object_id)[1] for object_id in range(1000)]
+        candidate_share = variants.count('candidate') / len(variants)
+        self.assertGreater(candidate_share, 0.25)
+        self.assertLess(candidate_share, 0.35)
+
+        for object_id in range(50):
+            self.assertEqual(
+                route_prompt_version(None, 'upgrade_name', object_id),
+                route_prompt_version(None, 'upgrade_name', object_id)
+            )
+
+    def test_route_is_cached_and_invalidated(self):
+        """Тест кэширования маршрута и его сброса при изменении действия."""
+        route_prompt_version(None, 'upgrade_name', 1)
+        with self.assertNumQueries(0):
+            route_prompt_version(None, 'upgrade_name', 1)
+
+        self.action.stable_version = self.version1
+        self.action.save()
+        self.assertEqual(route_prompt_version(None, 'upgrade_name', 1), (self.version1, 'stable'))
+
+    def test_route_invalidated_by_other_process(self):
+        """Тест сброса маршрута по версии из общего кэша (изменение в другом процессе)."""
+        route_prompt_version(None, 'upgrade_name', 1)
+
+        # Другой процесс изменил действие и увеличил версию; локальный кэш не очищался
+        Action.objects.filter(id=self.action.id).update(stable_version=self.version1)
+        cache.incr(ROUTING_CACHE_VERSION_KEY)
+
+        self.assertEqual(route_prompt_version(None, 'upgrade_name', 1), (self.version1, 'stable'))
+
+    def test_import_invalidates_routes(self):
+        """Тест сброса маршрутов после импорта версий через bulk_create."""
+        self.assertEqual(route_prompt_version(None, 'upgrade_name', 1), (self.version2, 'stable'))
+
+        import_prompts_jsonl([
+            '{"type": "prompt", "name": "Названия", "description": ""}',
+            '{"type": "version", "prompt": "Названия", "version_number": 1, "description": "v3", "prompt_content": "Контент 3", "engineer_name": "Инженер"}',
+        ])
+
+        version, variant = route_prompt_version(None, 'upgrade_name', 1)
+        self.assertEqual(version.prompt_content, 'Контент 3')
+        self.assertEqual(variant, 'stable')
+
+    def test_async_routing_matches_sync_and_uses_cache(self):
+        """Тест асинхронного выбора версии: тот же результат и маршрут из кэша без запросов."""
+        self.action.stable_version = self.version1
+        self.action.candidate_version = self.version2
+        self.action.candidate_traffic_percent = 50
+        self.action.save()
+
+        for object_id in range(20):
+            self.assertEqual(
+                async_to_sync(aroute_prompt_version)(None, 'upgrade_name', object_id),
+                route_prompt_version(None, 'upgrade_name', object_id)
+            )
+
+        with self.assertNumQueries(0):
+            async_to_sync(aroute_prompt_version)(None, 'upgrade_name', 1)
+
+
+class PromptCacheMetricsTest(TestCase):
+    """Тесты метрик кэширования промптов у провайдера."""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_extract_usage_formats(self):
+        """Тест разбора usage разных провайдеров."""
+        self.assertEqual(
+            extract_prompt_cache_usage({'usage': {
+                'input_tokens': 100, 'cache_read_input_tokens': 900, 'cache_creation_input_tokens': 0,
+            }}),
+            (1000, 900)
+        )
+        self.assertEqual(
+            extract_prompt_cache_usage({'usage': {'prompt_tokens': 1000, 'prompt_tokens_details': {'cached_tokens': 512}}}),
+            (1000, 512)
+        )
+        self.assertEqual(extract_prompt_cache_usage({'usage': {'input_tokens': 50}}), (50, 0))
+        self.assertIsNone(extract_prompt_cache_usage({'title': 'Без usage'}))
+        self.assertIsNone(extract_prompt_cache_usage(None))
+
+    def test_metrics_are_accumulated(self):
+        """Тест накопления счетчиков и расчета долей."""
+        record_prompt_cache_usage(1, {'usage': {'prompt_tokens': 1000, 'cached_tokens': 800}})
+        record_prompt_cache_usage(1, {'usage': {'prompt_tokens': 1000, 'cached_tokens': 0}})
+        self.assertFalse(record_prompt_cache_usage(1, {}))
+
+        metrics = get_prompt_cache_metrics(1)
+
+        self.assertEqual(metrics['requests'], 2)
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['hit_rate'], 50.0)
+        self.assertEqual(metrics['cached_token_share'], 40.0)
+        self.assertEqual(get_prompt_cache_metrics(2)['requests'], 0)
@@ -2,14 +2,17 @@
 Тесты для представлений content_generator.
 """
 
-from django.test import TestCase, Client
+from django.http import JsonResponse
+from django.test import TestCase, Client, RequestFactory
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 
-from content_generator.models import PromptVersion, GeneratedContent
+from content_generator.models import Prompt, PromptVersion, GeneratedContent
+from content_generator.idempotency import idempotent
 
 User = get_user_model()
 
@@ -137,6 +140,34 @@ class PromptVersionListViewTest(BaseViewTest):
         self.assertEqual(response.status_code, 200)
         self.assertIn('versions_with_stats', response.context)
 
+    def test_list_view_uses_preview_and_annotated_statistics(self):
+        """Тест, что список не загружает полный текст промпта и берет статистику из аннотаций."""
+        GeneratedContent.objects.create(
+            prompt_version=self.prompt_version1,
+            content_type=self.content_type,
+            object_id=1,
+            generated_data={'test': 'data'},
+            status='SUCCESS',
+            reviewed_at=timezone.now(),
+            rating=4
+        )
+
+        self.client.login(email='admin@test.com', password='testpass123')
+        response = self.client.get(reverse('prompt_version_list'))
+        self.assertEqual(response.status_code, 200)
+
+        items = {item['version'].id: item for item in response.context['versions_with_stats']}
+        version = items[self.prompt_version1.id]['version']
+        self.assertIn('prompt_content', version.get_deferred_fields())
+        self.assertEqual(version.content_preview, 'Содержимое версии 1')
+        self.assertEqual(items[self.prompt_version1.id]['stats'], {
+            'generated_count': 1,
+            'reviewed_count': 1,
+            'review_percentage': 100.0,
+            'average_rating': 4.0,
+        })
+        self.assertContains(response, 'Содержимое версии 1')
+
 
 class PromptVersionDetailViewTest(BaseViewTest):
     """Тесты для PromptVersionDetailView."""
@@ -370,6 +401,57 @@ class PromptVersionCloneViewTest(BaseViewTest):
         expected_description = f'Клон версии {self.prompt_version1.version_number}: {self.prompt_version1.description}'
         self.assertEqual(cloned_version.description, expected_description)
 
+    def test_clone_view_reuses_unchanged_clone(self):
+        """Тест повторного клонирования без создания дубликата."""
+        self.client.login(email='admin@test.com', password='testpass123')
+        url = reverse('prompt_version_clone', kwargs={'id': self.prompt_version1.id})
+        
+        self.client.get(url)
+        count_after_first_clone = PromptVersion.objects.count()
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(PromptVersion.objects.count(), count_after_first_clone)
+
+    def test_clone_view_rolls_back_to_older_content(self):
+        """Тест: клон старой версии создается, если последняя версия отличается (откат)."""
+        prompt = Prompt.objects.create(name='SEO')
+        version1 = PromptVersion.objects.create(
+            prompt=prompt,
+            version_number=1,
+            description='Версия 1',
+            prompt_content='Содержимое 1',
+            engineer_name='Иван Иванов'
+        )
+        PromptVersion.objects.create(
+            prompt=prompt,
+            version_number=2,
+            description='Версия 2',
+            prompt_content='Содержимое 2',
+            engineer_name='Иван Иванов'
+        )
+        self.client.login(email='admin@test.com', password='testpass123')
+        url = reverse('prompt_version_clone', kwargs={'id': version1.id})
+
+        # Последняя версия отличается - клон создается
+        self.client.get(url)
+        self.assertEqual(PromptVersion.get_latest_version(prompt).prompt_content, 'Содержимое 1')
+
+        # Последняя версия уже содержит текст версии 1 - дубликат не создается
+        self.client.get(url)
+        self.assertEqual(prompt.versions.count(), 3)
+
+        # После новой версии клон версии 1 снова создается
+        PromptVersion.objects.create(
+            prompt=prompt,
+            version_number=4,
+            description='Версия 4',
+            prompt_content='Содержимое 4',
+            engineer_name='Иван Иванов'
+        )
+        self.client.get(url)
+        self.assertEqual(prompt.versions.count(), 5)
+        self.assertEqual(PromptVersion.get_latest_version(prompt).prompt_content, 'Содержимое 1')
 
 class PromptVersionDeleteViewTest(BaseViewTest):
     """Тесты для PromptVersionDeleteView."""
@@ -487,3 +569,155 @@ class PromptVersionCompareViewTest(BaseViewTest):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['display_mode'], 'unified-diff')
 
+
+
+class ReviewQueueViewTest(BaseViewTest):
+    """Тесты для ReviewQueueView."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        super().setUp()
+        self.content = GeneratedContent.objects.create(
+            prompt_version=self.prompt_version1,
+            content_type=self.content_type,
+            object_id=1,
+            generated_data={'new_name': 'Новое название'},
+            status='SUCCESS'
+        )
+
+    def test_review_queue_requires_admin_or_engineer(self):
+        """Тест, что очередь проверки недоступна обычному пользователю."""
+        self.client.login(email='regular@test.com', password='testpass123')
+        response = self.client.get(reverse('review_queue'))
+        self.assertIn(response.status_code, [302, 403])
+
+    def test_review_queue_get_does_not_claim(self):
+        """Тест: открытие страницы очереди не резервирует записи."""
+        self.client.login(email='engineer@test.com', password='testpass123')
+
+        response = self.client.get(reverse('review_queue'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['contents'], [])
+        self.assertEqual(response.context['queue_size'], 1)
+
+        self.content.refresh_from_db()
+        self.assertIsNone(self.content.review_claimed_by)
+
+    def test_review_queue_claims_and_reviews(self):
+        """Тест выдачи записи и сохранения оценки."""
+        self.client.login(email='engineer@test.com', password='testpass123')
+        url = reverse('review_queue')
+
+        response = self.client.post(url, {'claim': '1', 'prompt_version': self.prompt_version1.id})
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(url, {'prompt_version': self.prompt_version1.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['contents'], [self.content])
+
+        response = self.client.post(url, {
+            'content_id': self.content.id,
+            'rating': 5,
+            'prompt_version': self.prompt_version1.id,
+        })
+        self.assertEqual(response.status_code, 302)
+
+        self.content.refresh_from_db()
+        self.assertEqual(self.content.status, 'REVIEWED')
+        self.assertEqual(self.content.rating, 5)
+        self.assertIsNone(self.content.review_claimed_by)
+
+
+class IdempotencyTest(TestCase):
+    """Тесты ключей идемпотентности для endpoints генерации."""
+
+    def setUp(self):
+        """Подготовка тестовых данных."""
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            email='user@test.com',
+            password='testpass123',
+            username='user'
+        )
+        self.calls = []
+
+        @idempotent
+        def view(request):
+            self.calls.append(request)
+            if request.GET.get('fail'):
+                return JsonResponse({'status': 'error'}, status=500)
+            return JsonResponse({'status': 'ok', 'task_id': len(self.calls)})
+
+        self.view = view
+
+    def tearDown(self):
+        cache.clear()
+
+    def _request(self, key='key-1', user=None, **params):
+        request = self.factory.get('/generate/', {'action': 'upgrade_name', **params}, HTTP_IDEMPOTENCY_KEY=key)
+        request.user = user or self.user
+        return request
+
+    def test_repeat_returns_original_response(self):
+        """Тест: повтор с тем же ключом возвращает исходный task_id без повторного выполнения."""
+        first = self.view(self._request())
+        second = self.view(self._request())
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+
+    def test_key_in_query_parameter(self):
+        """Тест: ключ можно передать параметром idempotency_key."""
+        request = self.factory.get('/generate/', {'action': 'upgrade_name', 'idempotency_key': 'key-2'})
+        request.user = self.user
+        self.view(request)
+        self.view(request)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        """Тест: запросы без ключа выполняются каждый раз."""
+        for _ in range(2):
+            request = self.factory.get('/generate/', {'action': 'upgrade_name'})
+            request.user = self.user
+            self.view(request)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_pending_key_returns_conflict(self):
+        """Тест: повтор во время выполнения первого запроса получает 409."""
+        responses = []
+
+        @idempotent
+        def slow_view(request):
+            # Повтор приходит, пока первый запрос еще выполняется
+            responses.append(slow_view(self._request()))
+            return JsonResponse({'status': 'ok', 'task_id': 1})
+
+        slow_view(self._request())
+        self.assertEqual(responses[0].status_code, 409)
+
+    def test_other_parameters_with_same_key_rejected(self):
+        """Тест: ключ нельзя использовать повторно с другими параметрами."""
+        self.view(self._request())
+        response = self.view(self._request(model_id='5'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_error_response_is_not_stored(self):
+        """Тест: после ответа с ошибкой запрос можно повторить с тем же ключом."""
+        self.assertEqual(self.view(self._request(fail='1')).status_code, 500)
+        self.view(self._request(fail='1'))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_keys_are_scoped_by_user(self):
+        """Тест: одинаковые ключи разных пользователей не пересекаются."""
+        other_user = User.objects.create_user(
+            email='other@test.com',
+            password='testpass123',
+            username='other'
+        )
+        self.view(self._request())
+        self.view(self._request(user=other_user))
+        self.assertEqual(len(self.calls), 2)
@@ -5,6 +5,12 @@ from . import views
 urlpatterns = [
     # Новый унифицированный endpoint
     path('generate/', api.generate, name='generate'),
+    # Одновременная генерация нескольких действий и статус группы задач
+    path('generate_multi/', api.generate_multi, name='generate_multi'),
+    path('generate_status/', api.generate_status, name='generate_status'),
+    # Асинхронные варианты для ASGI
+    path('generate_async/', api.generate_async, name='generate_async'),
+    path('generate_status_async/', api.generate_status_async, name='generate_status_async'),
     # API endpoint для получения actions по generator_id
     path('get_actions/', api.get_actions, name='get_actions'),
     # Виджет для айфрейма
@@ -25,6 +31,8 @@ urlpatterns = [
     path('admin/prompt-versions/<int:id>/', views.PromptVersionDetailView.as_view(), name='prompt_version_detail'),
     # Сравнение версий промптов
     path('admin/prompt-versions/compare/<int:id1>/<int:id2>/', views.PromptVersionCompareView.as_view(), name='prompt_version_compare'),
+    # Очередь проверки сгенерированного контента
+    path('admin/review-queue/', views.ReviewQueueView.as_view(), name='review_queue'),
     
     # ========== API ПОДСИСТЕМА PROMPTS ==========
     # REST API для версий промптов
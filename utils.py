@@ -1,20 +1,21 @@
 import re 
-import bs4 
 import json
+import time
+import hashlib
+import threading
 import requests
 import difflib
-from typing import Dict, List, Tuple, Any, Optional, Union
+from html import escape as html_escape
+from html.parser import HTMLParser
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Any, Optional, Union, Iterable, Iterator
 
-from django.db import models
+from django.db import models, transaction
 from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
-
-from bs4 import (
-    BeautifulSoup,
-    Tag,
-)
+from django.utils.module_loading import import_string
 
 from super_requester.models import SuperRequester
 from main.models import SitePreferences
@@ -32,27 +33,509 @@ url_to_set_some_params_for_product = getattr(settings, 'URL_TO_SET_TO_SOME_PARAM
 url_to_set_some_params_for_category = getattr(settings, 'URL_TO_SET_TO_SOME_PARAMS_FOR_CATEGORY', None)
 
 
-def set_seo_params_of_model(model):
-    """Генерирует SEO параметры для модели"""
-    # print('set_seo_params_of_model')
-    if not url_to_get_seo_params:
-        print('Урл для получения сео параметров, НЕ УСТАНОВЛЕН')
-        return
-    
+# ========== ПОДСИСТЕМА PAYLOADS ==========
+
+# Связанные данные, которые подгружаются пакетно при построении payload'ов.
+# Формат: {model_name: {'select_related': [...], 'prefetch_related': [...]}}.
+# Переопределяется через settings.CONTENT_GENERATOR_PAYLOAD_RELATED.
+# Связи, которых нет у модели, пропускаются.
+PAYLOAD_RELATED = getattr(settings, 'CONTENT_GENERATOR_PAYLOAD_RELATED', {
+    'product': {
+        'select_related': ['category', 'site', 'site__preferences'],
+        'prefetch_related': [],
+    },
+    'category': {
+        'select_related': ['site', 'site__preferences'],
+        'prefetch_related': [],
+    },
+})
+
+# Подстроки в названиях связей с атрибутами (для all_attributs_data_as_str и
+# get_category_attributes_as_str). Такие множественные связи подгружаются
+# prefetch'ем автоматически вместе с их внешними ключами.
+PAYLOAD_ATTRIBUTE_RELATION_MARKERS = getattr(
+    settings, 'CONTENT_GENERATOR_PAYLOAD_ATTRIBUTE_RELATION_MARKERS', ('attribut',)
+)
+
+DEFAULT_PAYLOAD_BATCH_SIZE = 500
+
+
+# Время жизни кэша настроек сайта (в секундах).
+# Настройки хранятся в общем кэше Django, поэтому сброс при сохранении
+# SitePreferences или Site виден всем процессам.
+SITE_PREFERENCES_CACHE_TTL = getattr(settings, 'CONTENT_GENERATOR_SITE_PREFERENCES_CACHE_TTL', 300)
+
+# Ключ версии кэша настроек сайта; сброс кэша увеличивает версию
+SITE_PREFERENCES_VERSION_KEY = 'content_generator_site_preferences_version'
+
+
+def _get_site_preferences_version() -> int:
+    """Возвращает текущую версию кэша настроек сайта."""
+    version = cache.get(SITE_PREFERENCES_VERSION_KEY)
+    if version is None:
+        # Начальная версия от времени, чтобы не совпасть с версией до вытеснения ключа
+        cache.add(SITE_PREFERENCES_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(SITE_PREFERENCES_VERSION_KEY, 0)
+    return version
+
+
+def _get_cached_preferences(site_id, loader):
+    """Возвращает настройки из общего кэша или загружает их через loader."""
+    cache_key = f'content_generator_site_preferences_{_get_site_preferences_version()}_{site_id or "global"}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached[0]
+
+    site_preferences = loader()
+    # Значение хранится в кортеже, чтобы кэшировать и отсутствие настроек
+    cache.set(cache_key, (site_preferences,), SITE_PREFERENCES_CACHE_TTL)
+    return site_preferences
+
+
+def get_global_site_preferences():
+    """Возвращает глобальные SitePreferences с кэшированием."""
+    return _get_cached_preferences(None, SitePreferences.get_model)
+
+
+def get_model_site_preferences(model):
+    """
+    Возвращает настройки сайта для модели: model.site.preferences, если они заданы,
+    иначе глобальные SitePreferences.
+    Результат кэшируется по site_id модели.
+    """
+    def load():
+        if hasattr(model, 'site') and model.site and hasattr(model.site, 'preferences') and model.site.preferences:
+            return model.site.preferences
+        return get_global_site_preferences()
+
+    site_id = getattr(model, 'site_id', None)
+    if site_id is None:
+        return get_global_site_preferences()
+    return _get_cached_preferences(site_id, load)
+
+
+def invalidate_site_preferences_cache(**kwargs):
+    """
+    Сбрасывает кэш настроек сайта во всех процессах, увеличивая версию кэша.
+    Подключается к сигналам post_save/post_delete SitePreferences и Site.
+    """
+    try:
+        cache.incr(SITE_PREFERENCES_VERSION_KEY)
+    except ValueError:
+        cache.set(SITE_PREFERENCES_VERSION_KEY, int(time.time() * 1000), None)
+
+
+# Бюджеты входных данных по действиям (в токенах).
+# fields - лимит токенов для отдельных полей payload'а;
+# max_tokens - общий лимит на все строковые поля payload'а.
+# Переопределяется через settings.CONTENT_GENERATOR_INPUT_BUDGETS.
+INPUT_BUDGETS = getattr(settings, 'CONTENT_GENERATOR_INPUT_BUDGETS', {
+    'set_seo_params': {
+        'fields': {'description': 100},
+        'max_tokens': 200,
+    },
+    'set_description': {
+        'fields': {'description': 1500, 'category_description': 1500, 'characteristics': 800},
+        'max_tokens': 3000,
+    },
+    'upgrade_name': {
+        'fields': {'attributes': 400},
+        'max_tokens': 600,
+    },
+    'set_some_params': {
+        'fields': {
+            'company_profile': 300,
+            'product_attributes': 800,
+            'category_attributes': 800,
+            'additional_prompt': 500,
+        },
+        'max_tokens': 2000,
+    },
+})
+
+# Регулярное выражение для оценки количества токенов: слова и отдельные знаки
+TOKEN_ESTIMATE_RE = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens_heuristic(text: str) -> int:
+    """
+    Локальная оценка количества токенов без обращения к токенизатору модели.
+    Латинские слова считаются по ~4 символа на токен, остальные (кириллица) - по ~3,
+    знаки препинания - по одному токену.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for match in TOKEN_ESTIMATE_RE.finditer(text):
+        word = match.group()
+        chars_per_token = 4 if word.isascii() else 3
+        tokens += -(-len(word) // chars_per_token)
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценивает количество токенов в тексте.
+    Оценщик подключается через settings.CONTENT_GENERATOR_TOKEN_ESTIMATOR
+    (путь к функции text -> int), по умолчанию - estimate_tokens_heuristic.
+    """
+    estimator_path = getattr(settings, 'CONTENT_GENERATOR_TOKEN_ESTIMATOR', None)
+    estimator = import_string(estimator_path) if estimator_path else estimate_tokens_heuristic
+    return estimator(text)
+
+
+def trim_text_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens по границе слова, по возможности - по границе предложения.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+
+    # Бинарный поиск наибольшего префикса по границам слов, укладывающегося в бюджет
+    boundaries = [match.end() for match in re.finditer(r'\S+', text)]
+    low, high = 0, len(boundaries) - 1
+    best = 0
+    while low <= high:
+        middle = (low + high) // 2
+        if estimate_tokens(text[:boundaries[middle]]) <= max_tokens:
+            best = boundaries[middle]
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    trimmed = text[:best]
+    # Обрезаем по концу предложения, если при этом теряется не больше трети текста
+    sentence_end = max(trimmed.rfind('. '), trimmed.rfind('! '), trimmed.rfind('? '))
+    if sentence_end >= len(trimmed) * 2 // 3:
+        trimmed = trimmed[:sentence_end + 1]
+    return trimmed.rstrip()
+
+
+def reduce_input_field(text: str, max_tokens: int, field: str, action: str) -> str:
+    """
+    Сокращает поле payload'а до бюджета.
+    Функция сокращения подключается через settings.CONTENT_GENERATOR_INPUT_REDUCER
+    (путь к функции (text, max_tokens, field, action) -> str, например, с суммаризацией),
+    по умолчанию текст обрезается через trim_text_to_tokens.
+    """
+    reducer_path = getattr(settings, 'CONTENT_GENERATOR_INPUT_REDUCER', None)
+    if reducer_path:
+        return import_string(reducer_path)(text, max_tokens, field, action)
+    return trim_text_to_tokens(text, max_tokens)
+
+
+def apply_input_budget(action: str, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Приводит payload действия к бюджету токенов из INPUT_BUDGETS.
+
+    Сначала каждое поле из budget['fields'] сокращается до своего лимита, затем,
+    если общий объем строковых полей превышает budget['max_tokens'], сокращаются
+    самые большие из этих полей.
+
+    Args:
+        action: Действие (set_seo_params, set_description, etc.)
+        data: Данные запроса
+
+    Returns:
+        Новый словарь с сокращенными полями (или исходные данные, если бюджет не задан)
+    """
+    budget = INPUT_BUDGETS.get(action)
+    if not budget or not data:
+        return data
+
+    data = dict(data)
+    field_limits = budget.get('fields', {})
+
+    token_counts = {}
+    for field, max_tokens in field_limits.items():
+        value = data.get(field)
+        if not isinstance(value, str):
+            continue
+        tokens = estimate_tokens(value)
+        if tokens > max_tokens:
+            data[field] = reduce_input_field(value, max_tokens, field, action)
+            tokens = estimate_tokens(data[field])
+        token_counts[field] = tokens
+
+    max_tokens = budget.get('max_tokens')
+    if max_tokens:
+        total = sum(
+            token_counts[field] if field in token_counts else estimate_tokens(value)
+            for field, value in data.items() if isinstance(value, str)
+        )
+        for field in sorted(token_counts, key=token_counts.get, reverse=True):
+            if total <= max_tokens:
+                break
+            target = max(token_counts[field] - (total - max_tokens), 0)
+            data[field] = reduce_input_field(data[field], target, field, action)
+            reduced = estimate_tokens(data[field])
+            total -= token_counts[field] - reduced
+            token_counts[field] = reduced
+
+    return data
+
+
+def build_seo_params_payload(model, site_preferences=None, additional_prompt=None):
+    """Формирует URL и данные запроса для генерации SEO параметров"""
     description = model.description
     if not description:
         description = get_text_from_html(model.get_temporary_info_value())
 
-    if len(description) > 317:
-        description = description[:317]    
-
     data = {
         'name': model.name,
         'description': description
-    }     
+    }
+    return url_to_get_seo_params, apply_input_budget('set_seo_params', data)
+
+
+def build_description_payload(model, site_preferences=None, additional_prompt=None):
+    """Формирует URL и данные запроса для генерации описания"""
+    description = model.get_temporary_info_value()
+    if not description:
+        print('temporary_info_value не получен')
+
+    name_model = model.__class__.__name__.lower()
+    if name_model == 'category': 
+        if site_preferences is None:
+            site_preferences = get_model_site_preferences(model)
+        company_name = getattr(site_preferences, 'company_name', '')
+        if not company_name:
+            company_name = getattr(get_global_site_preferences(), 'company_name', '')
+
+        data = {
+            'company_profile': company_name,
+            'category': model.name,
+            'category_description': description,
+        }        
+        return url_to_description_for_category, apply_input_budget('set_description', data)
+
+    if name_model == 'product': 
+        data = {
+            'category_name': model.category.name,
+            'name': model.name,
+            'description': description,
+            'characteristics': model.all_attributs_data_as_str,
+        }        
+        return url_to_description_for_product, apply_input_budget('set_description', data)
+
+    return None, None
+
+
+def build_upgrade_name_payload(model, site_preferences=None, additional_prompt=None):
+    """Формирует URL и данные запроса для улучшения названия"""
+    name_model = model.__class__.__name__.lower()
+    if name_model == 'product':
+        data = {
+            'name': model.name, 
+            'category': model.category.name, 
+            'attributes': model.all_attributs_data_as_str,
+        }      
+        return url_to_upgrade_name, apply_input_budget('upgrade_name', data)
+
+    return None, None
+
+
+def build_some_params_payload(model, site_preferences=None, additional_prompt=None):
+    """Формирует URL и данные запроса для комплексного улучшения параметров"""
+    if site_preferences is None:
+        site_preferences = get_model_site_preferences(model)
+
+    name_model = model._meta.model_name
+    if name_model == 'product':
+        category_name = ''
+        if model.category and model.category.name:
+            category_name = model.category.name
+
+        data = {
+            'company_name': getattr(site_preferences, 'company_name', ''),
+            'company_profile': getattr(site_preferences, 'company_profile', ''),
+            'product_name': model.name,
+            'category_name': category_name,
+            'product_attributes': model.all_attributs_data_as_str,
+            'additional_prompt': additional_prompt,
+        }   
+        return url_to_set_some_params_for_product, apply_input_budget('set_some_params', data)
+
+    if name_model == 'category':
+        data = {
+            'category_name': model.name,
+            'category_attributes': model.get_category_attributes_as_str(),
+            'company_name': getattr(site_preferences, 'company_name', ''),
+        }     
+        return url_to_set_some_params_for_category, apply_input_budget('set_some_params', data)
+
+    return None, None
+
+
+# Маппинг действий на функции построения payload'ов
+PAYLOAD_BUILDERS = {
+    'set_seo_params': build_seo_params_payload,
+    'set_description': build_description_payload,
+    'upgrade_name': build_upgrade_name_payload,
+    'set_some_params': build_some_params_payload,
+}
+
+
+def build_object_data(model, action, additional_prompt=None):
+    """
+    Возвращает данные объекта для действия (без URL) или None,
+    если действие не поддерживает построение payload для этого объекта.
+    """
+    builder = PAYLOAD_BUILDERS.get(action)
+    if builder is None:
+        return None
+    _, data = builder(
+        model,
+        site_preferences=get_model_site_preferences(model),
+        additional_prompt=additional_prompt,
+    )
+    return data
+
+
+def _get_relation(model, name):
+    """
+    Возвращает поле связи модели по имени поля, related_query_name или имени
+    обратного аксессора; None, если такой связи нет.
+    """
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        names = {field.name}
+        if field.auto_created and not field.concrete:
+            names.add(field.get_accessor_name())
+        if name in names:
+            return field
+    return None
+
+
+def _is_valid_lookup(model, lookup, single_valued=False):
+    """
+    Проверяет, что lookup вида 'a__b' проходит по связям модели.
+    single_valued - только связи с одним объектом (для select_related).
+    """
+    for name in lookup.split('__'):
+        field = _get_relation(model, name)
+        if field is None:
+            return False
+        if single_valued and (field.many_to_many or field.one_to_many):
+            return False
+        model = field.related_model
+    return True
+
+
+def get_attribute_prefetches(model) -> List[models.Prefetch]:
+    """
+    Возвращает Prefetch для множественных связей модели с атрибутами
+    (см. PAYLOAD_ATTRIBUTE_RELATION_MARKERS) вместе с их внешними ключами,
+    чтобы строковое представление атрибутов не делало запросов на объект.
+    """
+    prefetches = []
+    for field in model._meta.get_fields():
+        if not (field.many_to_many or field.one_to_many) or field.related_model is None:
+            continue
+        name = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if not any(marker in name for marker in PAYLOAD_ATTRIBUTE_RELATION_MARKERS):
+            continue
+
+        related_model = field.related_model
+        foreign_keys = [
+            related_field.name for related_field in related_model._meta.get_fields()
+            if related_field.many_to_one and related_field.concrete and related_field.related_model is not model
+        ]
+        prefetches.append(models.Prefetch(
+            name,
+            queryset=related_model._default_manager.select_related(*foreign_keys),
+        ))
+    return prefetches
+
+
+def get_payload_queryset(queryset):
+    """
+    Добавляет к queryset'у select_related/prefetch_related из PAYLOAD_RELATED
+    и prefetch связей с атрибутами, чтобы построение payload'ов не делало
+    ленивых запросов на каждый объект.
+    Связи, которых нет у модели, пропускаются.
+    """
+    model = queryset.model
+    related = PAYLOAD_RELATED.get(model._meta.model_name, {})
+
+    select_related = [
+        name for name in related.get('select_related', [])
+        if _is_valid_lookup(model, name, single_valued=True)
+    ]
+    prefetch_related = [
+        name for name in related.get('prefetch_related', [])
+        if _is_valid_lookup(model, name)
+    ]
+    prefetched_names = {name.split('__')[0] for name in prefetch_related}
+    prefetch_related.extend(
+        prefetch for prefetch in get_attribute_prefetches(model)
+        if prefetch.prefetch_through not in prefetched_names
+    )
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def build_payloads_for_queryset(queryset, action, additional_prompt=None, batch_size=DEFAULT_PAYLOAD_BATCH_SIZE):
+    """
+    Пакетно формирует данные запросов для действия по всем объектам queryset'а.
+
+    Объекты загружаются чанками по batch_size вместе со связанными данными
+    (см. PAYLOAD_RELATED), настройки сайта берутся из кэша по одному разу
+    на сайт в пределах чанка.
+    Количество запросов к БД растет с количеством чанков, а не объектов.
+
+    Args:
+        queryset: queryset целевых объектов (Product, Category и т.д.)
+        action: Действие (set_seo_params, set_description, upgrade_name, set_some_params)
+        additional_prompt: Дополнительный промпт (используется для set_some_params)
+        batch_size: Размер чанка
+
+    Yields:
+        Кортежи (объект, url, data); объекты, для которых действие не поддерживается, пропускаются
+    """
+    builder = PAYLOAD_BUILDERS.get(action)
+    if builder is None:
+        raise ValueError(f'Действие {action} не поддерживает построение payload')
+
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+
+    for start in range(0, len(pks), batch_size):
+        objects = get_payload_queryset(
+            queryset.filter(pk__in=pks[start:start + batch_size])
+        ).order_by('pk')
+
+        site_preferences = {}
+        for obj in objects:
+            site_id = getattr(obj, 'site_id', None)
+            if site_id not in site_preferences:
+                site_preferences[site_id] = get_model_site_preferences(obj)
+            url, data = builder(
+                obj,
+                site_preferences=site_preferences[site_id],
+                additional_prompt=additional_prompt,
+            )
+            if data is not None:
+                yield obj, url, data
+
+
+def set_seo_params_of_model(model):
+    """Генерирует SEO параметры для модели"""
+    # print('set_seo_params_of_model')
+    if not url_to_get_seo_params:
+        print('Урл для получения сео параметров, НЕ УСТАНОВЛЕН')
+        return
+    
+    url, data = build_seo_params_payload(model)
     # print('data', data)
     response = super_requester.get_response(
-        url_to_get_seo_params, 
+        url, 
         method='POST',
         data=data
     )        
@@ -87,37 +570,7 @@ def set_description_of_model(model, description=''):
     """Генерирует описание для модели"""
     print('set_description_of_model')
     # print('model', model)
-    description = model.get_temporary_info_value()
-    if not description:
-        print('temporary_info_value не получен')
-        # return        
-
-    name_model = model.__class__.__name__.lower()
-    print('name_model', name_model)
-    if name_model == 'category': 
-        company_name = ''
-        url_to_description = url_to_description_for_category
-
-        if hasattr(model, 'site') and model.site and hasattr(model.site, 'preferences') and model.site.preferences and model.site.preferences.company_name:
-            company_name = model.site.preferences.company_name
-        else: 
-            site_preferences = SitePreferences.get_model()
-            company_name = getattr(site_preferences, 'company_name', '')
-
-        data = {
-            'company_profile': company_name,
-            'category': model.name,
-            'category_description': description,
-        }        
-
-    if name_model == 'product': 
-        url_to_description = url_to_description_for_product
-        data = {
-            'category_name': model.category.name,
-            'name': model.name,
-            'description': description,
-            'characteristics': model.all_attributs_data_as_str,
-        }        
+    url_to_description, data = build_description_payload(model)
     print('data', data)
     if not url_to_description:
         print('Урл для получения description, НЕ УСТАНОВЛЕН')
@@ -151,18 +604,10 @@ def set_description_of_model(model, description=''):
 
 def upgrade_name_of_model(model):
     """Улучшает название модели"""
-    name_model = model.__class__.__name__.lower()
-    if name_model == 'product':
-        # print(' model.name',  model.name)
-        # print('model.category.name', model.category.name)
-        # print('model.all_attributs_data_as_str', model.all_attributs_data_as_str)
-        data = {
-            'name': model.name, 
-            'category': model.category.name, 
-            'attributes': model.all_attributs_data_as_str,
-        }      
+    url, data = build_upgrade_name_payload(model)
+    if data is not None:
         response = super_requester.get_response(
-            url_to_upgrade_name, 
+            url, 
             method='POST',
             data=data
         ) 
@@ -182,34 +627,7 @@ def upgrade_name_of_model(model):
 def set_some_params_of_model(model, additional_prompt=None):
     """Комплексное улучшение параметров модели"""
     # print('set_some_params')
-    company_name = ''
-    if hasattr(model, 'site') and model.site and hasattr(model.site, 'preferences') and model.site.preferences:
-        site_preferences = model.site.preferences
-    else: 
-        site_preferences = SitePreferences.get_model()
-
-    name_model = model._meta.model_name
-    if name_model == 'product':
-        url_to_set_some_params = url_to_set_some_params_for_product
-        category_name = ''
-        if model.category and model.category.name:
-            category_name = model.category.name
-
-        data = {
-            'company_name': getattr(site_preferences, 'company_name', ''),
-            'company_profile': getattr(site_preferences, 'company_profile', ''),
-            'product_name': model.name,
-            'category_name': category_name,
-            'product_attributes': model.all_attributs_data_as_str,
-            'additional_prompt': additional_prompt,
-        }   
-    elif name_model == 'category':
-        url_to_set_some_params = url_to_set_some_params_for_category
-        data = {
-            'category_name': model.name,
-            'category_attributes': model.get_category_attributes_as_str(),
-            'company_name': getattr(site_preferences, 'company_name', ''),
-        }     
+    url_to_set_some_params, data = build_some_params_payload(model, additional_prompt=additional_prompt)
 
     if not url_to_set_some_params:
         print('Урл для получения set_some_params, НЕ УСТАНОВЛЕН')
@@ -282,30 +700,26 @@ ACTION_TO_PROMPT_TYPE = {
 }
 
 
-def get_prompt_for_action(action: str) -> Optional['PromptVersion']:
+def get_prompt_for_action(generator, action: str, object_id: Optional[int] = None) -> Optional['PromptVersion']:
     """
-    Получает актуальную версию промпта для указанного действия.
+    Получает версию промпта для указанного действия генератора.
+    
+    Версия выбирается маршрутизацией действия (routing.route_prompt_version):
+    стабильная версия или, для части объектов, версия-кандидат A/B-сравнения.
+    Маршруты кэшируются в памяти процесса.
     
     Args:
+        generator: ContentGenerator (может быть None)
         action: Название действия (set_seo_params, set_description, etc.)
+        object_id: ID объекта (для закрепления объекта за группой трафика)
     
     Returns:
         PromptVersion или None, если промпт не найден
     """
-    from content_generator.models import Prompt
-    
-    try:
-        prompt = Prompt.objects.filter(
-            prompt_type=prompt_type,
-            is_active=True
-        ).first()
-        
-        if not prompt:
-            return None
-        
-        return prompt.get_latest_version()
-    except Exception:
-        return None
+    from content_generator.routing import route_prompt_version
+
+    prompt_version, _ = route_prompt_version(generator, action, object_id)
+    return prompt_version
 
 
 def compare_prompt_versions(content1: str, content2: str, max_lines: int = 10000) -> Dict[str, Any]:
@@ -448,6 +862,186 @@ def compare_prompt_versions(content1: str, content2: str, max_lines: int = 10000
     }
 
 
+def compare_prompt_versions_cached(version1, version2, timeout: int = 3600) -> Dict[str, Any]:
+    """
+    Сравнивает две версии промпта с кэшированием результата.
+    
+    Ключ кэша строится по хэшам содержимого версий, поэтому результат
+    переиспользуется для любых версий с тем же содержимым.
+    
+    Args:
+        version1: Первая версия промпта (PromptVersion)
+        version2: Вторая версия промпта (PromptVersion)
+        timeout: Время жизни кэша в секундах (по умолчанию 1 час)
+    
+    Returns:
+        Результат compare_prompt_versions
+    """
+    if not version1.content_hash or not version2.content_hash:
+        return compare_prompt_versions(version1.prompt_content, version2.prompt_content)
+
+    cache_key = f'prompt_compare_{version1.content_hash}_{version2.content_hash}'
+    result = cache.get(cache_key)
+    if result is None:
+        result = compare_prompt_versions(version1.prompt_content, version2.prompt_content)
+        cache.set(cache_key, result, timeout)
+    return result
+
+
+# Время жизни кэша статистики версий промптов, секунды
+PROMPT_STATISTICS_CACHE_TTL = 300
+
+
+# Счетчики статистики, которые меняются при проверке контента. Хранятся в кэше
+# отдельными ключами, чтобы обновляться атомарным cache.incr
+PROMPT_STATISTICS_COUNTER_FIELDS = ('reviewed_count', 'rated_count', 'rating_sum', 'success_count')
+
+
+def get_prompt_statistics_cache_key(prompt_version_id: int) -> str:
+    """Возвращает ключ кэша статистики версии промпта."""
+    return f'prompt_statistics_{prompt_version_id}'
+
+
+def get_prompt_statistics_counter_key(prompt_version_id: int, field: str) -> str:
+    """Возвращает ключ кэша счетчика статистики версии промпта."""
+    return f'prompt_statistics_{prompt_version_id}_{field}'
+
+
+def apply_prompt_statistics_delta(prompt_version_id: int, reviewed: int = 0, rated: int = 0,
+                                  rating_sum: int = 0, success: int = 0) -> bool:
+    """
+    Инкрементально обновляет закэшированную статистику версии промпта
+    после проверки контента, не пересчитывая агрегаты по БД.
+
+    Каждый счетчик меняется атомарным cache.incr, поэтому параллельные проверки
+    не затирают изменения друг друга. Если какого-то счетчика нет в кэше,
+    закэшированная статистика удаляется: следующий вызов get_prompt_statistics
+    посчитает ее заново.
+
+    Args:
+        prompt_version_id: ID версии промпта
+        reviewed: Изменение количества проверенного контента
+        rated: Изменение количества оцененного контента
+        rating_sum: Изменение суммы оценок
+        success: Изменение количества записей в статусе SUCCESS
+
+    Returns:
+        True, если кэш был обновлен
+    """
+    increments = {
+        'reviewed_count': reviewed,
+        'rated_count': rated,
+        'rating_sum': rating_sum,
+        'success_count': success,
+    }
+    for field, value in increments.items():
+        if not value:
+            continue
+        try:
+            cache.incr(get_prompt_statistics_counter_key(prompt_version_id, field), value)
+        except ValueError:
+            # Счетчик истек или статистика еще не считалась
+            cache.delete(get_prompt_statistics_cache_key(prompt_version_id))
+            return False
+    return True
+
+
+# Время хранения счетчиков кэширования промптов у провайдера, секунды
+PROMPT_CACHE_METRICS_TTL = getattr(settings, 'CONTENT_GENERATOR_PROMPT_CACHE_METRICS_TTL', 7 * 24 * 60 * 60)
+
+# Счетчики кэширования промптов: запросы, запросы с попаданием в кэш, входные и закэшированные токены
+PROMPT_CACHE_METRICS_FIELDS = ('requests', 'hits', 'input_tokens', 'cached_tokens')
+
+
+def get_prompt_cache_metrics_key(prompt_version_id: int, field: str) -> str:
+    """Возвращает ключ кэша счетчика кэширования промпта."""
+    return f'prompt_cache_metrics_{prompt_version_id}_{field}'
+
+
+def extract_prompt_cache_usage(result: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+    """
+    Извлекает из результата генерации количество входных и закэшированных токенов.
+
+    Поддерживаются форматы usage провайдеров:
+        - input_tokens + cache_read_input_tokens (+ cache_creation_input_tokens)
+        - prompt_tokens + prompt_tokens_details.cached_tokens
+        - input_tokens/prompt_tokens + cached_tokens
+
+    Returns:
+        Кортеж (всего входных токенов, закэшированных токенов) или None, если usage нет
+    """
+    usage = (result or {}).get('usage')
+    if not isinstance(usage, dict):
+        return None
+
+    if 'cache_read_input_tokens' in usage:
+        # input_tokens не включает токены, прочитанные из кэша или записанные в него
+        cached_tokens = usage.get('cache_read_input_tokens') or 0
+        input_tokens = (usage.get('input_tokens') or 0) + cached_tokens + (usage.get('cache_creation_input_tokens') or 0)
+        return input_tokens, cached_tokens
+
+    input_tokens = usage.get('prompt_tokens') or usage.get('input_tokens') or 0
+    cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or usage.get('cached_tokens') or 0
+    return input_tokens, cached_tokens
+
+
+def record_prompt_cache_usage(prompt_version_id: int, result: Optional[Dict[str, Any]]) -> bool:
+    """
+    Учитывает в счетчиках версии промпта использование кэша промптов провайдером.
+
+    Returns:
+        True, если в результате был usage и счетчики обновлены
+    """
+    usage = extract_prompt_cache_usage(result)
+    if usage is None:
+        return False
+
+    input_tokens, cached_tokens = usage
+    increments = {
+        'requests': 1,
+        'hits': 1 if cached_tokens > 0 else 0,
+        'input_tokens': input_tokens,
+        'cached_tokens': cached_tokens,
+    }
+    for field, value in increments.items():
+        key = get_prompt_cache_metrics_key(prompt_version_id, field)
+        cache.add(key, 0, PROMPT_CACHE_METRICS_TTL)
+        if value:
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                # Ключ истек между add и incr
+                cache.set(key, value, PROMPT_CACHE_METRICS_TTL)
+    return True
+
+
+def get_prompt_cache_metrics(prompt_version_id: int) -> Dict[str, Any]:
+    """
+    Возвращает метрики кэширования промпта у провайдера:
+    счетчики, долю запросов с попаданием в кэш и долю закэшированных входных токенов (в процентах).
+    """
+    values = cache.get_many([
+        get_prompt_cache_metrics_key(prompt_version_id, field) for field in PROMPT_CACHE_METRICS_FIELDS
+    ])
+    metrics = {
+        field: values.get(get_prompt_cache_metrics_key(prompt_version_id, field), 0)
+        for field in PROMPT_CACHE_METRICS_FIELDS
+    }
+    metrics['hit_rate'] = round(metrics['hits'] / metrics['requests'] * 100, 2) if metrics['requests'] else 0.0
+    metrics['cached_token_share'] = (
+        round(metrics['cached_tokens'] / metrics['input_tokens'] * 100, 2) if metrics['input_tokens'] else 0.0
+    )
+    return metrics
+
+
+def _with_derived_statistics(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Добавляет к счетчикам статистики процент проверенного контента и средний рейтинг."""
+    generated_count = stats['generated_count']
+    stats['review_percentage'] = round((stats['reviewed_count'] / generated_count * 100), 2) if generated_count > 0 else 0.0
+    stats['average_rating'] = round(stats['rating_sum'] / stats['rated_count'], 2) if stats['rated_count'] > 0 else None
+    return stats
+
+
 def get_prompt_statistics(prompt_version) -> Dict[str, Any]:
     """
     Подсчитывает статистику использования версии промпта.
@@ -467,12 +1061,20 @@ def get_prompt_statistics(prompt_version) -> Dict[str, Any]:
         - 'success_count': количество успешных генераций
         - 'failure_count': количество неудачных генераций
         - 'pending_count': количество ожидающих генераций
+        - 'rated_count': количество оцененного контента
+        - 'rating_sum': сумма оценок (для инкрементального пересчета среднего)
     """
-    # Проверяем кэш
-    cache_key = f'prompt_statistics_{prompt_version.id}'
-    cached_result = cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
+    # Проверяем кэш: базовая статистика и счетчики хранятся под разными ключами
+    cache_key = get_prompt_statistics_cache_key(prompt_version.id)
+    counter_keys = {
+        field: get_prompt_statistics_counter_key(prompt_version.id, field)
+        for field in PROMPT_STATISTICS_COUNTER_FIELDS
+    }
+    cached = cache.get_many([cache_key, *counter_keys.values()])
+    if len(cached) == len(counter_keys) + 1:
+        result = dict(cached[cache_key])
+        result.update({field: cached[key] for field, key in counter_keys.items()})
+        return _with_derived_statistics(result)
     
     try:
         GeneratedContent = apps.get_model('content_generator', 'GeneratedContent')
@@ -485,12 +1087,14 @@ def get_prompt_statistics(prompt_version) -> Dict[str, Any]:
                 'success_count': 0,
                 'failure_count': 0,
                 'pending_count': 0,
+                'rated_count': 0,
+                'rating_sum': 0,
             }
         
         # Оптимизированный запрос с использованием aggregate
         # Используем один запрос для подсчета всех метрик вместо множественных запросов
         # Это значительно ускоряет работу при большом количестве записей
-        from django.db.models import Count, Avg, Q
+        from django.db.models import Count, Q, Sum
         
         queryset = GeneratedContent.objects.filter(prompt_version=prompt_version)
         
@@ -502,28 +1106,28 @@ def get_prompt_statistics(prompt_version) -> Dict[str, Any]:
             success_count=Count('id', filter=Q(status='SUCCESS')),  # Успешные генерации
             failure_count=Count('id', filter=Q(status='FAILURE')),  # Неудачные генерации
             pending_count=Count('id', filter=Q(status__in=['PENDING', 'PROCESSING'])),  # Ожидающие генерации
-            average_rating=Avg('rating', filter=Q(rating__isnull=False)),  # Средний рейтинг (только для оцененных)
+            rated_count=Count('rating'),  # Оцененные записи
+            rating_sum=Sum('rating'),  # Сумма оценок
         )
         
-        # Вычисляем процент проверенного контента
-        generated_count = stats['generated_count'] or 0
-        reviewed_count = stats['reviewed_count'] or 0
-        review_percentage = round((reviewed_count / generated_count * 100), 2) if generated_count > 0 else 0.0
-        
         result = {
-            'generated_count': generated_count,
-            'reviewed_count': reviewed_count,
-            'review_percentage': review_percentage,
-            'average_rating': round(stats['average_rating'], 2) if stats['average_rating'] is not None else None,
+            'generated_count': stats['generated_count'] or 0,
+            'reviewed_count': stats['reviewed_count'] or 0,
             'success_count': stats['success_count'] or 0,
             'failure_count': stats['failure_count'] or 0,
             'pending_count': stats['pending_count'] or 0,
+            'rated_count': stats['rated_count'] or 0,
+            'rating_sum': stats['rating_sum'] or 0,
         }
         
-        # Кэшируем результат на 5 минут
-        cache.set(cache_key, result, 300)
+        # Кэшируем результат на 5 минут: счетчики отдельно от остальной статистики
+        values = {key: result[field] for field, key in counter_keys.items()}
+        values[cache_key] = {
+            field: value for field, value in result.items() if field not in counter_keys
+        }
+        cache.set_many(values, PROMPT_STATISTICS_CACHE_TTL)
         
-        return result
+        return _with_derived_statistics(result)
         
     except (LookupError, AttributeError) as e:
         # Если модель не найдена, возвращаем пустую статистику
@@ -535,18 +1139,447 @@ def get_prompt_statistics(prompt_version) -> Dict[str, Any]:
             'success_count': 0,
             'failure_count': 0,
             'pending_count': 0,
+            'rated_count': 0,
+            'rating_sum': 0,
         }
 
 
+# Длина превью текста промпта в списках (вычисляется в SQL через Substr)
+PROMPT_PREVIEW_LENGTH = getattr(settings, 'CONTENT_GENERATOR_PROMPT_PREVIEW_LENGTH', 500)
+
+
+def get_prompt_version_list_queryset(queryset=None):
+    """
+    Возвращает queryset версий промптов для списков (страница версий, API list).
+
+    Полный prompt_content не загружается: вместо него аннотируется content_preview -
+    первые PROMPT_PREVIEW_LENGTH символов, вырезанные на стороне БД. Статистика
+    использования (generated_count, reviewed_count, average_rating) добавляется
+    аннотациями, поэтому страница списка строится одним запросом.
+
+    Args:
+        queryset: Исходный queryset PromptVersion (по умолчанию - все версии)
+    """
+    from django.db.models import Count, Avg, Q
+    from django.db.models.functions import Substr
+    from content_generator.models import PromptVersion
+
+    if queryset is None:
+        queryset = PromptVersion.list_objects.all()
+
+    return queryset.defer('prompt_content').select_related('prompt').annotate(
+        content_preview=Substr('prompt_content', 1, PROMPT_PREVIEW_LENGTH),
+        generated_count=Count('generated_content'),
+        reviewed_count=Count(
+            'generated_content',
+            filter=Q(generated_content__reviewed_at__isnull=False)
+        ),
+        average_rating=Avg('generated_content__rating'),
+    )
+
+
+def get_annotated_version_stats(prompt_version) -> Dict[str, Any]:
+    """
+    Возвращает статистику версии из аннотаций get_prompt_version_list_queryset
+    в формате, совместимом с get_prompt_statistics (без счетчиков по статусам).
+    """
+    generated_count = getattr(prompt_version, 'generated_count', None)
+    if generated_count is None:
+        return {
+            'generated_count': prompt_version.get_generated_content_count(),
+            'reviewed_count': prompt_version.get_reviewed_content_count(),
+            'review_percentage': prompt_version.get_review_percentage(),
+            'average_rating': prompt_version.get_average_rating(),
+        }
+
+    reviewed_count = prompt_version.reviewed_count or 0
+    average_rating = prompt_version.average_rating
+    return {
+        'generated_count': generated_count,
+        'reviewed_count': reviewed_count,
+        'review_percentage': round((reviewed_count / generated_count * 100), 2) if generated_count > 0 else 0.0,
+        'average_rating': round(average_rating, 2) if average_rating is not None else None,
+    }
+
+
+def compute_prompt_content_hash(prompt_content: Optional[str]) -> str:
+    """
+    Возвращает SHA-256 хэш содержимого промпта (hex, 64 символа).
+    """
+    from content_generator.models import PromptVersion
+
+    return PromptVersion.compute_content_hash(prompt_content)
+
+
+def export_prompts_jsonl(prompts=None) -> Iterator[str]:
+    """
+    Экспортирует промпты и их версии в формате JSON Lines (одна JSON-строка на запись).
+
+    Сначала выгружаются записи промптов ({"type": "prompt", ...}), затем - версии
+    ({"type": "version", "prompt": <название промпта>, ...}). Версии читаются
+    через iterator(), поэтому экспорт не держит всю историю в памяти.
+
+    Args:
+        prompts: queryset промптов (по умолчанию - все промпты)
+
+    Yields:
+        Строки JSON без завершающего перевода строки
+    """
+    from content_generator.models import Prompt, PromptVersion
+
+    if prompts is None:
+        prompts = Prompt.objects.all()
+
+    for prompt in prompts.order_by('name', 'id'):
+        yield json.dumps({
+            'type': 'prompt',
+            'name': prompt.name,
+            'description': prompt.description,
+        }, ensure_ascii=False)
+
+    versions = PromptVersion.objects.filter(
+        prompt__in=prompts
+    ).select_related('prompt').order_by('prompt__name', 'prompt_id', 'version_number')
+
+    for version in versions.iterator(chunk_size=500):
+        yield json.dumps({
+            'type': 'version',
+            'prompt': version.prompt.name,
+            'version_number': version.version_number,
+            'description': version.description,
+            'prompt_content': version.prompt_content,
+            'engineer_name': version.engineer_name,
+            'created_at': version.created_at.isoformat() if version.created_at else None,
+            'content_hash': version.content_hash or compute_prompt_content_hash(version.prompt_content),
+        }, ensure_ascii=False)
+
+
+def _parse_prompts_jsonl(lines: Iterable[str]) -> Tuple[Dict[str, str], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Разбирает JSON Lines с промптами и версиями.
+
+    Returns:
+        Кортеж (описания промптов по названию, версии по названию промпта)
+
+    Raises:
+        ValueError: При некорректной строке
+    """
+    prompts = {}
+    versions = {}
+
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except json.decoder.JSONDecodeError as e:
+            raise ValueError(f'Строка {line_number}: некорректный JSON ({e})')
+        if not isinstance(record, dict):
+            raise ValueError(f'Строка {line_number}: ожидается JSON-объект')
+
+        record_type = record.get('type')
+        if record_type == 'prompt':
+            name = record.get('name')
+            if not name:
+                raise ValueError(f'Строка {line_number}: не указано название промпта')
+            prompts[name] = record.get('description', '')
+        elif record_type == 'version':
+            name = record.get('prompt')
+            if not name:
+                raise ValueError(f'Строка {line_number}: не указан промпт версии')
+            is_valid, error_message = validate_prompt_length(record.get('prompt_content'))
+            if not is_valid:
+                raise ValueError(f'Строка {line_number}: {error_message}')
+            prompts.setdefault(name, '')
+            versions.setdefault(name, []).append(record)
+        else:
+            raise ValueError(f'Строка {line_number}: неизвестный тип записи {record_type!r}')
+
+    return prompts, versions
+
+
+def import_prompts_jsonl(lines: Iterable[str], batch_size: int = 500) -> Dict[str, int]:
+    """
+    Импортирует промпты и версии из JSON Lines (формат export_prompts_jsonl).
+
+    Промпты сопоставляются по названию, недостающие создаются через bulk_create.
+    Версии дедуплицируются по хэшу содержимого: версия, содержимое которой уже есть
+    у промпта (или встречается в файле повторно), пропускается. Новые версии получают
+    номера через PromptVersion.allocate_version_numbers в порядке исходных номеров
+    и создаются через bulk_create. Импорт выполняется в одной транзакции.
+
+    Args:
+        lines: Итерируемый объект строк JSON Lines
+        batch_size: Размер пакета для bulk_create
+
+    Returns:
+        Словарь со статистикой: prompts_created, versions_created, versions_skipped
+
+    Raises:
+        ValueError: При некорректных входных данных
+    """
+    from content_generator.models import Prompt, PromptVersion
+
+    prompts_data, versions_data = _parse_prompts_jsonl(lines)
+    stats = {
+        'prompts_created': 0,
+        'versions_created': 0,
+        'versions_skipped': 0,
+    }
+    if not prompts_data:
+        return stats
+
+    with transaction.atomic():
+        prompts = {}
+        for prompt in Prompt.objects.filter(name__in=list(prompts_data)).order_by('id'):
+            prompts.setdefault(prompt.name, prompt)
+
+        missing = [name for name in prompts_data if name not in prompts]
+        if missing:
+            Prompt.objects.bulk_create(
+                [Prompt(name=name, description=prompts_data[name]) for name in missing],
+                batch_size=batch_size,
+            )
+            for prompt in Prompt.objects.filter(name__in=missing).order_by('id'):
+                prompts.setdefault(prompt.name, prompt)
+            stats['prompts_created'] = len(missing)
+
+        existing_hashes = {}
+        existing_versions = PromptVersion.objects.filter(
+            prompt__in=[prompts[name] for name in versions_data]
+        )
+        for prompt_id, content_hash in existing_versions.exclude(content_hash='').values_list('prompt_id', 'content_hash'):
+            existing_hashes.setdefault(prompt_id, set()).add(content_hash)
+        # Версии, сохраненные до появления content_hash
+        for prompt_id, prompt_content in existing_versions.filter(content_hash='').values_list('prompt_id', 'prompt_content'):
+            existing_hashes.setdefault(prompt_id, set()).add(compute_prompt_content_hash(prompt_content))
+
+        new_versions = []
+        for name, records in versions_data.items():
+            prompt = prompts[name]
+            known_hashes = existing_hashes.setdefault(prompt.id, set())
+
+            records_to_create = []
+            for record in sorted(records, key=lambda item: item.get('version_number') or 0):
+                content_hash = compute_prompt_content_hash(record['prompt_content'])
+                if content_hash in known_hashes:
+                    stats['versions_skipped'] += 1
+                    continue
+                known_hashes.add(content_hash)
+                records_to_create.append((record, content_hash))
+
+            if not records_to_create:
+                continue
+
+            version_numbers = PromptVersion.allocate_version_numbers(prompt, count=len(records_to_create))
+            for version_number, (record, content_hash) in zip(version_numbers, records_to_create):
+                # bulk_create не вызывает save(), поэтому хэш заполняется явно
+                new_versions.append(PromptVersion(
+                    prompt=prompt,
+                    version_number=version_number,
+                    description=record.get('description') or '',
+                    prompt_content=record['prompt_content'],
+                    content_hash=content_hash,
+                    engineer_name=record.get('engineer_name') or '',
+                ))
+
+        PromptVersion.objects.bulk_create(new_versions, batch_size=batch_size)
+        stats['versions_created'] = len(new_versions)
+
+    if stats['prompts_created'] or stats['versions_created']:
+        # bulk_create не отправляет post_save, поэтому маршруты сбрасываются явно:
+        # последняя версия промпта могла смениться
+        from content_generator.routing import invalidate_routing_cache
+        invalidate_routing_cache()
+
+    return stats
+
+
 # ========== ПОДСИСТЕМА GENERATION ==========
 
-def sanitize_html_tags(text: str, allowed_tags: Optional[List[str]] = None) -> str:
+# Теги, содержимое которых не считается текстом
+HTML_TEXT_SKIP_TAGS = frozenset(('script', 'style', 'template'))
+
+# Максимальное количество результатов разбора HTML в кэше процесса
+HTML_TEXT_CACHE_SIZE = getattr(settings, 'CONTENT_GENERATOR_HTML_TEXT_CACHE_SIZE', 1024)
+
+# Пустые (void) элементы HTML: выводятся как <tag/> и не бывают открытыми
+HTML_VOID_TAGS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+))
+
+# LRU-кэш результатов разбора HTML: {(вид обработки, хэш содержимого): результат}.
+# Доступ защищен блокировкой: кэш общий для потоков процесса.
+_html_text_cache = OrderedDict()
+_html_text_cache_lock = threading.Lock()
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Потоковый извлекатель текста из HTML на базе html.parser.
+    Не строит дерево документа: собирает текстовые фрагменты по мере разбора.
+    Результат совпадает с BeautifulSoup.get_text(separator=' ', strip=True).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTML_TEXT_SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in HTML_TEXT_SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        data = data.strip()
+        if data:
+            self.parts.append(data)
+
+    def get_text(self, separator: str = ' ') -> str:
+        return separator.join(self.parts)
+
+
+class HTMLTagFilter(HTMLParser):
+    """
+    Потоковый фильтр HTML-тегов на базе html.parser.
+    Оставляет только разрешенные теги, у остальных сохраняет содержимое
+    (аналог tag.unwrap() в BeautifulSoup). Комментарии и doctype удаляются.
+
+    Вложенность отслеживается стеком открытых тегов, как при построении дерева
+    в BeautifulSoup: закрывающий тег закрывает и незакрытые вложенные теги,
+    закрывающие теги без пары отбрасываются, а теги, открытые к концу
+    документа, закрываются в close(). Пустые элементы выводятся как <br/>.
+    """
+
+    def __init__(self, allowed_tags):
+        super().__init__(convert_charrefs=True)
+        self.allowed_tags = frozenset(allowed_tags)
+        self.parts = []
+        self._open_tags = []
+
+    @staticmethod
+    def _format_attr_value(value):
+        value = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if '"' not in value:
+            return f'"{value}"'
+        if "'" not in value:
+            return f"'{value}'"
+        return '"' + value.replace('"', '&quot;') + '"'
+
+    @classmethod
+    def _format_tag(cls, tag, attrs, self_closing=False):
+        rendered_attrs = ''.join(
+            f' {name}=""' if value is None else f' {name}={cls._format_attr_value(value)}'
+            for name, value in attrs
+        )
+        return f'<{tag}{rendered_attrs}{"/" if self_closing else ""}>'
+
+    def _close_to(self, index):
+        """Закрывает открытые теги, начиная с позиции index стека."""
+        while len(self._open_tags) > index:
+            tag = self._open_tags.pop()
+            if tag in self.allowed_tags:
+                self.parts.append(f'</{tag}>')
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTML_VOID_TAGS:
+            if tag in self.allowed_tags:
+                self.parts.append(self._format_tag(tag, attrs, self_closing=True))
+            return
+        self._open_tags.append(tag)
+        if tag in self.allowed_tags:
+            self.parts.append(self._format_tag(tag, attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in HTML_VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        for index in range(len(self._open_tags) - 1, -1, -1):
+            if self._open_tags[index] == tag:
+                self._close_to(index)
+                return
+
+    def handle_data(self, data):
+        self.parts.append(html_escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        self._close_to(0)
+
+    def get_html(self) -> str:
+        return ''.join(self.parts)
+
+
+def _memoize_html_result(kind: str, text: str, compute, use_cache: bool = True) -> str:
+    """
+    Возвращает результат обработки HTML из LRU-кэша процесса.
+    Ключ кэша - вид обработки и хэш содержимого, а не сама строка.
+    """
+    if not use_cache or HTML_TEXT_CACHE_SIZE <= 0:
+        return compute(text)
+
+    key = (kind, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest())
+    with _html_text_cache_lock:
+        result = _html_text_cache.get(key)
+        if result is not None:
+            _html_text_cache.move_to_end(key)
+            return result
+
+    result = compute(text)
+    with _html_text_cache_lock:
+        _html_text_cache[key] = result
+        _html_text_cache.move_to_end(key)
+        while len(_html_text_cache) > HTML_TEXT_CACHE_SIZE:
+            _html_text_cache.popitem(last=False)
+    return result
+
+
+def _extract_text(text: str) -> str:
+    parser = HTMLTextExtractor()
+    parser.feed(text)
+    parser.close()
+    return parser.get_text()
+
+
+def get_text_from_html(html: Optional[str], use_cache: bool = True) -> str:
+    """
+    Извлекает текст из HTML потоковым парсером (без построения дерева).
+
+    Args:
+        html: HTML-строка
+        use_cache: Использовать кэш результатов по хэшу содержимого
+
+    Returns:
+        Текст, фрагменты которого разделены пробелом
+    """
+    if not html:
+        return ''
+    return _memoize_html_result('text', html, _extract_text, use_cache)
+
+
+def sanitize_html_tags(text: str, allowed_tags: Optional[List[str]] = None, use_cache: bool = True) -> str:
     """
     Санитизирует HTML-теги в тексте, удаляя опасные теги и оставляя только разрешенные.
+    Использует потоковые парсеры HTMLTextExtractor/HTMLTagFilter и кэш по хэшу содержимого.
     
     Args:
         text: Текст для санитизации
         allowed_tags: Список разрешенных HTML-тегов (по умолчанию None - удаляются все теги)
+        use_cache: Использовать кэш результатов по хэшу содержимого
     
     Returns:
         Очищенный от HTML-тегов текст
@@ -556,13 +1589,10 @@ def sanitize_html_tags(text: str, allowed_tags: Optional[List[str]] = None) -> s
     
     if allowed_tags is None:
         # Удаляем все HTML-теги
-        # Используем BeautifulSoup для безопасного парсинга
         try:
-            soup = BeautifulSoup(text, 'html.parser')
-            # Получаем только текстовое содержимое
-            return soup.get_text(separator=' ', strip=True)
+            return get_text_from_html(text, use_cache=use_cache)
         except Exception:
-            # Если BeautifulSoup не справился, используем регулярное выражение
+            # Если парсер не справился, используем регулярное выражение
             # Безопасное удаление всех HTML-тегов
             text = re.sub(r'<[^>]+>', '', text)
             # Декодируем HTML-сущности
@@ -575,13 +1605,15 @@ def sanitize_html_tags(text: str, allowed_tags: Optional[List[str]] = None) -> s
             return text.strip()
     else:
         # Оставляем только разрешенные теги
+        def filter_tags(value):
+            parser = HTMLTagFilter(allowed_tags)
+            parser.feed(value)
+            parser.close()
+            return parser.get_html()
+
         try:
-            soup = BeautifulSoup(text, 'html.parser')
-            # Удаляем все теги, кроме разрешенных
-            for tag in soup.find_all(True):
-                if tag.name not in allowed_tags:
-                    tag.unwrap()  # Удаляем тег, но оставляем содержимое
-            return str(soup)
+            kind = 'tags:' + ','.join(sorted(allowed_tags))
+            return _memoize_html_result(kind, text, filter_tags, use_cache)
         except Exception:
             # Fallback: используем регулярное выражение
             # Создаем паттерн для разрешенных тегов
@@ -704,7 +1736,8 @@ def process_generation_result(ai_task) -> Optional[Dict[str, Any]]:
     Обрабатывает результат генерации от ai_interface.
     
     Использует ai_interface_adapter для создания/обновления GeneratedContent
-    и связывания его с PromptVersion.
+    и связывания его с PromptVersion. Результат пакетной задачи (context_data.batch)
+    разбивается на записи по объектам.
     
     Args:
         ai_task: Экземпляр AITask из ai_interface с результатом генерации
@@ -712,9 +1745,20 @@ def process_generation_result(ai_task) -> Optional[Dict[str, Any]]:
     Returns:
         Словарь с информацией о результате обработки или None при ошибке
     """
-    from content_generator.ai_interface_adapter import process_generation_result as process_result
+    from content_generator.ai_interface_adapter import (
+        process_generation_result as process_result,
+        process_batch_generation_result,
+    )
     
     try:
+        if (ai_task.context_data or {}).get('batch'):
+            outcome = process_batch_generation_result(ai_task)
+            return {
+                'status': 'success',
+                'generated_content_ids': outcome['created'],
+                'fallback_object_ids': outcome['fallback'],
+            }
+        
         generated_content = process_result(ai_task)
         if generated_content:
             return {
@@ -735,3 +1779,92 @@ def process_generation_result(ai_task) -> Optional[Dict[str, Any]]:
             'message': str(e)
         }
 
+
+def enqueue_generation_for_queryset(queryset, action: str, additional_prompt: Optional[str] = None,
+                                    batched: Optional[bool] = None,
+                                    objects_per_batch: Optional[int] = None) -> List[Any]:
+    """
+    Ставит в очередь генерацию действия для всех объектов queryset'а.
+
+    Данные объектов строятся пакетно (build_payloads_for_queryset), версия
+    промпта выбирается маршрутизацией для каждого объекта. Для действий из
+    BATCH_ACTIONS объекты одной версии промпта упаковываются по
+    objects_per_batch в одну задачу (create_batch_generation_task), для
+    остальных создаются обычные задачи через create_generation_tasks_bulk.
+
+    Args:
+        queryset: queryset целевых объектов
+        action: Действие
+        additional_prompt: Дополнительный промпт
+        batched: Пакетный режим (по умолчанию - если действие входит в BATCH_ACTIONS)
+        objects_per_batch: Объектов в пакетной задаче (по умолчанию DEFAULT_OBJECTS_PER_BATCH)
+
+    Returns:
+        Список созданных AITask
+    """
+    from content_generator.models import ContentGenerator
+    from content_generator.routing import route_prompt_version
+    from content_generator.ai_interface_adapter import (
+        BATCH_ACTIONS,
+        DEFAULT_OBJECTS_PER_BATCH,
+        create_batch_generation_task,
+        create_generation_tasks_bulk,
+    )
+
+    if batched is None:
+        batched = action in BATCH_ACTIONS
+    objects_per_batch = max(1, objects_per_batch or DEFAULT_OBJECTS_PER_BATCH)
+
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    generator = ContentGenerator.objects.filter(content_type=content_type).select_related('agent').first()
+    agent = generator.agent if generator else None
+
+    # Группируем объекты по выбранной версии промпта
+    groups = OrderedDict()
+    for obj, _, data in build_payloads_for_queryset(queryset, action, additional_prompt):
+        prompt_version, ab_variant = route_prompt_version(generator, action, obj.pk)
+        if prompt_version is None:
+            continue
+        group = groups.setdefault((prompt_version.id, ab_variant), {
+            'prompt_version': prompt_version,
+            'ab_variant': ab_variant,
+            'objects': OrderedDict(),
+        })
+        group['objects'][obj.pk] = data
+
+    tasks = []
+    for group in groups.values():
+        additional_data = {'ab_variant': group['ab_variant']}
+        if additional_prompt:
+            additional_data['additional_prompt'] = additional_prompt
+
+        if not batched:
+            tasks.extend(create_generation_tasks_bulk(
+                [
+                    {
+                        'prompt_version': group['prompt_version'],
+                        'content_type': content_type,
+                        'object_id': object_id,
+                        'action': action,
+                        'additional_data': additional_data,
+                        'object_data': data,
+                    }
+                    for object_id, data in group['objects'].items()
+                ],
+                agent=agent,
+                generator=generator,
+            ))
+            continue
+
+        items = list(group['objects'].items())
+        for start in range(0, len(items), objects_per_batch):
+            tasks.append(create_batch_generation_task(
+                group['prompt_version'],
+                content_type,
+                OrderedDict(items[start:start + objects_per_batch]),
+                action,
+                additional_data,
+                agent,
+                generator,
+            ))
+    return tasks
@@ -6,7 +6,21 @@ from django.db.models import Count
 
 from .models import Prompt, PromptVersion, GeneratedContent
 from .forms import PromptVersionForm
-from .utils import compare_prompt_versions
+from .utils import (
+    compare_prompt_versions_cached,
+    get_annotated_version_stats,
+    get_prompt_cache_metrics,
+    get_prompt_version_list_queryset,
+)
+from .review import (
+    claim_review_batch,
+    get_claimed_content,
+    get_review_queue,
+    release_review_claims,
+    submit_review,
+    MIN_RATING,
+    MAX_RATING,
+)
 from .permissions import AdminOrEngineerRequiredMixin, AdminRequiredMixin
 
 
@@ -26,10 +40,9 @@ class PromptVersionListView(AdminOrEngineerRequiredMixin, ListView):
     def get_queryset(self):
         """
         Возвращает queryset с дополнительной аннотацией статистики.
+        Полный текст промпта не загружается - для списка используется превью из БД.
         """
-        queryset = super().get_queryset()
-        # Сортировка уже настроена в Meta модели и через ordering
-        return queryset
+        return get_prompt_version_list_queryset().order_by(*self.ordering)
 
     def get_context_data(self, **kwargs):
         """
@@ -51,12 +64,7 @@ class PromptVersionListView(AdminOrEngineerRequiredMixin, ListView):
         # Добавляем статистику для каждой версии в списке
         versions_with_stats = []
         for version in context['prompt_versions']:
-            stats = {
-                'generated_count': version.get_generated_content_count(),
-                'reviewed_count': version.get_reviewed_content_count(),
-                'review_percentage': version.get_review_percentage(),
-                'average_rating': version.get_average_rating(),
-            }
+            stats = get_annotated_version_stats(version)
             versions_with_stats.append({
                 'version': version,
                 'stats': stats,
@@ -138,6 +146,9 @@ class PromptVersionDetailView(AdminOrEngineerRequiredMixin, DetailView):
         }
         context['stats'] = stats
 
+        # Использование кэша промптов провайдером
+        context['cache_metrics'] = get_prompt_cache_metrics(version.id)
+
         # Распределение оценок (если есть система оценок)
         rating_distribution = {}
         try:
@@ -164,7 +175,7 @@ class PromptVersionDetailView(AdminOrEngineerRequiredMixin, DetailView):
 
         # Список связанного сгенерированного контента (первые 20)
         try:
-            generated_content = GeneratedContent.objects.filter(
+            generated_content = GeneratedContent.list_objects.filter(
                 prompt_version=version
             ).select_related('content_type', 'ai_task')[:20]
             context['generated_content'] = generated_content
@@ -198,19 +209,28 @@ class PromptVersionCreateView(AdminOrEngineerRequiredMixin, CreateView):
     def form_valid(self, form):
         """
         Обрабатывает валидную форму:
+        - Не создает дубликат, если последняя версия промпта уже содержит такой текст
         - Автоматически генерирует номер версии
         - Сохраняет объект
         - Перенаправляет на страницу детального просмотра созданной версии.
         """
-        # Автоматическая генерация номера версии для конкретного промпта
-        if form.instance.prompt:
-            form.instance.version_number = PromptVersion.get_next_version_number_for_prompt(form.instance.prompt)
+        # Сохраняем объект с атомарно выделенным номером версии для конкретного промпта
+        self.object = form.save(commit=False)
+        if self.object.prompt:
+            # Если последняя версия промпта уже содержит такой текст, новая не создается
+            latest_version = PromptVersion.get_latest_if_identical(self.object.prompt, self.object.prompt_content)
+            if latest_version:
+                messages.info(
+                    self.request,
+                    f'Последняя версия промпта #{latest_version.version_number} уже содержит такой текст. '
+                    f'Новая версия не создана.'
+                )
+                return redirect('prompt_version_detail', id=latest_version.id)
+            self.object.save_as_next_version()
         else:
             # Fallback для обратной совместимости (не должно происходить при валидной форме)
-            form.instance.version_number = 1
-        
-        # Сохраняем объект
-        self.object = form.save()
+            self.object.version_number = 1
+            self.object.save()
         
         # Редирект на страницу детального просмотра созданной версии
         return redirect('prompt_version_detail', id=self.object.id)
@@ -264,24 +284,31 @@ class PromptVersionUpdateView(AdminOrEngineerRequiredMixin, UpdateView):
         - Показывает уведомления пользователю о действиях
         """
         # Получаем оригинальный объект из базы данных до изменений
-        original_obj = PromptVersion.objects.get(pk=self.object.pk)
-        original_prompt_content = original_obj.prompt_content
+        original_obj = PromptVersion.objects.defer('prompt_content').get(pk=self.object.pk)
         new_prompt_content = form.cleaned_data.get('prompt_content', '')
         new_description = form.cleaned_data.get('description', '')
         new_engineer_name = form.cleaned_data.get('engineer_name', '')
         
-        # Проверяем, изменилось ли содержимое промпта
-        if original_prompt_content != new_prompt_content:
+        # Проверяем, изменилось ли содержимое промпта (по хэшу содержимого)
+        if not original_obj.has_same_content(new_prompt_content):
+            # Если последняя версия промпта уже содержит такой текст, новая не создается
+            latest_version = PromptVersion.get_latest_if_identical(original_obj.prompt, new_prompt_content)
+            if latest_version:
+                messages.info(
+                    self.request,
+                    f'Последняя версия промпта #{latest_version.version_number} уже содержит такой текст. '
+                    f'Новая версия не создана.'
+                )
+                return redirect('prompt_version_detail', id=latest_version.id)
+
             # Создаем новую версию при изменении содержимого
-            new_version_number = PromptVersion.get_next_version_number_for_prompt(original_obj.prompt)
-            new_version = PromptVersion(
+            new_version = PromptVersion.create_next_version(
                 prompt=original_obj.prompt,
-                version_number=new_version_number,
                 description=new_description,
                 prompt_content=new_prompt_content,
                 engineer_name=new_engineer_name,
             )
-            new_version.save()
+            new_version_number = new_version.version_number
             
             # Уведомление о создании новой версии
             messages.success(
@@ -339,6 +366,8 @@ class PromptVersionCloneView(AdminOrEngineerRequiredMixin, View):
         """
         Обрабатывает GET запрос для клонирования версии:
         - Получает оригинальную версию по ID
+        - Не создает копию, если последняя версия промпта уже содержит такой текст
+          (клон более старой версии создается: это откат к ней)
         - Создает новую версию с копией содержимого
         - Автоматически генерирует описание "Клон версии {номер}: {описание}"
         - Редиректит на страницу редактирования новой версии
@@ -346,21 +375,30 @@ class PromptVersionCloneView(AdminOrEngineerRequiredMixin, View):
         # Получаем оригинальную версию
         original_version = get_object_or_404(PromptVersion, pk=kwargs.get('id'))
         
-        # Генерируем номер новой версии для того же промпта
-        new_version_number = PromptVersion.get_next_version_number_for_prompt(original_version.prompt)
+        # Если последняя версия промпта уже содержит такой текст, используем ее вместо дубликата
+        latest_version = PromptVersion.get_latest_if_identical(
+            original_version.prompt,
+            original_version.prompt_content,
+        )
+        if latest_version:
+            messages.info(
+                request,
+                f'Последняя версия промпта #{latest_version.version_number} уже содержит текст версии '
+                f'#{original_version.version_number}. Новая копия не создана.'
+            )
+            return redirect('prompt_version_update', id=latest_version.id)
         
         # Создаем описание для клона
         clone_description = f'Клон версии {original_version.version_number}: {original_version.description}'
         
-        # Создаем новую версию с копией содержимого
-        cloned_version = PromptVersion(
+        # Создаем новую версию с копией содержимого и следующим номером для того же промпта
+        cloned_version = PromptVersion.create_next_version(
             prompt=original_version.prompt,
-            version_number=new_version_number,
             description=clone_description,
             prompt_content=original_version.prompt_content,
             engineer_name=request.user.get_full_name() or request.user.username,
         )
-        cloned_version.save()
+        new_version_number = cloned_version.version_number
         
         # Уведомление о создании клона
         messages.success(
@@ -394,11 +432,8 @@ class PromptVersionCompareView(AdminOrEngineerRequiredMixin, TemplateView):
         version1 = get_object_or_404(PromptVersion, pk=id1)
         version2 = get_object_or_404(PromptVersion, pk=id2)
         
-        # Выполняем сравнение
-        comparison_result = compare_prompt_versions(
-            version1.prompt_content,
-            version2.prompt_content
-        )
+        # Выполняем сравнение (результат кэшируется по хэшам содержимого)
+        comparison_result = compare_prompt_versions_cached(version1, version2)
         
         # Получаем режим отображения из GET параметров (по умолчанию side-by-side)
         display_mode = self.request.GET.get('mode', 'side-by-side')
@@ -422,6 +457,12 @@ class PromptVersionDeleteView(AdminRequiredMixin, DeleteView):
     pk_url_kwarg = 'id'
     context_object_name = 'version'
     
+    def get_queryset(self):
+        """
+        Возвращает queryset без полного текста промпта: для подтверждения достаточно превью.
+        """
+        return get_prompt_version_list_queryset()
+    
     def get_object(self, queryset=None):
         """
         Возвращает объект версии промпта по ID из URL.
@@ -439,13 +480,13 @@ class PromptVersionDeleteView(AdminRequiredMixin, DeleteView):
         version = context['version']
         
         # Проверка использования версии
-        generated_content_count = version.get_generated_content_count()
+        generated_content_count = get_annotated_version_stats(version)['generated_count']
         context['generated_content_count'] = generated_content_count
         context['is_used'] = generated_content_count > 0
         
         # Если версия используется, получаем примеры использования
         if generated_content_count > 0:
-            context['generated_content_examples'] = GeneratedContent.objects.filter(
+            context['generated_content_examples'] = GeneratedContent.list_objects.filter(
                 prompt_version=version
             )[:5]  # Первые 5 примеров
         
@@ -512,6 +553,86 @@ class PromptVersionDeleteView(AdminRequiredMixin, DeleteView):
         return reverse('prompt_version_list')
 
 
+class ReviewQueueView(AdminOrEngineerRequiredMixin, TemplateView):
+    """
+    Представление очереди проверки сгенерированного контента.
+    GET только показывает записи, уже зарезервированные текущим пользователем;
+    пачка записей выдается кнопкой «Взять пачку» (POST), оценки тоже
+    отправляются POST-запросом.
+    """
+    template_name = 'content_generator/review_queue.html'
+    
+    def get_prompt_version(self):
+        """
+        Возвращает выбранную версию промпта из параметра prompt_version или None.
+        """
+        prompt_version_id = self.request.GET.get('prompt_version') or self.request.POST.get('prompt_version')
+        if not prompt_version_id or not str(prompt_version_id).isdigit():
+            return None
+        return get_object_or_404(PromptVersion, pk=prompt_version_id)
+    
+    def get_redirect_url(self, prompt_version):
+        """
+        Возвращает URL очереди с сохранением выбранной версии промпта.
+        """
+        url = reverse('review_queue')
+        if prompt_version:
+            url += f'?prompt_version={prompt_version.id}'
+        return url
+    
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет в контекст зарезервированные пользователем записи, размер очереди
+        и версии промптов для фильтра. Ничего не резервирует.
+        """
+        context = super().get_context_data(**kwargs)
+        prompt_version = self.get_prompt_version()
+        
+        context['selected_version'] = prompt_version
+        context['contents'] = list(
+            get_claimed_content(self.request.user, prompt_version).select_related('content_type', 'prompt_version')
+        )
+        context['queue_size'] = get_review_queue(prompt_version).count()
+        context['prompt_versions'] = PromptVersion.list_objects.select_related('prompt').order_by('-created_at')
+        context['ratings'] = range(MIN_RATING, MAX_RATING + 1)
+        return context
+    
+    def post(self, request, *args, **kwargs):
+        """
+        Выдает пачку записей, сохраняет оценку записи или возвращает резервы пользователя в очередь.
+        """
+        prompt_version = self.get_prompt_version()
+        
+        if request.POST.get('claim'):
+            contents = claim_review_batch(request.user, prompt_version)
+            if contents:
+                messages.info(request, f'Выдано на проверку записей: {len(contents)}.')
+            else:
+                messages.info(request, 'Непроверенного контента нет.')
+            return redirect(self.get_redirect_url(prompt_version))
+        
+        if request.POST.get('release'):
+            released = release_review_claims(request.user)
+            messages.info(request, f'Возвращено в очередь записей: {released}.')
+            return redirect(self.get_redirect_url(prompt_version))
+        
+        content_id = request.POST.get('content_id', '')
+        rating = request.POST.get('rating') or None
+        if not content_id.isdigit() or (rating is not None and not rating.isdigit()):
+            messages.error(request, 'Некорректные данные проверки.')
+            return redirect(self.get_redirect_url(prompt_version))
+        
+        try:
+            submit_review(int(content_id), request.user, int(rating) if rating is not None else None)
+            messages.success(request, f'Запись #{content_id} отмечена проверенной.')
+        except GeneratedContent.DoesNotExist:
+            messages.error(request, f'Запись #{content_id} не найдена.')
+        except ValueError as e:
+            messages.error(request, str(e))
+        
+        return redirect(self.get_redirect_url(prompt_version))
+
+
 # ========== ПОДСИСТЕМА GENERATION ==========
 
 class ContentGeneratorWidgetView(AdminOrEngineerRequiredMixin, TemplateView):